@@ -84,7 +84,10 @@ REST_FRAMEWORK['TEST_REQUEST_RENDERER_CLASSES'] = [
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
 }
 
 
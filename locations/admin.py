@@ -1,14 +1,28 @@
+import re
+
 from django.contrib.gis import admin
-from .models import Location
+from django.contrib.postgres.search import SearchQuery
+from .models import SEARCH_CONFIG, Location
 
 @admin.register(Location)
 class LocationAdmin(admin.GISModelAdmin):
     list_display = ('name', 'address', 'latitude', 'longitude', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name', 'description', 'address')
-    readonly_fields = ('created_at', 'updated_at', 'latitude', 'longitude')
+    readonly_fields = ('natural_key', 'created_at', 'updated_at', 'latitude', 'longitude')
     
     
     default_lon = 0
     default_lat = 0
-    default_zoom = 2
\ No newline at end of file
+    default_zoom = 2
+
+    def get_search_results(self, request, queryset, search_term):
+        # Match search_fields through the GIN-indexed search_vector rather
+        # than ILIKE; every word is a prefix, so partial words still match.
+        words = re.findall(r'\w+', search_term)
+        if not words:
+            return queryset, False
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words), config=SEARCH_CONFIG, search_type='raw'
+        )
+        return queryset.search(query), False
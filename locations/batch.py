@@ -0,0 +1,58 @@
+"""
+Spatial queries answered for many query points in one statement.
+"""
+from django.contrib.gis.measure import D
+from django.db import connection
+
+from .models import Location
+
+
+def nearest_batch(queries, columns):
+    """
+    The nearest locations to each query point, in one round-trip.
+
+    ``queries`` is a sequence of ``(lon, lat, k, radius)``; radius (metres)
+    may be None. Returns Location instances with only ``columns`` loaded,
+    ordered by query then distance, each with ``query_index`` (position in
+    ``queries``) and ``distance`` (a Distance) set.
+
+    The query points are unnested into rows and joined LATERAL to a KNN
+    subquery, so each point walks the geography GiST index in ``<->`` order
+    and stops after k rows. The radius is applied to those k rows: they
+    are the nearest, so this is the same as the k nearest within the
+    radius, without scanning on when fewer than k are in range.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Location._meta.db_table)
+    select = ', '.join(f'l.{qn(Location._meta.get_field(name).column)}' for name in columns)
+    # Must match the expression of the location_point_geog_gist index.
+    geography = 'l.point::geography(Point,4326)'
+    sql = f'''
+        WITH q AS (
+            SELECT idx, k, radius,
+                   ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS geog
+            FROM unnest(%s::int[], %s::float8[], %s::float8[], %s::int[], %s::float8[])
+                AS u(idx, lon, lat, k, radius)
+        )
+        SELECT n.*, q.idx AS query_index
+        FROM q
+        CROSS JOIN LATERAL (
+            SELECT {select}, ST_Distance({geography}, q.geog) AS distance_m
+            FROM {table} l
+            ORDER BY {geography} <-> q.geog
+            LIMIT q.k
+        ) n
+        WHERE q.radius IS NULL OR n.distance_m <= q.radius
+        ORDER BY q.idx, n.distance_m, n.id
+    '''
+    params = [
+        list(range(len(queries))),
+        [lon for lon, _, _, _ in queries],
+        [lat for _, lat, _, _ in queries],
+        [k for _, _, k, _ in queries],
+        [radius for _, _, _, radius in queries],
+    ]
+    locations = list(Location.objects.raw(sql, params))
+    for location in locations:
+        location.distance = D(m=location.distance_m)
+    return locations
@@ -0,0 +1,90 @@
+import os
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+_MISSING = object()
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    On-disk cache that evicts least-recently-used entries.
+
+    Reads refresh an entry's mtime, and culling removes the oldest entries
+    until the cache is back under MAX_ENTRIES and, when set, MAX_SIZE bytes
+    (both less 1/CULL_FREQUENCY of headroom). Django's FileBasedCache culls
+    a random sample by entry count only.
+
+    Checking the limits lists and stats every file, so it is only done once
+    a process has written a tenth of the headroom (in entries or bytes)
+    since its last check; each process can overshoot by that much.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._max_size = params.get('OPTIONS', {}).get('MAX_SIZE')
+        frequency = max(self._cull_frequency, 1) * 10
+        self._check_entries = max(self._max_entries // frequency, 1)
+        self._check_bytes = None if self._max_size is None else max(self._max_size // frequency, 1)
+        self._writes = 0
+        self._written = 0
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version)
+        self._writes += 1
+        if self._check_bytes is not None:
+            try:
+                self._written += os.path.getsize(self._key_to_file(key, version))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for fname in self._list_cache_files():
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+        return entries
+
+    def _cull(self):
+        # Called by FileBasedCache before every write.
+        if self._writes < self._check_entries and (
+            self._check_bytes is None or self._written < self._check_bytes
+        ):
+            return
+        self._writes = self._written = 0
+        entries = self._entries()
+        count = len(entries)
+        total = sum(size for _, size, _ in entries)
+        over_size = self._max_size is not None and total >= self._max_size
+        if count < self._max_entries and not over_size:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        target_count = self._max_entries - self._max_entries // self._cull_frequency
+        target_size = None
+        if self._max_size is not None:
+            target_size = self._max_size - self._max_size // self._cull_frequency
+
+        for _, size, fname in sorted(entries):
+            if count <= target_count and (target_size is None or total <= target_size):
+                break
+            self._delete(fname)
+            count -= 1
+            total -= size
@@ -0,0 +1,98 @@
+"""
+Column-wise access to location query results, for the binary renderers.
+
+Rows are fetched with values_list() and transposed once, so a page of
+features becomes a handful of parallel tuples instead of model instances
+or per-feature dicts. The streamed export reads the same rows one at a
+time through feature_dict().
+"""
+from .rendering import point_x, point_y
+
+# Property types, as understood by the renderers in renderers.py.
+PROPERTY_TYPES = {
+    'name': 'string',
+    'description': 'string',
+    'address': 'string',
+    'latitude': 'float',
+    'longitude': 'float',
+    'created_at': 'datetime',
+    'updated_at': 'datetime',
+    'distance': 'float',
+    'position': 'float',
+}
+
+# Properties that are copies of a coordinate column rather than selected.
+COORDINATE_PROPERTIES = {'latitude': 'y', 'longitude': 'x'}
+
+
+class FeatureColumns:
+    """
+    Point features held column-wise: parallel ``ids``, ``x`` and ``y``
+    sequences plus one ``(name, type, values)`` entry per property.
+    """
+
+    def __init__(self, ids, x, y, properties):
+        self.ids = ids
+        self.x = x
+        self.y = y
+        self.properties = properties
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def feature_rows(queryset, fields, keys=()):
+    """
+    Named values_list() rows with the columns feature_columns() needs for
+    ``fields``, plus any cursor ``keys`` a paginator reads.
+    """
+    names = ['id', 'feature_x', 'feature_y']
+    for name in (*fields, *keys):
+        if name not in COORDINATE_PROPERTIES and name not in names:
+            names.append(name)
+    return queryset.annotate(
+        feature_x=point_x(), feature_y=point_y()
+    ).values_list(*names, named=True)
+
+
+def feature_columns(rows, fields):
+    """Transpose feature_rows() output into FeatureColumns."""
+    rows = list(rows)
+    data = dict(zip(rows[0]._fields, zip(*rows))) if rows else {}
+    coordinates = {'x': data.get('feature_x', ()), 'y': data.get('feature_y', ())}
+
+    properties = []
+    for name in fields:
+        if name == 'id':
+            continue
+        if name in COORDINATE_PROPERTIES:
+            values = coordinates[COORDINATE_PROPERTIES[name]]
+        else:
+            values = data.get(name, ())
+        if name == 'distance':
+            values = tuple(distance.m for distance in values)
+        properties.append((name, PROPERTY_TYPES[name], values))
+
+    return FeatureColumns(data.get('id', ()), coordinates['x'], coordinates['y'], properties)
+
+
+def feature_dict(row, fields):
+    """
+    One feature_rows() row as the GeoJSON Feature LocationSerializer
+    renders, ready for streaming.dumps().
+    """
+    coordinates = {'x': row.feature_x, 'y': row.feature_y}
+    properties = {}
+    for name in fields:
+        if name == 'id':
+            continue
+        if name in COORDINATE_PROPERTIES:
+            properties[name] = coordinates[COORDINATE_PROPERTIES[name]]
+        else:
+            properties[name] = getattr(row, name)
+    return {
+        'id': row.id,
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [row.feature_x, row.feature_y]},
+        'properties': properties,
+    }
@@ -0,0 +1,117 @@
+from django.conf import settings
+
+# Defaults for the ``LOCATIONS`` settings dict; override any key in
+# ``geoproject/settings.py``.
+DEFAULTS = {
+    # Upper bound for ``?k=`` on the nearby endpoint.
+    'NEARBY_MAX_K': 1000,
+    # Most vertices accepted by within_polygon, and the most per piece
+    # after ST_Subdivide (at least 5).
+    'WITHIN_POLYGON_MAX_VERTICES': 10000,
+    'WITHIN_POLYGON_SUBDIVIDE_VERTICES': 256,
+    # along_route: most route vertices and widest corridor (metres)
+    # accepted; routes are segmentized to ALONG_ROUTE_SEGMENT_LENGTH metres
+    # and cut into pieces of ALONG_ROUTE_SUBDIVIDE_VERTICES vertices (at
+    # least 5) before matching.
+    'ALONG_ROUTE_MAX_VERTICES': 10000,
+    'ALONG_ROUTE_MAX_DISTANCE': 10000,
+    'ALONG_ROUTE_SEGMENT_LENGTH': 1000,
+    'ALONG_ROUTE_SUBDIVIDE_VERTICES': 8,
+    # nearby_batch limits: points per request, the k used when a point
+    # gives none, and the total of k over a request's points.
+    'NEARBY_BATCH_MAX_POINTS': 1000,
+    'NEARBY_BATCH_DEFAULT_K': 10,
+    'NEARBY_BATCH_MAX_RESULTS': 50000,
+    # distance_matrix: largest matrix accepted (origins x destinations), and
+    # largest computed by PostGIS in one response; bigger matrices are
+    # streamed, computed with NumPy when it is installed.
+    'DISTANCE_MATRIX_MAX_CELLS': 1000000,
+    'DISTANCE_MATRIX_SQL_CELLS': 10000,
+    # Largest box within_bounds accepts, in square degrees.
+    'BOUNDS_MAX_AREA': 2500,
+    # Cursor page size for the nearby and within_bounds actions.
+    'SPATIAL_PAGE_SIZE': 100,
+    'SPATIAL_MAX_PAGE_SIZE': 1000,
+    # Largest ``?page_size=`` for the list endpoint (default: PAGE_SIZE).
+    'LIST_MAX_PAGE_SIZE': 100,
+    # List ``count``: 'exact', 'estimate' (pg_class.reltuples) or 'none'.
+    'LIST_COUNT': 'estimate',
+    # Below this many estimated rows, 'estimate' falls back to COUNT(*).
+    'LIST_EXACT_COUNT_THRESHOLD': 100000,
+    # Deepest zoom served by the vector tile endpoint.
+    'TILE_MAX_ZOOM': 22,
+    # Tile attributes by minimum zoom; the highest threshold <= z applies.
+    'TILE_FIELDS': {
+        0: ('id',),
+        12: ('id', 'name'),
+        15: ('id', 'name', 'address', 'created_at'),
+    },
+    # Render list/nearby/within_bounds/export JSON in PostgreSQL by default
+    # (clients can always choose with ?render=db or ?render=python).
+    'DB_RENDERING': False,
+    # Rows fetched per keyset query by the export action.
+    'EXPORT_CHUNK_SIZE': 2000,
+    # Cache alias for rendered tiles, and for the per-zoom hit/miss counters
+    # (best a backend with atomic incr(), such as Redis or Memcached). The
+    # counters are only as shared as that cache: with the default LocMem
+    # backend each worker process counts, and reports, its own lookups.
+    'TILE_CACHE': 'tiles',
+    'TILE_STATS_CACHE': 'default',
+    # Invalidating more points than this at once clears the tile cache.
+    'TILE_CACHE_CLEAR_THRESHOLD': 1000,
+    # Cache alias for nearby candidate ids (None disables the cache). Query
+    # points are snapped to a NEARBY_CACHE_GRID-degree grid and distances
+    # rounded up to one of NEARBY_CACHE_DISTANCES (metres); larger
+    # distances, and cells with more than NEARBY_CACHE_MAX_IDS candidates,
+    # are not cached.
+    'NEARBY_CACHE': None,
+    'NEARBY_CACHE_GRID': 0.01,
+    'NEARBY_CACHE_DISTANCES': (250, 500, 1000, 2000, 5000, 10000),
+    'NEARBY_CACHE_MAX_IDS': 5000,
+    # Seconds a cell's candidates are kept (writes evict them sooner).
+    'NEARBY_CACHE_TIMEOUT': 300,
+    # Default and largest ``?limit=`` of the suggest action, and the
+    # shortest ``?q=`` it looks up (shorter text has too few trigrams).
+    'SUGGEST_LIMIT': 10,
+    'SUGGEST_MAX_LIMIT': 50,
+    'SUGGEST_MIN_LENGTH': 2,
+    # With a lat/lon, suggest re-ranks the SUGGEST_CANDIDATES best name
+    # matches by name distance + SUGGEST_DISTANCE_WEIGHT * d / (d +
+    # SUGGEST_DISTANCE_SCALE), d being metres from the point.
+    'SUGGEST_CANDIDATES': 200,
+    'SUGGEST_DISTANCE_WEIGHT': 0.5,
+    'SUGGEST_DISTANCE_SCALE': 5000,
+    # Path of the in-process nearby index file (see memory_index.py), best
+    # on a RAM-backed filesystem such as /dev/shm; None disables the index.
+    # Needs NumPy. Workers check for changes every MEMORY_INDEX_REFRESH
+    # seconds; lookups with more than MEMORY_INDEX_MAX_IDS candidates go to
+    # the database instead.
+    'MEMORY_INDEX': None,
+    'MEMORY_INDEX_GRID': 0.05,
+    'MEMORY_INDEX_REFRESH': 5,
+    'MEMORY_INDEX_MAX_IDS': 5000,
+    # Seconds LocationChange rows are kept. An index older than this is
+    # rebuilt from scratch.
+    'MEMORY_INDEX_CHANGE_LOG_RETENTION': 86400,
+    # Most cells returned by one cells request; larger answers are cut off
+    # and flagged as truncated.
+    'CELLS_MAX_RESULTS': 10000,
+    # Rows per bulk_create() batch for the bulk endpoint.
+    'BULK_BATCH_SIZE': 1000,
+    # Largest ``ids`` list accepted by bulk_update and bulk_delete.
+    'BULK_MAX_IDS': 10000,
+    # Per-row errors listed in a bulk response (all are counted).
+    'BULK_MAX_ERRORS': 100,
+    # Natural key used by bulk ingest to upsert: 'name_point' (name plus the
+    # point rounded to NATURAL_KEY_PRECISION decimals), 'external_id' (the
+    # Feature id, or an external_id property/column) or None (always insert).
+    'NATURAL_KEY': 'name_point',
+    'NATURAL_KEY_PRECISION': 5,
+    # Bulk writes changing more locations than this send locations_changed
+    # with points=None rather than every point.
+    'CHANGED_POINTS_LIMIT': 10000,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'LOCATIONS', {}).get(name, DEFAULTS[name])
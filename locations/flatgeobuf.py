@@ -0,0 +1,303 @@
+"""
+FlatGeobuf writer for point features.
+
+FlatGeobuf (https://flatgeobuf.org) is a FlatBuffers header, an optional
+packed Hilbert R-tree and a sequence of size-prefixed FlatBuffers features.
+The schema used here is small and fixed, so the FlatBuffers tables are
+encoded directly rather than through the flatbuffers package.
+"""
+import math
+import struct
+
+MAGIC = b'fgb\x03fgb\x00'
+INDEX_NODE_SIZE = 16
+
+GEOMETRY_POINT = 1
+
+COLUMN_TYPES = {
+    'int': 7,        # Long
+    'float': 10,     # Double
+    'string': 11,    # String
+    'datetime': 13,  # DateTime (ISO 8601 text)
+}
+
+PROPERTY_FORMATS = {'int': '<Hq', 'float': '<Hd'}
+
+NODE = struct.Struct('<ddddQ')
+HILBERT_MAX = (1 << 16) - 1
+
+
+# FlatBuffers encoding.
+#
+# Objects are written front to back: a table's vtable, then the table, then
+# the strings, vectors and subtables it refers to, so every uoffset points
+# forward as the format requires.
+
+class _Vector:
+
+    def __init__(self, fmt, values):
+        self.fmt = fmt
+        self.values = values
+
+
+class _Table:
+
+    def __init__(self, *fields):
+        # (slot, struct format or None for a reference, value)
+        self.fields = [field for field in fields if field[2] is not None]
+
+
+def _pad(buf, alignment, extra=0):
+    buf.extend(b'\0' * (-(len(buf) + extra) % alignment))
+
+
+def _encode(buf, obj):
+    """Append ``obj`` to ``buf`` and return its position."""
+    if isinstance(obj, str):
+        data = obj.encode('utf-8')
+        _pad(buf, 4)
+        position = len(buf)
+        buf += struct.pack('<I', len(data)) + data + b'\0'
+        return position
+
+    if isinstance(obj, bytes):
+        _pad(buf, 4)
+        position = len(buf)
+        buf += struct.pack('<I', len(obj)) + obj
+        return position
+
+    if isinstance(obj, _Vector):
+        size = struct.calcsize('<' + obj.fmt)
+        _pad(buf, max(size, 4), extra=4)
+        position = len(buf)
+        buf += struct.pack(f'<I{len(obj.values)}{obj.fmt}', len(obj.values), *obj.values)
+        return position
+
+    if isinstance(obj, list):
+        _pad(buf, 4)
+        position = len(buf)
+        buf += struct.pack('<I', len(obj)) + b'\0' * (4 * len(obj))
+        for index, item in enumerate(obj):
+            slot = position + 4 + 4 * index
+            struct.pack_into('<I', buf, slot, _encode(buf, item) - slot)
+        return position
+
+    return _encode_table(buf, obj)
+
+
+def _encode_table(buf, table):
+    fields = sorted(
+        table.fields,
+        key=lambda field: struct.calcsize('<' + field[1]) if field[1] else 4,
+        reverse=True,
+    )
+
+    # Field offsets within the table, after the 4-byte vtable offset.
+    layout = []
+    offset = 4
+    alignment = 4
+    for slot, fmt, value in fields:
+        size = struct.calcsize('<' + fmt) if fmt else 4
+        offset += -offset % size
+        layout.append((slot, fmt, value, offset))
+        offset += size
+        alignment = max(alignment, size)
+    table_size = offset
+
+    slots = max((field[0] for field in fields), default=-1) + 1
+    vtable = [0] * slots
+    for slot, _, _, field_offset in layout:
+        vtable[slot] = field_offset
+
+    _pad(buf, 2)
+    vtable_position = len(buf)
+    buf += struct.pack(f'<HH{slots}H', 4 + 2 * slots, table_size, *vtable)
+
+    _pad(buf, alignment)
+    position = len(buf)
+    buf += struct.pack('<i', position - vtable_position)
+    buf += b'\0' * (table_size - 4)
+    for slot, fmt, value, field_offset in layout:
+        if fmt:
+            struct.pack_into('<' + fmt, buf, position + field_offset, value)
+
+    for slot, fmt, value, field_offset in layout:
+        if not fmt:
+            target = _encode(buf, value)
+            struct.pack_into('<I', buf, position + field_offset, target - position - field_offset)
+    return position
+
+
+def _size_prefixed(table):
+    """A size-prefixed FlatBuffer with ``table`` as its root."""
+    buf = bytearray(8)
+    root = _encode(buf, table)
+    struct.pack_into('<II', buf, 0, len(buf) - 4, root - 4)
+    return bytes(buf)
+
+
+# Packed Hilbert R-tree.
+
+def hilbert(x, y):
+    """Hilbert curve index of the 16-bit grid cell (x, y)."""
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    def spread(value):
+        value = (value | (value << 8)) & 0x00FF00FF
+        value = (value | (value << 4)) & 0x0F0F0F0F
+        value = (value | (value << 2)) & 0x33333333
+        return (value | (value << 1)) & 0x55555555
+
+    return (spread(i1) << 1) | spread(i0)
+
+
+def hilbert_order(x, y, envelope):
+    """Feature indexes sorted along the Hilbert curve over ``envelope``."""
+    min_x, min_y, max_x, max_y = envelope
+    width = max_x - min_x
+    height = max_y - min_y
+
+    def key(index):
+        cell_x = math.floor(HILBERT_MAX * (x[index] - min_x) / width) if width else 0
+        cell_y = math.floor(HILBERT_MAX * (y[index] - min_y) / height) if height else 0
+        return hilbert(cell_x, cell_y)
+
+    return sorted(range(len(x)), key=key)
+
+
+def level_bounds(count, node_size):
+    """
+    (start, end) node indexes of each tree level, leaves first. As in the
+    reference generateLevelBounds, there is always a root above the
+    leaves, even for a single feature.
+    """
+    sizes = [count]
+    while True:
+        sizes.append(math.ceil(sizes[-1] / node_size))
+        if sizes[-1] == 1:
+            break
+    end = sum(sizes)
+    bounds = []
+    for size in sizes:
+        bounds.append((end - size, end))
+        end -= size
+    return bounds
+
+
+def packed_rtree(x, y, offsets, node_size=INDEX_NODE_SIZE):
+    """
+    Serialized packed R-tree over points already in Hilbert order; leaf
+    nodes carry each feature's byte offset in the feature section.
+    """
+    bounds = level_bounds(len(x), node_size)
+    nodes = [None] * bounds[0][1]
+    start = bounds[0][0]
+    for index, offset in enumerate(offsets):
+        nodes[start + index] = (x[index], y[index], x[index], y[index], offset)
+
+    for (position, end), (parent, _) in zip(bounds, bounds[1:]):
+        while position < end:
+            children = nodes[position:min(position + node_size, end)]
+            nodes[parent] = (
+                min(node[0] for node in children),
+                min(node[1] for node in children),
+                max(node[2] for node in children),
+                max(node[3] for node in children),
+                position,
+            )
+            position += node_size
+            parent += 1
+
+    return b''.join(NODE.pack(*node) for node in nodes)
+
+
+# Features.
+
+def encode_properties(row, columns):
+    parts = []
+    for index, (kind, value) in enumerate(zip(columns, row)):
+        if value is None:
+            continue
+        if kind in PROPERTY_FORMATS:
+            parts.append(struct.pack(PROPERTY_FORMATS[kind], index, value))
+        else:
+            if kind == 'datetime':
+                value = value.isoformat()
+            data = value.encode('utf-8')
+            parts.append(struct.pack('<HI', index, len(data)) + data)
+    return b''.join(parts)
+
+
+def write_points(ids, x, y, properties, name='locations'):
+    """
+    FlatGeobuf file for points with ``ids`` and coordinates ``x``/``y`` in
+    EPSG:4326. ``properties`` holds ``(name, type, values)`` columns; the
+    ids are written as a leading ``id`` column.
+    """
+    columns = [('id', 'int', ids), *properties]
+    count = len(ids)
+    envelope = (min(x), min(y), max(x), max(y)) if count else None
+
+    header = _size_prefixed(_Table(
+        (0, None, name),
+        (1, None, _Vector('d', envelope) if envelope else None),
+        (2, 'B', GEOMETRY_POINT),
+        (7, None, [
+            _Table((0, None, column_name), (1, 'B', COLUMN_TYPES[kind]))
+            for column_name, kind, _ in columns
+        ]),
+        (8, 'Q', count),
+        (9, 'H', INDEX_NODE_SIZE if count else 0),
+        (10, None, _Table((0, None, 'EPSG'), (1, 'i', 4326))),
+    ))
+    if not count:
+        return MAGIC + header
+
+    order = hilbert_order(x, y, envelope)
+    kinds = [kind for _, kind, _ in columns]
+    values = [column_values for _, _, column_values in columns]
+
+    features = []
+    offsets = []
+    offset = 0
+    for index in order:
+        feature = _size_prefixed(_Table(
+            (0, None, _Table((1, None, _Vector('d', (x[index], y[index]))))),
+            (1, None, encode_properties([column[index] for column in values], kinds)),
+        ))
+        features.append(feature)
+        offsets.append(offset)
+        offset += len(feature)
+
+    index = packed_rtree([x[i] for i in order], [y[i] for i in order], offsets)
+    return MAGIC + header + index + b''.join(features)
@@ -0,0 +1,371 @@
+"""
+Bulk writes to locations.
+
+Every bulk ingest path (the bulk API action, import_locations and
+load_sample_locations) COPYs plain rows into a temporary staging table and
+merges them into the location table with one INSERT ... ON CONFLICT per
+batch, keyed on Location.natural_key. Re-running an ingest is therefore
+idempotent, and each batch reports how many rows it inserted, updated or
+left unchanged.
+
+Bulk updates and deletes are single UPDATE/DELETE statements. None of
+these paths fire model signals, so each sends locations_changed itself.
+"""
+import csv
+import io
+import itertools
+import time
+from collections import Counter, namedtuple
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models import Case, CharField, F, Func, Value, When
+from django.utils import timezone
+
+from .conf import get_setting
+from .models import Location, natural_key
+from .serializers import LocationSerializer
+from .signals import locations_changed
+
+MergeCounts = namedtuple('MergeCounts', ['inserted', 'updated', 'unchanged', 'duplicates'])
+
+
+class IngestResult:
+    """Row counts, errors (up to ``max_errors``) and timing of an ingest run."""
+
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.errors = []
+        self.error_count = 0
+        self.points = []
+        self.started = time.monotonic()
+        self.seconds = None
+
+    def add_error(self, index, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'index': index, 'errors': errors})
+
+    def add_counts(self, counts):
+        self.inserted += counts.inserted
+        self.updated += counts.updated
+        self.unchanged += counts.unchanged
+        self.duplicates += counts.duplicates
+
+    def add_points(self, points):
+        # Past CHANGED_POINTS_LIMIT listeners are told everything changed.
+        if self.points is None:
+            return
+        self.points.extend(points)
+        if len(self.points) > get_setting('CHANGED_POINTS_LIMIT'):
+            self.points = None
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated
+
+    def finish(self):
+        self.seconds = time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        rows = self.changed + self.unchanged
+        return rows / self.seconds if self.seconds else None
+
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second or 0, 1),
+        }
+
+
+def ingest_features(features, serializer_class=LocationSerializer,
+                    serializer_context=None, batch_size=None):
+    """
+    Validate GeoJSON ``features`` (any iterable) and upsert the valid ones
+    in batches of ``batch_size``, all in one transaction.
+
+    Invalid rows are reported by index and skipped. A batch the database
+    rejects is rolled back to its savepoint and its rows reported as
+    errors; the other batches are kept.
+    """
+    batch_size = batch_size or get_setting('BULK_BATCH_SIZE')
+    result = IngestResult(get_setting('BULK_MAX_ERRORS'))
+    batch = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        create_staging_table(cursor)
+        for index, feature in enumerate(features):
+            if isinstance(feature, Exception):
+                result.add_error(index, {'non_field_errors': [str(feature)]})
+                continue
+            if not isinstance(feature, dict):
+                result.add_error(index, {'non_field_errors': ['Expected a GeoJSON Feature']})
+                continue
+
+            serializer = serializer_class(data=feature, context=serializer_context)
+            if not serializer.is_valid():
+                result.add_error(index, serializer.errors)
+                continue
+
+            try:
+                row = feature_row(feature, serializer.validated_data)
+            except ValueError as exc:
+                result.add_error(index, {'non_field_errors': [str(exc)]})
+                continue
+            batch.append((index, row))
+            if len(batch) >= batch_size:
+                upsert_batch(cursor, batch, result)
+                batch = []
+
+        if batch:
+            upsert_batch(cursor, batch, result)
+
+    result.finish()
+    if result.changed:
+        locations_changed.send(sender=Location, points=result.points)
+    return result
+
+
+def feature_row(feature, data):
+    """
+    STAGING_COLUMNS tuple for a validated feature, or ValueError if its
+    natural key does not fit the column (which would fail its whole batch).
+    """
+    point = data['point']
+    external_id = feature.get('id', (feature.get('properties') or {}).get('external_id'))
+    key = natural_key(data['name'], point.x, point.y, external_id)
+    if key is not None and len(key) > Location._meta.get_field('natural_key').max_length:
+        raise ValueError('natural key is too long')
+    return (
+        key,
+        data['name'],
+        data.get('description', ''),
+        data.get('address', ''),
+        point.x,
+        point.y,
+    )
+
+
+def upsert_batch(cursor, batch, result):
+    rows = [row for _, row in batch]
+    try:
+        with transaction.atomic():
+            copy_rows(cursor, rows)
+            previous = staged_previous_points(cursor) if result.points is not None else []
+            counts = merge_staging(cursor)
+    except DatabaseError as exc:
+        for index, _ in batch:
+            result.add_error(index, {'non_field_errors': [str(exc)]})
+        return
+    result.add_counts(counts)
+    result.add_points(
+        GEOSGeometry(f'SRID=4326;POINT({row[4]} {row[5]})') for row in rows
+    )
+    result.add_points(previous)
+
+
+# COPY staging.
+
+STAGING_TABLE = 'location_import'
+STAGING_COLUMNS = ('natural_key', 'name', 'description', 'address', 'lon', 'lat')
+
+
+def create_staging_table(cursor):
+    """Create (or empty) the session's staging table."""
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ('
+        f'seq bigint GENERATED ALWAYS AS IDENTITY, natural_key text, name text, '
+        f'description text, address text, lon float8, lat float8)'
+    )
+    cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+
+
+def copy_rows(cursor, rows):
+    """COPY ``rows`` (tuples in STAGING_COLUMNS order) into the staging table."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    sql = f'COPY {STAGING_TABLE} ({", ".join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)'
+    if hasattr(cursor, 'copy_expert'):
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def staged_previous_points(cursor):
+    """Current points of the locations the staged rows will update."""
+    table = connection.ops.quote_name(Location._meta.db_table)
+    cursor.execute(
+        f'SELECT ST_AsEWKT(l.point) FROM {table} l '
+        f'JOIN {STAGING_TABLE} s ON s.natural_key = l.natural_key'
+    )
+    return [GEOSGeometry(ewkt) for ewkt, in cursor.fetchall()]
+
+
+def merge_staging(cursor):
+    """
+    Upsert the staged rows into the location table on natural_key, then
+    empty the stage. Rows whose columns all match the stored row are left
+    alone (updated_at included); rows without a key are always inserted.
+    When a batch repeats a key, its last row wins and the earlier ones are
+    counted as duplicates.
+    """
+    table = connection.ops.quote_name(Location._meta.db_table)
+    cursor.execute(f'''
+        WITH staged AS (
+            SELECT DISTINCT ON (natural_key, CASE WHEN natural_key IS NULL THEN seq END)
+                   natural_key, name,
+                   coalesce(description, '') AS description,
+                   coalesce(address, '') AS address,
+                   ST_SetSRID(ST_MakePoint(lon, lat), 4326) AS point
+            FROM {STAGING_TABLE}
+            ORDER BY natural_key, CASE WHEN natural_key IS NULL THEN seq END, seq DESC
+        ), merged AS (
+            INSERT INTO {table} AS l
+                (natural_key, name, description, address, point, created_at, updated_at)
+            SELECT natural_key, name, description, address, point, now(), now()
+            FROM staged
+            ON CONFLICT (natural_key) DO UPDATE SET
+                name = EXCLUDED.name,
+                description = EXCLUDED.description,
+                address = EXCLUDED.address,
+                point = EXCLUDED.point,
+                updated_at = EXCLUDED.updated_at
+            WHERE (l.name, l.description, l.address, ST_AsEWKB(l.point))
+                IS DISTINCT FROM
+                (EXCLUDED.name, EXCLUDED.description, EXCLUDED.address, ST_AsEWKB(EXCLUDED.point))
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted),
+               count(*) FILTER (WHERE NOT inserted),
+               (SELECT count(*) FROM staged),
+               (SELECT count(*) FROM {STAGING_TABLE})
+        FROM merged
+    ''')
+    inserted, updated, distinct, staged = cursor.fetchone()
+    cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+    return MergeCounts(inserted, updated, distinct - inserted - updated, staged - distinct)
+
+
+# Set-based updates and deletes.
+
+def changed_points(points):
+    """``points`` as a list, or None past CHANGED_POINTS_LIMIT."""
+    limit = get_setting('CHANGED_POINTS_LIMIT')
+    points = list(itertools.islice(points, limit + 1))
+    return None if len(points) > limit else points
+
+
+class NaturalKeyConflict(Exception):
+    """A bulk update would give locations ``ids`` the same natural key."""
+
+    def __init__(self, ids):
+        super().__init__(f'Duplicate natural keys for ids {ids}')
+        self.ids = ids
+
+
+def natural_key_expression(values):
+    """
+    SQL for the 'name_point' natural key after ``values`` are applied, or
+    None when the key does not change (or is not derived). A new point is
+    the same for every row, so its rounded suffix is computed here; a new
+    name alone keeps each row's stored suffix. Rows without a key keep
+    none, as they do when saved one at a time (see Location.save()).
+    """
+    if get_setting('NATURAL_KEY') != 'name_point' or not ('name' in values or 'point' in values):
+        return None
+    name = Value(values['name']) if 'name' in values else F('name')
+    if 'point' in values:
+        point = values['point']
+        suffix = Value(natural_key('', point.x, point.y))
+    else:
+        suffix = Func(F('natural_key'), Value('@[^@]*$'), function='substring')
+    # || rather than Concat(), which would turn a NULL key into a name.
+    key = Func(name, suffix, template='%(expressions)s', arg_joiner=' || ', output_field=CharField())
+    return Case(When(natural_key__isnull=True, then=Value(None)), default=key, output_field=CharField())
+
+
+def conflicting_ids(queryset, key):
+    """Ids in ``queryset`` whose new ``key`` collides with another row's."""
+    new_keys = dict(queryset.annotate(new_key=key).values_list('pk', 'new_key'))
+    counts = Counter(value for value in new_keys.values() if value is not None)
+    taken = set(
+        Location.objects.exclude(pk__in=list(new_keys)).filter(
+            natural_key__in=list(counts)
+        ).values_list('natural_key', flat=True)
+    )
+    return sorted(
+        pk for pk, value in new_keys.items()
+        if value is not None and (counts[value] > 1 or value in taken)
+    )
+
+
+def bulk_update_locations(queryset, values):
+    """
+    Apply ``values`` (field name to value) to every location in
+    ``queryset`` with one UPDATE, setting updated_at as auto_now would and
+    recomputing derived natural keys in the same statement. Returns the
+    number of rows updated; raises NaturalKeyConflict if two locations
+    would end up with the same key.
+    """
+    queryset = queryset.order_by()
+    key = natural_key_expression(values)
+    extra = {'updated_at': timezone.now()}
+    if key is not None:
+        extra['natural_key'] = key
+    try:
+        with transaction.atomic(using=queryset.db):
+            points = changed_points(queryset.values_list('point', flat=True).iterator())
+            updated = queryset.update(**values, **extra)
+    except IntegrityError:
+        ids = conflicting_ids(queryset, key) if key is not None else []
+        if not ids:
+            raise
+        raise NaturalKeyConflict(ids)
+
+    if updated:
+        if points is not None and 'point' in values:
+            points.append(values['point'])
+        locations_changed.send(sender=Location, points=points)
+    return updated
+
+
+def bulk_delete_locations(queryset):
+    """
+    Delete every location in ``queryset`` with one DELETE statement and
+    return the number of rows deleted.
+    """
+    table = connection.ops.quote_name(Location._meta.db_table)
+    subquery, params = queryset.order_by().values('pk').query.sql_with_params()
+    limit = get_setting('CHANGED_POINTS_LIMIT')
+    deleted = 0
+    points = []
+
+    with transaction.atomic(using=queryset.db), connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ({subquery}) RETURNING ST_AsEWKT(point)',
+            params,
+        )
+        while rows := cursor.fetchmany(1000):
+            deleted += len(rows)
+            if points is not None:
+                points.extend(GEOSGeometry(ewkt) for ewkt, in rows)
+                if len(points) > limit:
+                    points = None
+
+    if deleted:
+        locations_changed.send(sender=Location, points=points)
+    return deleted
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from locations.models import Location
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the geohash columns of locations saved before they existed. Rows are '
+        'updated in batches of consecutive ids, each in its own transaction, so the '
+        'command can be stopped and re-run at any point.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Ids examined per UPDATE and transaction (default: 10000)')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to pause between batches, to spare the database (default: 0)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        table = connection.ops.quote_name(Location._meta.db_table)
+        started = time.monotonic()
+        last_id = 0
+        updated = 0
+
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f'SELECT max(id) FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) batch',
+                    [last_id, batch_size],
+                )
+                upto, = cursor.fetchone()
+                if upto is None:
+                    break
+                # Only point drives the trigger, so the columns are set here.
+                cursor.execute(
+                    f'UPDATE {table} SET geohash_8 = ST_GeoHash(point, 8), '
+                    f'geohash_6 = ST_GeoHash(point, 6), geohash_4 = ST_GeoHash(point, 4) '
+                    f'WHERE id > %s AND id <= %s AND geohash_8 IS NULL',
+                    [last_id, upto],
+                )
+                updated += cursor.rowcount
+                last_id = upto
+                self.stdout.write(f'Up to id {last_id}: {updated} locations updated')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {updated} locations in {time.monotonic() - started:.1f}s'
+        ))
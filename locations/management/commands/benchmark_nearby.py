@@ -0,0 +1,76 @@
+import random
+import time
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from locations.models import Location
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare query plans for the legacy metre-based nearby filter and the '
+        'geography ST_DWithin path. Synthetic rows are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Synthetic locations to insert before planning (default: 100000)')
+        parser.add_argument('--lat', type=float, default=40.7128)
+        parser.add_argument('--lon', type=float, default=-74.0060)
+        parser.add_argument('--distance', type=float, default=5000,
+                            help='Search radius in metres (default: 5000)')
+        parser.add_argument('--spread', type=float, default=2.0,
+                            help='Half-width in degrees of the synthetic point cloud (default: 2.0)')
+
+    def handle(self, *args, **options):
+        point = Point(options['lon'], options['lat'], srid=4326)
+        distance = options['distance']
+
+        with transaction.atomic():
+            self.seed(options['rows'], point, options['spread'])
+
+            legacy = Location.objects.filter(point__distance_lte=(point, D(m=distance)))
+            geography = Location.objects.within_distance(point, distance)
+
+            self.report('Legacy filter (point__distance_lte)', legacy)
+            self.report('Geography path (ST_DWithin on point::geography)', geography)
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows, point, spread):
+        if rows <= 0:
+            return
+        self.stdout.write(f'Inserting {rows} synthetic locations...')
+        Location.objects.bulk_create(
+            (
+                Location(
+                    name=f'benchmark-{i}',
+                    point=Point(
+                        point.x + random.uniform(-spread, spread),
+                        point.y + random.uniform(-spread, spread),
+                        srid=4326,
+                    ),
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Location._meta.db_table}')
+
+    def report(self, label, queryset):
+        start = time.perf_counter()
+        count = queryset.count()
+        elapsed = (time.perf_counter() - start) * 1000
+        plan = queryset.explain(analyze=True, buffers=True)
+
+        uses_index = 'Index Scan' in plan or 'Index Only Scan' in plan
+        style = self.style.SUCCESS if uses_index else self.style.WARNING
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(f'{count} rows in {elapsed:.1f} ms')
+        self.stdout.write(style('index scan' if uses_index else 'sequential scan'))
+        self.stdout.write(plan)
@@ -0,0 +1,353 @@
+import codecs
+import csv
+import itertools
+import json
+import math
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from locations.ingest import copy_rows, create_staging_table, merge_staging, natural_key
+from locations.models import ImportCheckpoint, Location
+from locations.signals import locations_changed
+
+FORMATS = {
+    '.geojson': 'geojson',
+    '.json': 'geojson',
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.geojsons': 'ndjson',
+}
+
+LAT_COLUMNS = ('lat', 'latitude', 'y')
+LON_COLUMNS = ('lon', 'lng', 'longitude', 'x')
+
+READ_SIZE = 1 << 20
+# A single GeoJSON value larger than this is treated as malformed input.
+MAX_VALUE_SIZE = 64 << 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Import locations from a GeoJSON FeatureCollection, NDJSON (one Feature '
+        'per line) or CSV file with lat/lon columns. Rows are COPYed into a '
+        'staging table and upserted on their natural key in batches; an '
+        'interrupted import resumes after the last committed batch when run again, '
+        'seeking straight to it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(set(FORMATS.values())),
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Records per COPY and transaction (default: 50000)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore any checkpoint and import from the first record')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.isfile(path):
+            raise CommandError(f'No such file: {path}')
+        file_format = options['format'] or FORMATS.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        checkpoint = self.get_checkpoint(path, options['restart'])
+        skip = checkpoint.records
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}')
+
+        started = time.monotonic()
+        records = skip
+        inserted = updated = unchanged = duplicates = 0
+        errors = 0
+
+        with open(path, 'rb') as file:
+            rows = read_records(file, file_format, checkpoint.offset)
+            if skip and not checkpoint.offset:
+                # A checkpoint written before offsets were recorded.
+                rows = itertools.islice(rows, skip, None)
+            with connection.cursor() as cursor:
+                create_staging_table(cursor)
+                while True:
+                    batch = list(itertools.islice(rows, batch_size))
+                    if not batch:
+                        break
+                    valid = []
+                    for number, (row, _) in enumerate(batch, records + 1):
+                        try:
+                            valid.append(location_row(row))
+                        except ValueError as exc:
+                            errors += 1
+                            self.stderr.write(f'Record {number}: {exc}')
+
+                    with transaction.atomic():
+                        if valid:
+                            try:
+                                with transaction.atomic():
+                                    copy_rows(cursor, valid)
+                                    counts = merge_staging(cursor)
+                            except DatabaseError as exc:
+                                # Rolled back to the savepoint and reported, so
+                                # the checkpoint still moves past the batch.
+                                errors += len(valid)
+                                self.stderr.write(f'Records {records + 1}-{records + len(batch)}: {exc}')
+                            else:
+                                inserted += counts.inserted
+                                updated += counts.updated
+                                unchanged += counts.unchanged
+                                duplicates += counts.duplicates
+                        records += len(batch)
+                        checkpoint.records = records
+                        checkpoint.offset = batch[-1][1]
+                        checkpoint.save(update_fields=['records', 'offset', 'updated_at'])
+
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'{records} records read: {inserted} inserted, {updated} updated, '
+                        f'{unchanged} unchanged, {duplicates} duplicates, {errors} skipped '
+                        f'({(records - skip) / elapsed if elapsed else 0:,.0f} rows/s)'
+                    )
+
+        if inserted or updated:
+            locations_changed.send(sender=Location, points=None)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {records - skip} records in {elapsed:.1f}s '
+            f'({(records - skip) / elapsed if elapsed else 0:,.0f} rows/s): '
+            f'{inserted} inserted, {updated} updated, {unchanged} unchanged, '
+            f'{duplicates} duplicates, {errors} skipped'
+        ))
+
+    def get_checkpoint(self, path, restart):
+        stat = os.stat(path)
+        fingerprint = f'{stat.st_size}:{stat.st_mtime_ns}'
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            source=path, defaults={'fingerprint': fingerprint}
+        )
+        if restart or created:
+            checkpoint.fingerprint = fingerprint
+            checkpoint.records = 0
+            checkpoint.offset = 0
+            checkpoint.save()
+        elif checkpoint.fingerprint != fingerprint:
+            raise CommandError(
+                f'{path} has changed since it was last imported '
+                f'({checkpoint.records} records); pass --restart to import it again'
+            )
+        return checkpoint
+
+
+def read_records(file, file_format, offset=0):
+    """
+    Yield ``(record, offset)`` for each input row from byte ``offset`` on: a
+    GeoJSON Feature dict or a CSV row dict, and the byte offset just past
+    it, where an import resuming after this record starts reading.
+    """
+    if file_format == 'csv':
+        yield from csv_records(file, offset)
+    elif file_format == 'ndjson':
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            line = line.strip()
+            if line:
+                try:
+                    record = json.loads(line)
+                except ValueError as exc:
+                    # Reported and skipped like any other unusable record.
+                    record = ValueError(f'not valid JSON ({exc})')
+                yield record, offset
+    else:
+        yield from FeatureStream(file).features(offset)
+
+
+def csv_records(file, offset):
+    """CSV rows as dicts keyed by the header line, from byte ``offset`` on."""
+    position = 0
+
+    def lines():
+        nonlocal position
+        while line := file.readline():
+            position += len(line)
+            yield line.decode('utf-8-sig')
+
+    # csv.reader reads no further than the record it returns.
+    fieldnames = next(csv.reader(lines()), None)
+    if fieldnames is None:
+        return
+    if offset:
+        file.seek(offset)
+        position = offset
+    for row in csv.DictReader(lines(), fieldnames):
+        yield row, position
+
+
+def location_row(record):
+    """STAGING_COLUMNS tuple for a record, or ValueError if it is not usable."""
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError('expected an object')
+
+    if 'properties' in record or 'geometry' in record:
+        properties = record.get('properties') or {}
+        geometry = record.get('geometry') or {}
+        if not isinstance(properties, dict) or not isinstance(geometry, dict):
+            raise ValueError('expected a GeoJSON Feature')
+        if geometry.get('type') != 'Point':
+            raise ValueError('geometry must be a Point')
+        external_id = record.get('id', properties.get('external_id'))
+        try:
+            lon, lat = (float(value) for value in geometry['coordinates'][:2])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('invalid Point coordinates')
+    else:
+        properties = record
+        external_id = first_value(record, ('external_id', 'id'))
+        lat = first_value(record, LAT_COLUMNS)
+        lon = first_value(record, LON_COLUMNS)
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise ValueError('missing or invalid lat/lon')
+
+    if not (math.isfinite(lon) and math.isfinite(lat) and -180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError('coordinates out of range')
+
+    name = properties.get('name') or ''
+    description = properties.get('description') or ''
+    address = properties.get('address') or ''
+    for field, value in (('name', name), ('description', description), ('address', address)):
+        if not isinstance(value, str):
+            raise ValueError(f'{field} must be a string')
+        # PostgreSQL text cannot hold NUL, and the COPY would fail the batch.
+        if '\x00' in value:
+            raise ValueError(f'{field} must not contain null characters')
+    name = name.strip()
+    if not name:
+        raise ValueError('name is required')
+    if len(name) > Location._meta.get_field('name').max_length:
+        raise ValueError('name is too long')
+    if len(address) > Location._meta.get_field('address').max_length:
+        raise ValueError('address is too long')
+    key = natural_key(name, lon, lat, external_id)
+    if key is not None and len(key) > Location._meta.get_field('natural_key').max_length:
+        raise ValueError('natural key is too long')
+    if key is not None and '\x00' in key:
+        raise ValueError('id must not contain null characters')
+    return (key, name, description, address, lon, lat)
+
+
+def first_value(record, names):
+    for name in names:
+        if record.get(name) not in (None, ''):
+            return record[name]
+    return None
+
+
+class FeatureStream:
+    """
+    Incremental reader for the ``features`` array of a GeoJSON
+    FeatureCollection, so files larger than memory can be imported.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        # Byte offset in the file of buffer[mark]; see tell().
+        self.offset = 0
+        self.mark = 0
+
+    def tell(self):
+        """Byte offset in the file of the current position."""
+        self.offset += len(self.buffer[self.mark:self.pos].encode('utf-8'))
+        self.mark = self.pos
+        return self.offset
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.file.read(READ_SIZE)
+        self.eof = not chunk
+        self.tell()
+        self.buffer = self.buffer[self.pos:] + self.text.decode(chunk, final=self.eof)
+        self.pos = self.mark = 0
+        return not self.eof
+
+    def peek(self):
+        while True:
+            # A byte order mark is skipped like whitespace.
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n\ufeff':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise CommandError(f'Invalid GeoJSON: expected {char!r}')
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if len(self.buffer) - self.pos < MAX_VALUE_SIZE and self.fill():
+                    continue
+                raise CommandError('Invalid GeoJSON: truncated or malformed value')
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def features(self, offset=0):
+        """
+        Yield ``(feature, offset)`` for each feature, with the byte offset
+        just past it. A non-zero ``offset`` (one yielded earlier) resumes
+        inside the features array.
+        """
+        if offset:
+            self.file.seek(offset)
+            self.offset = offset
+            yield from self.items()
+            return
+        self.expect('{')
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            if key == 'features':
+                self.expect('[')
+                yield from self.items()
+            else:
+                self.value()
+            if self.peek() == ',':
+                self.pos += 1
+        self.expect('}')
+
+    def items(self):
+        """``(value, offset)`` for the rest of an array, through its ']'."""
+        while True:
+            char = self.peek()
+            if char == ',':
+                self.pos += 1
+            elif char == ']':
+                self.pos += 1
+                return
+            else:
+                yield self.value(), self.tell()
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
-from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from locations.ingest import copy_rows, create_staging_table, merge_staging, natural_key
 from locations.models import Location
+from locations.signals import locations_changed
 
 class Command(BaseCommand):
     help = 'Load sample location data'
@@ -37,20 +39,35 @@ class Command(BaseCommand):
             },
         ]
 
-        for loc_data in sample_locations:
-            location, created = Location.objects.get_or_create(
-                name=loc_data['name'],
-                defaults={
-                    'description': loc_data['description'],
-                    'address': loc_data['address'],
-                    'point': Point(loc_data['lon'], loc_data['lat'], srid=4326)
-                }
+        rows = [
+            (
+                natural_key(loc_data['name'], loc_data['lon'], loc_data['lat']),
+                loc_data['name'],
+                loc_data['description'],
+                loc_data['address'],
+                loc_data['lon'],
+                loc_data['lat'],
+            )
+            for loc_data in sample_locations
+        ]
+
+        # One upsert for all rows: re-running is idempotent and race-free.
+        with transaction.atomic(), connection.cursor() as cursor:
+            create_staging_table(cursor)
+            copy_rows(cursor, rows)
+            counts = merge_staging(cursor)
+
+        if counts.inserted or counts.updated:
+            locations_changed.send(sender=Location, points=None)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {counts.inserted} locations')
+        )
+        if counts.updated:
+            self.stdout.write(
+                self.style.SUCCESS(f'Updated {counts.updated} locations')
+            )
+        if counts.unchanged:
+            self.stdout.write(
+                self.style.WARNING(f'{counts.unchanged} locations already exist')
             )
-            if created:
-                self.stdout.write(
-                    self.style.SUCCESS(f'Created location: {location.name}')
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'Location already exists: {location.name}')
-                )
\ No newline at end of file
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from locations.memory_index import memory_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Build or refresh the in-process nearby index file (LOCATIONS["MEMORY_INDEX"]), '
+        'e.g. before starting workers so the first requests find it ready.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Read every location rather than only the changes')
+
+    def handle(self, *args, **options):
+        index = memory_index()
+        if index is None:
+            raise CommandError('LOCATIONS["MEMORY_INDEX"] is not set')
+
+        index.refresh(rebuild=options['rebuild'], wait=True)
+        snapshot = index.snapshot
+        self.stdout.write(self.style.SUCCESS(
+            f'{index.path}: {snapshot.count} locations, table version {snapshot.version}'
+        ))
@@ -0,0 +1,141 @@
+"""
+Geodesic distance matrices between two lists of points.
+
+Small matrices are computed by PostGIS in one CROSS JOIN. Large ones are
+computed in Python, block by block of origin rows, so the response can be
+streamed as rows are produced: with NumPy (the optional ``numpy``
+package) when it is installed, otherwise by running the SQL query for one
+block of origins at a time.
+"""
+from django.db import connection
+
+from .conf import get_setting
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# WGS 84 ellipsoid, as used by PostGIS for geography distances.
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+MEAN_RADIUS = 6371008.8
+
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+# Matrix cells computed per NumPy block.
+BLOCK_CELLS = 100000
+
+# Metres are reported to the millimetre.
+DECIMALS = 3
+
+
+def sql_rows(origins, destinations):
+    """
+    Rows of metres from each origin to every destination, from one
+    PostGIS query. Points are ``(lon, lat)`` pairs.
+    """
+    sql = '''
+        WITH o AS (
+            SELECT i, ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS geog
+            FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS u(lon, lat, i)
+        ), d AS (
+            SELECT j, ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS geog
+            FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS u(lon, lat, j)
+        )
+        SELECT array_agg(ST_Distance(o.geog, d.geog) ORDER BY d.j)
+        FROM o CROSS JOIN d
+        GROUP BY o.i
+        ORDER BY o.i
+    '''
+    params = [
+        [lon for lon, _ in origins], [lat for _, lat in origins],
+        [lon for lon, _ in destinations], [lat for _, lat in destinations],
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [[round(value, DECIMALS) for value in row] for row, in cursor.fetchall()]
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Great-circle metres on the mean-radius sphere (arrays in degrees)."""
+    lon1, lat1, lon2, lat2 = (numpy.radians(value) for value in (lon1, lat1, lon2, lat2))
+    h = (numpy.sin((lat2 - lat1) / 2) ** 2
+         + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * MEAN_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(h, 1)))
+
+
+def vincenty(lon1, lat1, lon2, lat2):
+    """
+    Geodesic metres on the WGS 84 ellipsoid by Vincenty's inverse formula,
+    for broadcastable arrays of degrees. The few nearly antipodal pairs
+    for which the iteration does not converge get the haversine distance.
+    """
+    L = numpy.radians(lon2 - lon1)
+    U1 = numpy.arctan((1 - WGS84_F) * numpy.tan(numpy.radians(lat1)))
+    U2 = numpy.arctan((1 - WGS84_F) * numpy.tan(numpy.radians(lat2)))
+    sin_u1, cos_u1 = numpy.sin(U1), numpy.cos(U1)
+    sin_u2, cos_u2 = numpy.sin(U2), numpy.cos(U2)
+
+    lam = L
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_ITERATIONS):
+            sin_lam, cos_lam = numpy.sin(lam), numpy.cos(lam)
+            sin_sigma = numpy.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = numpy.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = numpy.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos2_alpha = 0 and cos_2sigma_m = 0.
+            cos_2sigma_m = numpy.where(
+                cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha
+            )
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            converged = numpy.abs(lam - previous) < VINCENTY_TOLERANCE
+            if converged.all():
+                break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+    ))
+    distance = WGS84_B * A * (sigma - delta_sigma)
+    return numpy.where(converged, distance, haversine(lon1, lat1, lon2, lat2))
+
+
+def numpy_rows(origins, destinations):
+    """Yield matrix rows, computed with vincenty() a block of origins at a time."""
+    dest = numpy.asarray(destinations, dtype=float).reshape(-1, 2)
+    block = max(1, BLOCK_CELLS // max(len(destinations), 1))
+    for start in range(0, len(origins), block):
+        orig = numpy.asarray(origins[start:start + block], dtype=float).reshape(-1, 2)
+        distances = vincenty(orig[:, :1], orig[:, 1:], dest[:, 0], dest[:, 1])
+        yield from distances.round(DECIMALS).tolist()
+
+
+def chunked_sql_rows(origins, destinations):
+    """Yield matrix rows from sql_rows(), a block of origins per query."""
+    block = max(1, get_setting('DISTANCE_MATRIX_SQL_CELLS') // max(len(destinations), 1))
+    for start in range(0, len(origins), block):
+        yield from sql_rows(origins[start:start + block], destinations)
+
+
+def matrix_rows(origins, destinations):
+    """Yield the rows of a large matrix, as they are computed."""
+    if numpy is not None:
+        return numpy_rows(origins, destinations)
+    return chunked_sql_rows(origins, destinations)
+
+
+def is_small(origins, destinations):
+    """Whether the matrix is small enough to compute in one SQL query."""
+    return len(origins) * len(destinations) <= get_setting('DISTANCE_MATRIX_SQL_CELLS')
@@ -0,0 +1,398 @@
+"""
+In-process spatial index for the nearby endpoint.
+
+Every location's id, lon and lat are kept in one file, ideally on a
+RAM-backed filesystem such as /dev/shm, which each worker process
+memory-maps: all workers on a host share one copy through the page cache.
+Rows are sorted by the grid cell that contains them, so the rows of a run
+of cells in one grid row are a contiguous slice found by binary search.
+A lookup computes haversine distances for those slices with NumPy and
+returns the ids in range, with a margin for the difference between the
+sphere and the spheroid. The view then only asks the database for those
+ids, applying the exact tests.
+
+Refreshes are incremental. The ids LocationChange logged since the
+previous refresh are read again (or dropped, if deleted) and the new file
+replaces the old one atomically. The log is read by transaction id, not
+by time, so a long transaction's rows are picked up whenever it commits.
+One process refreshes at a time, under a file lock, and only once the
+table's TableVersion has moved; the others pick up the new file on their
+next lookup. Refreshes, and full builds (the first, and after a TRUNCATE
+or a gap longer than the log is kept), run in a background thread or the
+refresh_location_index command: requests only map the finished file.
+Needs NumPy.
+"""
+import datetime
+import fcntl
+import itertools
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from .conf import get_setting
+from .matrix import haversine
+from .models import Location, LocationChange, TableVersion
+from .nearby_cache import METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON
+from .rendering import point_x, point_y
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Haversine on the mean sphere is within 0.6% of the geodesic distance.
+MARGIN = 1.01
+# Distance at which a lookup covers the whole globe.
+HALF_CIRCUMFERENCE = 20037509
+
+# Magic, row count, table version, time of the last refresh (microseconds
+# since the epoch, by the database clock), xmin of the snapshot it read
+# under and grid size, then the arrays below, each starting on an 8-byte
+# boundary.
+MAGIC = b'LOCIDX02'
+HEADER = struct.Struct('<8sqqqqd')
+HEADER_SIZE = 64
+ARRAYS = (('cells', 'int64'), ('ids', 'int64'), ('lons', 'float64'), ('lats', 'float64'))
+
+# Rows fetched per server-side cursor round-trip by a full build.
+BUILD_CHUNK_SIZE = 10000
+
+
+def array_offsets(count):
+    offset = HEADER_SIZE
+    for name, dtype in ARRAYS:
+        yield name, dtype, offset
+        offset += -(-count * numpy.dtype(dtype).itemsize // 8) * 8
+
+
+def to_micros(value):
+    return int(value.timestamp() * 1000000)
+
+
+def from_micros(value):
+    return datetime.datetime.fromtimestamp(value / 1000000, tz=datetime.UTC)
+
+
+class Snapshot:
+    """A memory-mapped index file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (stat.st_dev, stat.st_ino)
+        magic = self.read_header()
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a location index')
+        for name, dtype, offset in array_offsets(self.count):
+            setattr(self, name, numpy.frombuffer(self.map, dtype, self.count, offset))
+        self.rows = math.ceil(180 / self.grid)
+        self.cols = math.ceil(360 / self.grid)
+
+    def read_header(self):
+        """
+        Load the header fields; the version, refresh time and xmin are
+        rewritten in place by refreshes that move no point. Returns the
+        magic bytes.
+        """
+        magic, self.count, self.version, refreshed, self.xmin, self.grid = HEADER.unpack_from(self.map)
+        self.refreshed = from_micros(refreshed)
+        return magic
+
+    def col_ranges(self, lon, lat, meters):
+        """(first, last) grid columns that can hold points within ``meters``."""
+        widest = min(abs(lat) + meters / METERS_PER_DEGREE_LAT, 90)
+        if widest >= 90:
+            return [(0, self.cols - 1)]
+        dlon = meters / (METERS_PER_DEGREE_LON * math.cos(math.radians(widest)))
+        first = math.floor((lon - dlon + 180) / self.grid)
+        last = math.floor((lon + dlon + 180) / self.grid)
+        if dlon >= 180 or last - first + 1 >= self.cols:
+            return [(0, self.cols - 1)]
+        if first < 0:
+            return [(first + self.cols, self.cols - 1), (0, last)]
+        if last >= self.cols:
+            return [(first, self.cols - 1), (0, last - self.cols)]
+        return [(first, last)]
+
+    def positions_near(self, lon, lat, meters):
+        """Array positions of the rows in the cells around lon/lat."""
+        dlat = meters / METERS_PER_DEGREE_LAT
+        first_row = max(math.floor((lat - dlat + 90) / self.grid), 0)
+        last_row = min(math.floor((lat + dlat + 90) / self.grid), self.rows - 1)
+        rows = numpy.arange(first_row, last_row + 1) * self.cols
+        ranges = self.col_ranges(lon, lat, meters)
+        starts = numpy.concatenate([rows + first for first, _ in ranges])
+        ends = numpy.concatenate([rows + last for _, last in ranges])
+        lows = numpy.searchsorted(self.cells, starts, 'left')
+        highs = numpy.searchsorted(self.cells, ends, 'right')
+        return numpy.concatenate(
+            [numpy.arange(low, high) for low, high in zip(lows, highs) if high > low]
+            or [numpy.empty(0, dtype=numpy.intp)]
+        )
+
+    def within(self, lon, lat, meters):
+        """Positions and haversine distances of the rows within ``meters``."""
+        positions = self.positions_near(lon, lat, meters)
+        distances = haversine(lon, lat, self.lons[positions], self.lats[positions])
+        keep = distances <= meters
+        return positions[keep], distances[keep]
+
+    def ids_within(self, lon, lat, meters):
+        """Ids of a superset of the locations within ``meters`` of lon/lat."""
+        positions, _ = self.within(lon, lat, meters * MARGIN)
+        return self.ids[positions]
+
+    def ids_nearest(self, lon, lat, k, meters=None):
+        """
+        Ids of a superset of the ``k`` locations nearest to lon/lat (within
+        ``meters``, if given). The search widens until it holds k rows, then
+        keeps every row the spheroid could place among the k nearest.
+        """
+        cap = HALF_CIRCUMFERENCE if meters is None else min(meters * MARGIN, HALF_CIRCUMFERENCE)
+        radius = self.grid * METERS_PER_DEGREE_LAT
+        while True:
+            radius = min(radius, cap)
+            positions, distances = self.within(lon, lat, radius)
+            if len(distances) >= k or radius >= cap:
+                break
+            radius *= 4
+        if len(distances) > k:
+            # The kth nearest is at most kth * MARGIN away on the spheroid,
+            # and a location that close is at most that * MARGIN by haversine.
+            bound = min(numpy.partition(distances, k - 1)[k - 1] * MARGIN ** 2, cap)
+            if bound > radius:
+                positions, distances = self.within(lon, lat, bound)
+            else:
+                positions = positions[distances <= bound]
+        return self.ids[positions]
+
+
+def cells_for(grid, lons, lats):
+    rows = numpy.minimum(numpy.floor((lats + 90) / grid), math.ceil(180 / grid) - 1)
+    cols = numpy.floor(numpy.mod(lons + 180, 360) / grid) % math.ceil(360 / grid)
+    return (rows * math.ceil(360 / grid) + cols).astype(numpy.int64)
+
+
+def write_snapshot(path, ids, lons, lats, version, refreshed, xmin, grid):
+    """Write a sorted index file next to ``path`` and move it into place."""
+    cells = cells_for(grid, lons, lats)
+    order = numpy.argsort(cells, kind='stable')
+    arrays = {
+        'cells': cells[order],
+        'ids': ids[order].astype(numpy.int64),
+        'lons': lons[order].astype(numpy.float64),
+        'lats': lats[order].astype(numpy.float64),
+    }
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        header = HEADER.pack(MAGIC, len(ids), version, to_micros(refreshed), xmin, grid)
+        file.write(header.ljust(HEADER_SIZE, b'\0'))
+        for name, _, offset in array_offsets(len(ids)):
+            file.seek(offset)
+            file.write(arrays[name].tobytes())
+    os.replace(temporary, path)
+
+
+def location_rows(queryset):
+    """(ids, lons, lats) arrays for ``queryset``, read in chunks."""
+    rows = queryset.order_by().annotate(x=point_x(), y=point_y()).values_list('id', 'x', 'y')
+    chunks = [
+        numpy.array(chunk, dtype=numpy.float64).reshape(-1, 3)
+        for chunk in itertools.batched(rows.iterator(chunk_size=BUILD_CHUNK_SIZE), BUILD_CHUNK_SIZE)
+    ]
+    table = numpy.concatenate(chunks) if chunks else numpy.empty((0, 3))
+    return table[:, 0].astype(numpy.int64), table[:, 1], table[:, 2]
+
+
+def database_state():
+    """
+    The database time and the xmin of the current snapshot: every
+    transaction with a lower id had committed or aborted by then.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT now(), pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()
+
+
+def refresh_snapshot(path, snapshot):
+    """
+    Bring the index file at ``path`` (currently ``snapshot``, or None) up
+    to date. Callers hold the index's file lock.
+    """
+    grid = get_setting('MEMORY_INDEX_GRID')
+    version = TableVersion.objects.filter(
+        name=Location._meta.db_table
+    ).values_list('version', flat=True).first()
+    version = -1 if version is None else version
+    if snapshot is not None and snapshot.grid == grid and snapshot.version == version:
+        return
+
+    # The xmin is taken before anything else is read: a transaction that
+    # commits after these reads has an id at or above it, so the next
+    # refresh, starting from this xmin, sees its log entries.
+    now, xmin = database_state()
+    retention = datetime.timedelta(seconds=get_setting('MEMORY_INDEX_CHANGE_LOG_RETENTION'))
+    full = snapshot is None or snapshot.grid != grid or snapshot.refreshed < now - retention
+    if not full:
+        changes = LocationChange.objects.filter(xid__gte=snapshot.xmin)
+        changed = numpy.array(
+            list(changes.values_list('location_id', flat=True).distinct()), dtype=numpy.float64
+        )
+        full = numpy.isnan(changed).any()
+    # Entries are kept until every transaction that could still need them
+    # has been read past, however old they are.
+    LocationChange.objects.filter(logged_at__lt=now - retention, xid__lt=xmin).delete()
+
+    if full:
+        write_snapshot(path, *location_rows(Location.objects.all()), version, now, xmin, grid)
+        return
+    ids, lons, lats = location_rows(Location.objects.filter(id__in=changes.values('location_id')))
+    deleted = numpy.setdiff1d(changed.astype(numpy.int64), ids)
+
+    stored = numpy.isin(snapshot.ids, ids)
+    order, stored_order = numpy.argsort(ids), numpy.argsort(snapshot.ids[stored])
+    unchanged = (
+        not numpy.isin(deleted, snapshot.ids).any()
+        and stored.sum() == len(ids)
+        and numpy.array_equal(lons[order], snapshot.lons[stored][stored_order])
+        and numpy.array_equal(lats[order], snapshot.lats[stored][stored_order])
+    )
+    if unchanged:
+        # No point moved: record the new version, time and xmin in place,
+        # for this and every process mapping the file.
+        with open(path, 'r+b') as file:
+            file.write(HEADER.pack(MAGIC, snapshot.count, version, to_micros(now), xmin, grid))
+        return
+
+    keep = ~numpy.isin(snapshot.ids, numpy.concatenate([ids, deleted]))
+    write_snapshot(
+        path,
+        numpy.concatenate([snapshot.ids[keep], ids]),
+        numpy.concatenate([snapshot.lons[keep], lons]),
+        numpy.concatenate([snapshot.lats[keep], lats]),
+        version, now, xmin, grid,
+    )
+
+
+class MemoryIndex:
+    """A process's view of the index file at ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot = None
+        self.next_refresh = 0
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def get(self):
+        """
+        The current Snapshot. A due refresh is started in a background
+        thread (or left to refresh_location_index) and lookups keep using
+        the mapped file until the new one replaces it; until there is a
+        file at all, they return None and go to the database.
+        """
+        if time.monotonic() >= self.next_refresh:
+            self.next_refresh = time.monotonic() + get_setting('MEMORY_INDEX_REFRESH')
+            self.refresh_in_background()
+        self.reopen()
+        return self.snapshot
+
+    def refresh(self, rebuild=False, wait=False):
+        """Refresh the file, unless another process is (``wait`` to wait for it)."""
+        with open(f'{self.path}.lock', 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is refreshing; its file is picked up later.
+                return
+            self.reopen()
+            refresh_snapshot(self.path, None if rebuild else self.snapshot)
+        self.reopen()
+
+    def refresh_in_background(self):
+        """Start a refresh in a thread, unless one is already running."""
+        with self.lock:
+            if self.refresher is not None and self.refresher.is_alive():
+                return
+            self.refresher = threading.Thread(
+                target=self.refresh_and_close, name='location-index-refresh', daemon=True
+            )
+            self.refresher.start()
+
+    def refresh_and_close(self):
+        try:
+            self.refresh()
+        finally:
+            # The thread's own database connection.
+            connection.close()
+
+    def reopen(self):
+        """
+        Map the file again if another process (or refresh) replaced it, or
+        re-read its header if it was updated in place.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.snapshot = None
+            return
+        if self.snapshot is None or self.snapshot.inode != (stat.st_dev, stat.st_ino):
+            try:
+                self.snapshot = Snapshot(self.path)
+            except ValueError:
+                # A file in an older format, replaced by the next build.
+                self.snapshot = None
+        else:
+            self.snapshot.read_header()
+
+    def expire(self):
+        self.next_refresh = 0
+
+
+indexes = {}
+
+
+def memory_index():
+    """This process's MemoryIndex, or None when MEMORY_INDEX is not set."""
+    path = get_setting('MEMORY_INDEX')
+    if not path:
+        return None
+    if numpy is None:
+        raise ImproperlyConfigured('MEMORY_INDEX needs NumPy (uv sync --extra index)')
+    if path not in indexes:
+        indexes[path] = MemoryIndex(path)
+    return indexes[path]
+
+
+def indexed_ids(point, distance=None, k=None):
+    """
+    Ids of a superset of the locations within ``distance`` metres of
+    ``point`` or, with ``k``, of its k nearest (within ``distance`` when
+    given), from the in-process index. None when the index is off or not
+    built yet, or when there are more than MEMORY_INDEX_MAX_IDS candidates.
+    """
+    index = memory_index()
+    snapshot = index.get() if index is not None else None
+    if snapshot is None:
+        return None
+    if k is None:
+        ids = snapshot.ids_within(point.x, point.y, distance)
+    else:
+        ids = snapshot.ids_nearest(point.x, point.y, k, distance)
+    if len(ids) > get_setting('MEMORY_INDEX_MAX_IDS'):
+        return None
+    return ids.tolist()
+
+
+def invalidate_points(points):
+    """Have this process refresh its index on the next lookup."""
+    index = memory_index()
+    if index is not None:
+        index.expire()
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_location_point_geog_gist'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='location',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Location', 'verbose_name_plural': 'Locations'},
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['-created_at', '-id'], name='location_created_id_idx'),
+        ),
+    ]
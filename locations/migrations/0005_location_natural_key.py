@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+# Key derivation frozen from locations.models.natural_key as of this
+# migration, so later changes to the app do not change what it writes.
+NATURAL_KEY_PRECISION = 5
+BATCH_SIZE = 1000
+
+
+def name_point_key(name, lon, lat):
+    lon = round(lon, NATURAL_KEY_PRECISION) + 0.0
+    lat = round(lat, NATURAL_KEY_PRECISION) + 0.0
+    return f'{name}@{lon:.{NATURAL_KEY_PRECISION}f},{lat:.{NATURAL_KEY_PRECISION}f}'
+
+
+def backfill_natural_keys(apps, schema_editor):
+    # Existing rows get 'name_point' keys so re-importing them upserts
+    # instead of duplicating; rows whose key is already taken keep NULL.
+    from django.conf import settings
+
+    if getattr(settings, 'LOCATIONS', {}).get('NATURAL_KEY', 'name_point') != 'name_point':
+        return
+    Location = apps.get_model('locations', 'Location')
+    seen = set()
+    batch = []
+    rows = Location.objects.order_by('id').only('id', 'name', 'point').iterator(chunk_size=BATCH_SIZE)
+    for location in rows:
+        key = name_point_key(location.name, location.point.x, location.point.y)
+        if key in seen or len(key) > 255:
+            continue
+        seen.add(key)
+        location.natural_key = key
+        batch.append(location)
+        if len(batch) == BATCH_SIZE:
+            Location.objects.bulk_update(batch, ['natural_key'])
+            batch = []
+    if batch:
+        Location.objects.bulk_update(batch, ['natural_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0004_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='natural_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_natural_keys, migrations.RunPython.noop),
+    ]
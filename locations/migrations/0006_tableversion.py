@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+# One statement-level trigger per operation. The transition table lets a
+# statement that changed no rows (an upsert of unchanged rows, an UPDATE
+# matching nothing) leave the version alone.
+#
+# The bump serialises writers. Its upsert locks the table's one version
+# row until the writing transaction ends, so every other transaction that
+# changes locations waits for it: a long bulk transaction blocks all other
+# location writes (never reads) until it commits. That is deliberate. The
+# bump must commit with the rows, so that a version is only ever seen
+# together with the data it stands for; a counter moved outside the
+# transaction (a sequence, say) could move before the rows are visible,
+# and a client would be given a validator for data it never saw change.
+# Keep location-writing transactions short: import_locations commits each
+# batch on its own, while one POST to the bulk endpoint holds the lock for
+# the whole request.
+BUMP_FUNCTION = '''
+CREATE FUNCTION locations_bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- TRUNCATE triggers have no transition table to look at.
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO locations_tableversion (name, version, modified_at)
+    VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (name) DO UPDATE SET
+        version = locations_tableversion.version + 1,
+        modified_at = EXCLUDED.modified_at;
+    RETURN NULL;
+END
+$$;
+'''
+
+TRIGGERS = '''
+CREATE TRIGGER location_version_insert AFTER INSERT ON locations_location
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_bump_table_version();
+CREATE TRIGGER location_version_update AFTER UPDATE ON locations_location
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_bump_table_version();
+CREATE TRIGGER location_version_delete AFTER DELETE ON locations_location
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_bump_table_version();
+CREATE TRIGGER location_version_truncate AFTER TRUNCATE ON locations_location
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_bump_table_version();
+INSERT INTO locations_tableversion (name, version, modified_at)
+    VALUES ('locations_location', 0, now());
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER location_version_insert ON locations_location;
+DROP TRIGGER location_version_update ON locations_location;
+DROP TRIGGER location_version_delete ON locations_location;
+DROP TRIGGER location_version_truncate ON locations_location;
+DROP FUNCTION locations_bump_table_version();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0005_location_natural_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=63, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modified_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunSQL(BUMP_FUNCTION + TRIGGERS, DROP_TRIGGERS),
+    ]
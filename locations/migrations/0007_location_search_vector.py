@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0006_tableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='search_vector',
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=(
+                    django.contrib.postgres.search.SearchVector('name', config='english', weight='A')
+                    + django.contrib.postgres.search.SearchVector('address', config='english', weight='B')
+                    + django.contrib.postgres.search.SearchVector('description', config='english', weight='C')
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='location_search_gin'),
+        ),
+    ]
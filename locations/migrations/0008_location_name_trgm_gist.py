@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:10
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0007_location_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['name'], name='location_name_trgm_gist', opclasses=['gist_trgm_ops']),
+        ),
+    ]
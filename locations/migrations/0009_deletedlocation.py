@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+# clock_timestamp() rather than now(), so a long transaction logs its
+# deletions close to when they become visible.
+LOG_FUNCTION = '''
+CREATE FUNCTION locations_log_deletions() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO locations_deletedlocation (location_id, deleted_at)
+        VALUES (NULL, clock_timestamp());
+    ELSE
+        INSERT INTO locations_deletedlocation (location_id, deleted_at)
+        SELECT id, clock_timestamp() FROM deleted_rows;
+    END IF;
+    RETURN NULL;
+END
+$$;
+'''
+
+TRIGGERS = '''
+CREATE TRIGGER location_log_delete AFTER DELETE ON locations_location
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_deletions();
+CREATE TRIGGER location_log_truncate AFTER TRUNCATE ON locations_location
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_deletions();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER location_log_delete ON locations_location;
+DROP TRIGGER location_log_truncate ON locations_location;
+DROP FUNCTION locations_log_deletions();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0008_location_name_trgm_gist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.BigIntegerField(null=True)),
+                ('deleted_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['updated_at'], name='location_updated_idx'),
+        ),
+        migrations.RunSQL(LOG_FUNCTION + TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+# The columns are added empty, which needs no table rewrite, and existing
+# rows are filled in batches by the backfill_geohash command. The trigger
+# covers every later write: saves, bulk ingest merges and set-based updates.
+GEOHASH_FUNCTION = '''
+CREATE FUNCTION locations_set_geohash() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.geohash_8 := ST_GeoHash(NEW.point, 8);
+    NEW.geohash_6 := left(NEW.geohash_8, 6);
+    NEW.geohash_4 := left(NEW.geohash_8, 4);
+    RETURN NEW;
+END
+$$;
+'''
+
+TRIGGERS = '''
+CREATE TRIGGER location_set_geohash BEFORE INSERT OR UPDATE OF point ON locations_location
+    FOR EACH ROW EXECUTE FUNCTION locations_set_geohash();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER location_set_geohash ON locations_location;
+DROP FUNCTION locations_set_geohash();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0009_deletedlocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash_4',
+            field=models.CharField(blank=True, db_collation='C', editable=False, max_length=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geohash_6',
+            field=models.CharField(blank=True, db_collation='C', editable=False, max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geohash_8',
+            field=models.CharField(blank=True, db_collation='C', editable=False, max_length=8, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['geohash_4', 'geohash_6', 'geohash_8'], name='location_geohash_idx'),
+        ),
+        migrations.RunSQL(GEOHASH_FUNCTION + TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+# The deletion log of 0009 becomes a log of every inserted, moved or
+# deleted location, tagged with the writing transaction's id. Readers keep
+# the xmin of the snapshot they last read under: any transaction below it
+# had finished by then, so the entries they have not seen are exactly
+# those with xid >= xmin, however long the transactions ran. Updates that
+# leave the point alone are not logged.
+LOG_FUNCTION = '''
+CREATE FUNCTION locations_log_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO locations_locationchange (location_id, xid, logged_at)
+        VALUES (NULL, pg_current_xact_id()::text::bigint, clock_timestamp());
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO locations_locationchange (location_id, xid, logged_at)
+        SELECT new_rows.id, pg_current_xact_id()::text::bigint, clock_timestamp()
+        FROM new_rows JOIN old_rows USING (id)
+        WHERE new_rows.point IS DISTINCT FROM old_rows.point;
+    ELSE
+        INSERT INTO locations_locationchange (location_id, xid, logged_at)
+        SELECT id, pg_current_xact_id()::text::bigint, clock_timestamp() FROM changed_rows;
+    END IF;
+    RETURN NULL;
+END
+$$;
+'''
+
+TRIGGERS = '''
+CREATE TRIGGER location_log_insert AFTER INSERT ON locations_location
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_changes();
+CREATE TRIGGER location_log_update AFTER UPDATE ON locations_location
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_changes();
+CREATE TRIGGER location_log_delete AFTER DELETE ON locations_location
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_changes();
+CREATE TRIGGER location_log_truncate AFTER TRUNCATE ON locations_location
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_changes();
+'''
+
+DROP_TRIGGERS = '''
+DROP TRIGGER location_log_insert ON locations_location;
+DROP TRIGGER location_log_update ON locations_location;
+DROP TRIGGER location_log_delete ON locations_location;
+DROP TRIGGER location_log_truncate ON locations_location;
+DROP FUNCTION locations_log_changes();
+'''
+
+# The triggers of 0009, restored when this migration is reversed.
+DELETION_LOG_FUNCTION = '''
+CREATE FUNCTION locations_log_deletions() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO locations_deletedlocation (location_id, deleted_at)
+        VALUES (NULL, clock_timestamp());
+    ELSE
+        INSERT INTO locations_deletedlocation (location_id, deleted_at)
+        SELECT id, clock_timestamp() FROM deleted_rows;
+    END IF;
+    RETURN NULL;
+END
+$$;
+'''
+
+DELETION_TRIGGERS = '''
+CREATE TRIGGER location_log_delete AFTER DELETE ON locations_location
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_deletions();
+CREATE TRIGGER location_log_truncate AFTER TRUNCATE ON locations_location
+    FOR EACH STATEMENT EXECUTE FUNCTION locations_log_deletions();
+'''
+
+DROP_DELETION_TRIGGERS = '''
+DROP TRIGGER location_log_delete ON locations_location;
+DROP TRIGGER location_log_truncate ON locations_location;
+DROP FUNCTION locations_log_deletions();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0010_location_geohash'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_DELETION_TRIGGERS, DELETION_LOG_FUNCTION + DELETION_TRIGGERS),
+        migrations.RenameModel(
+            old_name='DeletedLocation',
+            new_name='LocationChange',
+        ),
+        migrations.RenameField(
+            model_name='locationchange',
+            old_name='deleted_at',
+            new_name='logged_at',
+        ),
+        migrations.AddField(
+            model_name='locationchange',
+            name='xid',
+            field=models.BigIntegerField(db_index=True, default=0),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(LOG_FUNCTION + TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0011_locationchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='offset',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,20 +1,280 @@
 from django.contrib.gis.db import models
+from django.contrib.gis.db.models.functions import Distance, GeometryDistance
+from django.contrib.gis.geos import Polygon
+from django.contrib.gis.measure import D
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField, TrigramWordDistance,
+)
+from django.db import connection
+from django.db.models import Count, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .conf import get_setting
+
+
+def point_geography():
+    # Must stay identical to the expression in Location.Meta.indexes, or
+    # PostgreSQL will not match queries against the geography index.
+    return Cast('point', models.PointField(geography=True, srid=4326))
+
+
+def geography_value(point):
+    return Value(point, output_field=models.PointField(geography=True, srid=4326))
+
+
+# Text search configuration of Location.search_vector. A generated column
+# needs a fixed configuration, and queries must use the same one to match.
+SEARCH_CONFIG = 'english'
+
+
+def location_search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('address', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+# Geohash lengths stored on Location (cells about 39 km, 1.2 km and 38 m
+# wide at the equator). Each is a prefix of the next.
+GEOHASH_PRECISIONS = (4, 6, 8)
+
+
+class LocationQuerySet(models.QuerySet):
+
+    def with_geography(self):
+        """Alias ``geog``, the geography cast of ``point`` (not selected)."""
+        if 'geog' in self.query.annotations:
+            return self
+        return self.alias(geog=point_geography())
+
+    def search(self, query):
+        """
+        Locations matching ``query`` (a SearchQuery, or web-search syntax
+        text) on the GIN-indexed search_vector, annotated with ``rank``.
+        """
+        if not isinstance(query, SearchQuery):
+            query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank() is a real; as a double precision the value rows are
+        # ordered by is exactly the float a pagination cursor stores.
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+
+    def similar_names(self, text):
+        """
+        Locations whose name contains a word or prefix similar to ``text``
+        (pg_trgm word similarity above pg_trgm.word_similarity_threshold),
+        nearest match first, annotated with ``name_distance`` (one minus the
+        word similarity). Both the ``%>`` filter and the ``<<->`` ordering
+        are answered by the location_name_trgm_gist index, so a LIMIT stops
+        the index scan after that many matches.
+        """
+        return self.filter(name__trigram_word_similar=text).annotate(
+            name_distance=TrigramWordDistance(text, 'name')
+        ).order_by('name_distance', 'id')
+
+    def in_cell(self, cell):
+        """
+        Locations in the geohash ``cell`` (1 to 8 characters). Equality on
+        the geohash column of every stored precision the cell covers, since
+        a cell fixes its coarser prefixes too, so the lookup is a range of
+        location_geohash_idx; lengths between precisions add a prefix match
+        on the next column.
+        """
+        lookups = {
+            f'geohash_{precision}': cell[:precision]
+            for precision in GEOHASH_PRECISIONS if precision <= len(cell)
+        }
+        if len(cell) not in GEOHASH_PRECISIONS:
+            finer = min(precision for precision in GEOHASH_PRECISIONS if precision > len(cell))
+            lookups[f'geohash_{finer}__startswith'] = cell
+        return self.filter(**lookups)
+
+    def cell_counts(self, precision):
+        """
+        Rows of ``cell``, ``count`` and the cell centre's ``longitude`` and
+        ``latitude``: locations grouped by their geohash of ``precision``
+        (one of GEOHASH_PRECISIONS), in cell order. Rows not backfilled yet
+        are left out.
+        """
+        column = f'geohash_{precision}'
+        center = Func(F(column), function='ST_PointFromGeoHash', output_field=models.PointField())
+        return self.order_by().filter(**{f'{column}__isnull': False}).values(
+            cell=F(column)
+        ).annotate(
+            count=Count('*'),
+            longitude=Func(center, function='ST_X', output_field=FloatField()),
+            latitude=Func(center, function='ST_Y', output_field=FloatField()),
+        ).order_by('cell')
+
+    def within_distance(self, point, meters):
+        """Locations within ``meters`` of ``point``, pruned by the geography index."""
+        return self.with_geography().filter(geog__dwithin=(point, D(m=meters)))
+
+    def annotate_distance(self, point):
+        """Annotate ``distance``, the geodesic (spheroid) distance to ``point``."""
+        return self.with_geography().annotate(distance=Distance('geog', point))
+
+    def order_by_proximity(self, point):
+        """Order by the index-assisted ``<->`` distance to ``point``."""
+        return self.with_geography().order_by(
+            GeometryDistance('geog', geography_value(point))
+        )
+
+    def within_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """
+        Locations inside a lon/lat box, using the bbox-overlap (&&) operator
+        on the GiST index. A box with min_lon > max_lon crosses the
+        antimeridian and is split into two envelopes.
+        """
+        if min_lon <= max_lon:
+            boxes = [(min_lon, min_lat, max_lon, max_lat)]
+        else:
+            boxes = [(min_lon, min_lat, 180, max_lat), (-180, min_lat, max_lon, max_lat)]
+
+        condition = Q()
+        for box in boxes:
+            envelope = Polygon.from_bbox(box)
+            envelope.srid = 4326
+            condition |= Q(point__bboverlaps=envelope)
+        return self.filter(condition)
+
+    def within_polygon(self, polygon, max_vertices=256):
+        """
+        Locations intersecting ``polygon`` (a Polygon or MultiPolygon in
+        EPSG:4326). The polygon is first cut with ST_Subdivide into pieces
+        of at most ``max_vertices`` vertices: each piece has a tight
+        bounding box for the GiST index to match, and the exact
+        ST_Intersects test only runs against a small piece.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        matches = RawSQL(
+            f'SELECT l.id FROM {table} l '
+            f'JOIN ST_Subdivide(ST_GeomFromEWKB(%s), %s) AS pieces(geom) '
+            f'ON ST_Intersects(l.point, pieces.geom)',
+            (bytes(polygon.ewkb), max_vertices),
+        )
+        return self.filter(pk__in=matches)
+
+    def along_route(self, route, meters, segment_length=1000, max_vertices=8):
+        """
+        Locations within ``meters`` of the LineString ``route`` (EPSG:4326),
+        annotated with ``position``: metres along the route to the point
+        closest to each location (the planar ST_LineLocatePoint fraction
+        times the route's geodesic length).
+
+        The route is segmentized to ``segment_length`` metres and cut into
+        pieces of at most ``max_vertices`` vertices, so each piece's
+        ST_DWithin box is small and matched on the geography GiST index.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        ewkb = bytes(route.ewkb)
+        matches = RawSQL(
+            f'SELECT l.id FROM {table} l '
+            f'JOIN ST_Subdivide('
+            f'ST_Segmentize(ST_GeomFromEWKB(%s)::geography, %s)::geometry, %s'
+            f') AS pieces(geom) '
+            f'ON ST_DWithin(l.point::geography(Point,4326), pieces.geom::geography, %s)',
+            (ewkb, segment_length, max_vertices, meters),
+        )
+        fraction = Func(
+            Value(route, output_field=models.LineStringField(srid=4326)), 'point',
+            function='ST_LineLocatePoint', output_field=FloatField(),
+        )
+        # An uncorrelated subquery, so PostgreSQL computes the length once.
+        length = RawSQL(
+            '(SELECT ST_Length(ST_GeomFromEWKB(%s)::geography))', (ewkb,), output_field=FloatField()
+        )
+        return self.filter(pk__in=matches).annotate(position=fraction * length)
+
+
+class LocationManager(models.Manager.from_queryset(LocationQuerySet)):
+
+    def get_queryset(self):
+        # The tsvector is only read by PostgreSQL; rows need not carry it.
+        return super().get_queryset().defer('search_vector')
+
+
+def natural_key(name, lon, lat, external_id=None):
+    """
+    Location.natural_key for a row, following the NATURAL_KEY setting:
+    ``external_id`` uses the id the source gave the row (None if it has
+    none), ``name_point`` combines the name with the point rounded to
+    NATURAL_KEY_PRECISION decimal places, and None disables keys.
+    """
+    mode = get_setting('NATURAL_KEY')
+    if mode == 'external_id':
+        return None if external_id in (None, '') else str(external_id)
+    if mode == 'name_point':
+        precision = get_setting('NATURAL_KEY_PRECISION')
+        # Adding 0.0 turns a rounded -0.0 into 0.0.
+        lon = round(lon, precision) + 0.0
+        lat = round(lat, precision) + 0.0
+        return f'{name}@{lon:.{precision}f},{lat:.{precision}f}'
+    return None
+
 
 class Location(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    point = models.PointField(srid=4326)  
+    point = models.PointField(srid=4326)
     address = models.CharField(max_length=300, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Identity used by bulk ingest to upsert rather than duplicate; see
+    # natural_key(). With 'name_point' keys, save() derives it like bulk
+    # ingest and bulk_update do, so every write path agrees; a row without
+    # a key (one whose key was taken when it was backfilled) keeps none.
+    natural_key = models.CharField(max_length=255, unique=True, null=True, blank=True, editable=False)
+    # Geohash cells of point (see GEOHASH_PRECISIONS), set by a database
+    # trigger on insert and whenever point changes, whichever path writes
+    # the row (migration 0010). Read them back with refresh_from_db(). NULL
+    # on rows older than the columns until backfill_geohash has run. The C
+    # collation lets prefix matches use the B-tree index.
+    geohash_4 = models.CharField(max_length=4, null=True, blank=True, editable=False, db_collation='C')
+    geohash_6 = models.CharField(max_length=6, null=True, blank=True, editable=False, db_collation='C')
+    geohash_8 = models.CharField(max_length=8, null=True, blank=True, editable=False, db_collation='C')
+    # Weighted tsvector of name, address and description, kept up to date by
+    # PostgreSQL. Deferred by the default manager; see LocationQuerySet.search().
+    search_vector = models.GeneratedField(
+        expression=location_search_vector(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = LocationManager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if get_setting('NATURAL_KEY') == 'name_point' and (
+            self._state.adding or self.natural_key is not None
+        ):
+            self.natural_key = natural_key(self.name, self.point.x, self.point.y)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and {'name', 'point'} & set(update_fields):
+                kwargs['update_fields'] = {*update_fields, 'natural_key'}
+        super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name = 'Location'
         verbose_name_plural = 'Locations'
+        indexes = [
+            GistIndex(point_geography(), name='location_point_geog_gist'),
+            models.Index(fields=['-created_at', '-id'], name='location_created_id_idx'),
+            # Incremental refreshes of the in-process index (memory_index.py).
+            models.Index(fields=['updated_at'], name='location_updated_idx'),
+            GinIndex(fields=['search_vector'], name='location_search_gin'),
+            # Serves in_cell() at every precision and index-only cell_counts().
+            models.Index(fields=['geohash_4', 'geohash_6', 'geohash_8'], name='location_geohash_idx'),
+            # Serves both `%>` filtering and `<<->` ordering for suggest.
+            GistIndex(fields=['name'], name='location_name_trgm_gist', opclasses=['gist_trgm_ops']),
+        ]
 
     @property
     def latitude(self):
@@ -22,4 +282,53 @@ class Location(models.Model):
 
     @property
     def longitude(self):
-        return self.point.x
\ No newline at end of file
+        return self.point.x
+
+class ImportCheckpoint(models.Model):
+    """
+    Records committed by an import_locations run, and the byte offset in
+    the file just past the last of them, updated in the same transaction as
+    each batch so an interrupted import resumes exactly, without reading
+    the file up to that point again.
+    """
+    source = models.CharField(max_length=500, unique=True)
+    fingerprint = models.CharField(max_length=100)
+    records = models.BigIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source} ({self.records} records)'
+
+
+class TableVersion(models.Model):
+    """
+    Change counter for a table, bumped by statement-level triggers (see
+    migration 0006) on every statement that changes rows, however it was
+    issued. Used to validate cached collection responses.
+
+    The bump locks the row until the writing transaction ends, so writers
+    to the counted table run one transaction at a time; see migration 0006.
+    """
+    name = models.CharField(max_length=63, unique=True)
+    version = models.BigIntegerField(default=0)
+    modified_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+
+class LocationChange(models.Model):
+    """
+    Ids of inserted, moved and deleted locations, logged by statement-level
+    triggers (see migration 0011) however the rows were written, with the
+    id of the writing transaction, so incremental readers of the table can
+    pick up exactly the commits they have not seen. A TRUNCATE is logged as
+    one row with a NULL location_id.
+    """
+    location_id = models.BigIntegerField(null=True)
+    xid = models.BigIntegerField(db_index=True)
+    logged_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.location_id} changed by transaction {self.xid}'
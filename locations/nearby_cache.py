@@ -0,0 +1,200 @@
+"""
+Candidate cache for the nearby endpoint.
+
+Clients ask for points that differ in the last decimals, so responses are
+not cached as such. Instead the query point is snapped to a grid cell and
+the distance rounded up to a bucket, and the ids of every location within
+that bucket (plus the cell's half-diagonal) of the cell centre are cached.
+Any point in the cell, at any distance up to the bucket, has all of its
+results among those candidates, so the view still filters and orders them
+exactly for the caller's point.
+
+Writes evict the cells whose candidate circle could contain the old or new
+position. Bumping a generation number stands in for clearing the cache, so
+a shared cache alias can be used.
+
+A request that read the table before a write committed can store its
+candidates after that write's eviction ran. Entries are therefore tagged
+with the table version (see TableVersion) read before the candidates, and
+an eviction leaves a stamp with the version current after the commit; an
+entry older than its cell's stamp is read as a miss.
+"""
+import math
+import time
+
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+
+from .conf import get_setting
+from .models import Location, TableVersion
+
+# Shortest degree of latitude, degree of longitude at the equator and
+# longest degree of latitude, in metres, and a margin for the planar
+# approximations below.
+METERS_PER_DEGREE_LAT = 110574
+METERS_PER_DEGREE_LON = 111319
+METERS_PER_DEGREE_MAX = 111694
+MARGIN = 1.01
+
+# Invalidations touching more cells than this bump the generation instead.
+MAX_INVALIDATED_KEYS = 10000
+
+GENERATION_KEY = 'nearby:generation'
+
+
+def nearby_cache():
+    alias = get_setting('NEARBY_CACHE')
+    return caches[alias] if alias else None
+
+
+def grid_shape():
+    size = get_setting('NEARBY_CACHE_GRID')
+    return size, math.ceil(180 / size), math.ceil(360 / size)
+
+
+def cell_for(lon, lat):
+    """(row, col) of the grid cell containing lon/lat."""
+    size, rows, cols = grid_shape()
+    row = min(math.floor((lat + 90) / size), rows - 1)
+    col = math.floor(((lon + 180) % 360) / size) % cols
+    return row, col
+
+
+def cell_center(row, col):
+    size = get_setting('NEARBY_CACHE_GRID')
+    south = -90 + row * size
+    west = -180 + col * size
+    return (west + min(west + size, 180)) / 2, (south + min(south + size, 90)) / 2
+
+
+def cell_radius():
+    """Upper bound, in metres, on the distance from a cell centre to its edge."""
+    size = get_setting('NEARBY_CACHE_GRID')
+    return math.hypot(size * METERS_PER_DEGREE_MAX, size * METERS_PER_DEGREE_LON) / 2
+
+
+def distance_bucket(distance):
+    """Smallest bucket covering ``distance`` metres, or None if none does."""
+    for bucket in sorted(get_setting('NEARBY_CACHE_DISTANCES')):
+        if distance <= bucket:
+            return bucket
+    return None
+
+
+def cache_key(generation, bucket, row, col):
+    return f'nearby:{generation}:{bucket}:{row}:{col}'
+
+
+def stamp_key(key):
+    return f'{key}:evicted'
+
+
+def table_version():
+    version = TableVersion.objects.filter(
+        name=Location._meta.db_table
+    ).values_list('version', flat=True).first()
+    return -1 if version is None else version
+
+
+def current_generation(cache):
+    # Seeded from the clock, so a generation lost to eviction is never reused.
+    return cache.get_or_set(GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def candidate_ids(point, distance):
+    """
+    Ids of a superset of the locations within ``distance`` metres of
+    ``point``, from the cache when possible. None when the cache is off,
+    the distance is larger than every bucket, or the cell holds more than
+    NEARBY_CACHE_MAX_IDS candidates.
+    """
+    cache = nearby_cache()
+    bucket = distance_bucket(distance)
+    if cache is None or bucket is None:
+        return None
+
+    generation = current_generation(cache)
+    row, col = cell_for(point.x, point.y)
+    key = cache_key(generation, bucket, row, col)
+    entries = cache.get_many([key, stamp_key(key)])
+    entry, evicted = entries.get(key), entries.get(stamp_key(key))
+    if isinstance(entry, tuple) and (evicted is None or entry[0] >= evicted):
+        ids = entry[1]
+        return None if ids is False else ids
+
+    # Read before the candidates, so that it is never newer than they are.
+    version = table_version()
+    lon, lat = cell_center(row, col)
+    limit = get_setting('NEARBY_CACHE_MAX_IDS')
+    ids = list(
+        Location.objects.within_distance(
+            Point(lon, lat, srid=4326), (bucket + cell_radius()) * MARGIN
+        ).order_by().values_list('pk', flat=True)[:limit + 1]
+    )
+    # False marks a cell with too many candidates to be worth caching.
+    cached = ids if len(ids) <= limit else False
+    cache.set(key, (version, cached), timeout=get_setting('NEARBY_CACHE_TIMEOUT'))
+    return None if cached is False else ids
+
+
+def cells_near(lon, lat, meters):
+    """Grid cells with a centre within ``meters`` of lon/lat."""
+    size, rows, cols = grid_shape()
+    dlat = meters / METERS_PER_DEGREE_LAT + size / 2
+    south, north = lat - dlat, lat + dlat
+    row_range = range(
+        max(math.floor((south + 90) / size), 0),
+        min(math.floor((north + 90) / size), rows - 1) + 1,
+    )
+
+    widest = max(abs(south), abs(north))
+    if widest >= 90:
+        col_range = range(cols)
+    else:
+        dlon = meters / (METERS_PER_DEGREE_LON * math.cos(math.radians(widest))) + size / 2
+        if dlon >= 180:
+            col_range = range(cols)
+        else:
+            first = math.floor((lon - dlon + 180) / size)
+            last = math.floor((lon + dlon + 180) / size)
+            col_range = range(first, last + 1)
+
+    for row in row_range:
+        for col in col_range:
+            yield row, col % cols
+
+
+def invalidate_points(points):
+    """
+    Evict the cached cells whose candidates could include any of
+    ``points``. points=None, or too many cells, invalidates every cell.
+    """
+    cache = nearby_cache()
+    if cache is None:
+        return
+    generation = current_generation(cache)
+
+    keys = set()
+    if points is not None:
+        radius = cell_radius()
+        for bucket in get_setting('NEARBY_CACHE_DISTANCES'):
+            for point in points:
+                for row, col in cells_near(point.x, point.y, (bucket + radius) * MARGIN):
+                    keys.add(cache_key(generation, bucket, row, col))
+                if len(keys) > MAX_INVALIDATED_KEYS:
+                    break
+            if len(keys) > MAX_INVALIDATED_KEYS:
+                break
+
+    if points is None or len(keys) > MAX_INVALIDATED_KEYS:
+        # Requests still holding the old generation store under keys that
+        # are never read again.
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+        return
+    # Stamps outlive any entry a request in flight can still store.
+    version = table_version()
+    cache.set_many(
+        {stamp_key(key): version for key in keys},
+        timeout=2 * get_setting('NEARBY_CACHE_TIMEOUT'),
+    )
+    cache.delete_many(keys)
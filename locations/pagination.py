@@ -0,0 +1,198 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.contrib.gis.measure import Distance
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .conf import get_setting
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a unique ordering (``keyset``).
+
+    Pages are fetched with ``WHERE (keys) > (keys of the last row served)``
+    instead of an OFFSET, so page 1000 costs the same as page 1. Cursors are
+    opaque base64 tokens; a ``-`` prefix on a key means descending order.
+    """
+    keyset = ('id',)
+    results_key = 'results'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = get_setting('SPATIAL_PAGE_SIZE')
+        self.max_page_size = get_setting('SPATIAL_MAX_PAGE_SIZE')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.position_filter(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset.order_by(*self.keyset)[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def position_filter(self, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        equal = {}
+        for key, value in zip(self.keyset, position):
+            name = key.lstrip('-')
+            lookup = 'lt' if key.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, row):
+        return [self.get_key_value(row, key.lstrip('-')) for key in self.keyset]
+
+    def get_key_value(self, row, name):
+        value = row[name] if isinstance(row, dict) else getattr(row, name)
+        if isinstance(value, Distance):
+            return value.m
+        if isinstance(value, datetime.datetime):
+            # Full microsecond precision; the keyset must round-trip exactly.
+            return value.isoformat()
+        return value
+
+    def encode_cursor(self, position):
+        payload = json.dumps(position, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        if not all(isinstance(value, (int, float, str)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.get_position(self.page[-1]))
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_envelope(self):
+        """Response members other than the page of results."""
+        return OrderedDict([('next', self.get_next_link())])
+
+    def get_results(self, data):
+        return data
+
+    def get_paginated_response(self, data):
+        response = self.get_envelope()
+        response[self.results_key] = self.get_results(data)
+        return Response(response)
+
+
+class GeoJsonKeysetPagination(KeysetPagination):
+    """Keyset pagination that keeps the FeatureCollection envelope."""
+    results_key = 'features'
+
+    def get_envelope(self):
+        envelope = OrderedDict([('type', 'FeatureCollection')])
+        envelope.update(super().get_envelope())
+        return envelope
+
+    def get_results(self, data):
+        return data['features']
+
+
+class NearbyPagination(GeoJsonKeysetPagination):
+    keyset = ('distance', 'id')
+
+
+class RoutePagination(GeoJsonKeysetPagination):
+    keyset = ('position', 'id')
+
+
+class BoundsPagination(GeoJsonKeysetPagination):
+    keyset = ('id',)
+
+
+def estimate_count(queryset):
+    """
+    Planner row estimate (pg_class.reltuples) for an unfiltered queryset, or
+    None when the queryset is filtered or the table has not been analyzed.
+    """
+    if queryset.query.where:
+        return None
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class LocationCursorPagination(KeysetPagination):
+    """
+    Cursor pagination for the location list, keyed on Location.Meta.ordering
+    and served by the (created_at, id) index.
+
+    ``count`` follows the LIST_COUNT setting: ``exact`` runs COUNT(*),
+    ``estimate`` reports pg_class.reltuples once the table is larger than
+    LIST_EXACT_COUNT_THRESHOLD rows, and ``none`` omits it.
+    """
+    keyset = ('-created_at', '-id')
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+        self.max_page_size = get_setting('LIST_MAX_PAGE_SIZE')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset)
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_count(self, queryset):
+        mode = get_setting('LIST_COUNT')
+        if mode == 'none':
+            return None
+        if mode == 'estimate':
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate > get_setting('LIST_EXACT_COUNT_THRESHOLD'):
+                return estimate
+        return queryset.count()
+
+    def get_envelope(self):
+        envelope = OrderedDict()
+        if self.count is not None:
+            envelope['count'] = self.count
+        envelope.update(super().get_envelope())
+        return envelope
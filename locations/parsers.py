@@ -0,0 +1,36 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+
+class GeoJSONParser(JSONParser):
+    media_type = 'application/geo+json'
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON, one record per line.
+
+    Returns a lazy iterator over the request body, so large uploads are
+    decoded one line at a time and never held in memory whole. Lines that
+    are not valid JSON come through as ParseError instances for the caller
+    to report alongside its own per-row errors.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.iter_records(stream, encoding)
+
+    def iter_records(self, stream, encoding):
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode(encoding))
+            except ValueError as exc:
+                yield ParseError(f'Line {number}: {exc}')
@@ -0,0 +1,113 @@
+"""
+Binary renderers for pages of locations.
+
+Each renderer encodes a FeatureColumns page (see columns.py) column by
+column. Arrow and MessagePack output need the optional ``pyarrow`` and
+``msgpack`` packages; renderers whose package is missing are not offered.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .columns import FeatureColumns
+from .flatgeobuf import write_points
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Base class for renderers that take FeatureColumns. Anything else (error
+    bodies) is rendered as JSON.
+    """
+    charset = None
+    render_style = 'binary'
+    available = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, FeatureColumns):
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data, renderer_context=renderer_context)
+        return self.render_columns(data)
+
+    def render_columns(self, columns):
+        raise NotImplementedError
+
+
+class FlatGeobufRenderer(ColumnarRenderer):
+    """FlatGeobuf with a packed Hilbert R-tree index."""
+    media_type = 'application/flatgeobuf'
+    format = 'fgb'
+
+    def render_columns(self, columns):
+        return write_points(columns.ids, columns.x, columns.y, columns.properties)
+
+
+class ArrowRenderer(ColumnarRenderer):
+    """Arrow IPC stream with the geometry as a GeoArrow ``geoarrow.point`` column."""
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    available = pyarrow is not None
+
+    def render_columns(self, columns):
+        types = {
+            'string': pyarrow.string(),
+            'float': pyarrow.float64(),
+            'datetime': pyarrow.timestamp('us', tz='UTC'),
+        }
+        geometry = pyarrow.StructArray.from_arrays(
+            [pyarrow.array(columns.x, pyarrow.float64()), pyarrow.array(columns.y, pyarrow.float64())],
+            names=['x', 'y'],
+        )
+        fields = [
+            pyarrow.field('id', pyarrow.int64(), nullable=False),
+            pyarrow.field('geometry', geometry.type, nullable=False, metadata={
+                'ARROW:extension:name': 'geoarrow.point',
+                'ARROW:extension:metadata': json.dumps({'crs': 'OGC:CRS84'}),
+            }),
+        ]
+        arrays = [pyarrow.array(columns.ids, pyarrow.int64()), geometry]
+        for name, kind, values in columns.properties:
+            fields.append(pyarrow.field(name, types[kind]))
+            arrays.append(pyarrow.array(values, types[kind]))
+
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=pyarrow.schema(fields))
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+
+class MessagePackRenderer(ColumnarRenderer):
+    """
+    MessagePack map of columns: ``id``, ``x`` and ``y`` arrays plus a
+    ``properties`` map of arrays. Timestamps use the MessagePack timestamp
+    extension type.
+    """
+    media_type = 'application/vnd.msgpack'
+    format = 'msgpack'
+    available = msgpack is not None
+
+    def render_columns(self, columns):
+        return msgpack.packb({
+            'id': columns.ids,
+            'x': columns.x,
+            'y': columns.y,
+            'properties': {name: values for name, _, values in columns.properties},
+        }, datetime=True)
+
+
+COLUMNAR_RENDERERS = [
+    renderer for renderer in (FlatGeobufRenderer, ArrowRenderer, MessagePackRenderer)
+    if renderer.available
+]
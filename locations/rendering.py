@@ -0,0 +1,135 @@
+"""
+Database-side JSON rendering.
+
+The expressions below make PostgreSQL emit each row as finished JSON text
+in exactly the format DRF's JSONRenderer produces for the location
+serializers (compact separators, Python float repr, ISO-8601 UTC
+timestamps with a ``Z`` suffix), so views can pass rows through without
+building model instances or serializer dicts.
+
+The JSON is concatenated by hand rather than built with ST_AsGeoJSON()
+and json_build_object(): those write numbers as float8 text (``-74``
+where Python writes ``-74.0``), ST_AsGeoJSON() rounds coordinates to nine
+decimals, and json_build_object() puts spaces around every colon, so
+neither output matches the serializers byte for byte.
+"""
+import json
+
+from django.db.models import F, FloatField, Func, TextField, Value
+from django.db.models.functions import Cast, Concat
+from django.http import HttpResponse
+
+from .streaming import dumps
+
+
+class JSONText(Func):
+    """
+    ``to_json(expr)::text``: an escaped JSON string. U+2028 and U+2029 are
+    escaped as well, as JSONRenderer does and to_json() does not.
+    """
+    function = 'to_json'
+    template = (
+        "replace(replace(%(function)s(%(expressions)s)::text, "
+        "chr(8232), '\\u2028'), chr(8233), '\\u2029')"
+    )
+    output_field = TextField()
+
+
+class _RepeatedArgumentFunc(Func):
+    # Templates here use their single argument several times, so its SQL
+    # and parameters are repeated rather than compiled through Func.as_sql.
+    arity = 1
+    output_field = TextField()
+    sql_template = None
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        occurrences = self.sql_template.count('{}')
+        return self.sql_template.format(*[sql] * occurrences), tuple(params) * occurrences
+
+
+class JSONFloat(_RepeatedArgumentFunc):
+    """A float8 as Python's repr() writes it: ``-74.0`` rather than ``-74``."""
+    sql_template = (
+        "CASE WHEN ({})::float8 = trunc(({})::float8) AND abs(({})::float8) < 1e16 "
+        "THEN ({})::float8::text || '.0' ELSE ({})::float8::text END"
+    )
+
+
+class JSONTimestamp(_RepeatedArgumentFunc):
+    """A timestamptz as DRF renders it with TIME_ZONE = 'UTC'."""
+    sql_template = (
+        "'\"' || to_char(({}) AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS') "
+        "|| CASE WHEN mod(extract(microseconds FROM ({}))::bigint, 1000000) <> 0 "
+        "THEN to_char(({}) AT TIME ZONE 'UTC', '.US') ELSE '' END || 'Z\"'"
+    )
+
+
+def point_x():
+    return Func('point', function='ST_X', output_field=FloatField())
+
+
+def point_y():
+    return Func('point', function='ST_Y', output_field=FloatField())
+
+
+FIELD_JSON = {
+    'id': lambda: Cast('id', TextField()),
+    'name': lambda: JSONText('name'),
+    'description': lambda: JSONText('description'),
+    'address': lambda: JSONText('address'),
+    'latitude': lambda: JSONFloat(point_y()),
+    'longitude': lambda: JSONFloat(point_x()),
+    'created_at': lambda: JSONTimestamp('created_at'),
+    'updated_at': lambda: JSONTimestamp('updated_at'),
+    'distance': lambda: JSONFloat(F('distance')),
+    'position': lambda: JSONFloat(F('position')),
+}
+
+
+def json_object(members):
+    """Concat expression for a JSON object from (key, JSON text expression) pairs."""
+    if not members:
+        return Value('{}', output_field=TextField())
+    parts = []
+    for index, (key, value) in enumerate(members):
+        parts.append(Value(('{' if index == 0 else ',') + json.dumps(key) + ':'))
+        parts.append(value)
+    parts.append(Value('}'))
+    return Concat(*parts, output_field=TextField())
+
+
+def record_json(fields):
+    """A flat JSON object, as rendered by a ModelSerializer with ``fields``."""
+    return json_object([(name, FIELD_JSON[name]()) for name in fields])
+
+
+def feature_json(fields):
+    """A GeoJSON Feature, as rendered by a GeoFeatureModelSerializer with ``fields``."""
+    geometry = Concat(
+        Value('{"type":"Point","coordinates":['),
+        JSONFloat(point_x()),
+        Value(','),
+        JSONFloat(point_y()),
+        Value(']}'),
+        output_field=TextField(),
+    )
+    properties = [(name, FIELD_JSON[name]()) for name in fields if name != 'id']
+    return json_object([
+        ('id', FIELD_JSON['id']()),
+        ('type', Value('"Feature"')),
+        ('geometry', geometry),
+        ('properties', json_object(properties)),
+    ])
+
+
+def raw_json_response(envelope, key, items):
+    """
+    Serve ``envelope`` with ``items`` (already JSON text) as the ``key``
+    array, without decoding the items.
+    """
+    head = dumps(envelope)[:-1]
+    if envelope:
+        head += ','
+    body = f'{head}{json.dumps(key)}:[{",".join(items)}]}}'
+    return HttpResponse(body.encode('utf-8'), content_type='application/json')
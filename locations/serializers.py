@@ -2,9 +2,47 @@ from rest_framework_gis.serializers import GeoFeatureModelSerializer
 from rest_framework import serializers
 from .models import Location
 
-class LocationSerializer(GeoFeatureModelSerializer):
+
+class SparseFieldsMixin:
+    """
+    Accepts a ``fields`` argument naming the subset of Meta.fields to render.
+    ``id`` and the geometry field are always kept.
+    """
+    # Model fields read by serializer fields that are not model fields
+    # themselves; anything not listed maps to the model field of that name.
+    field_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            keep = set(fields) | {'id', getattr(self.Meta, 'geo_field', None)}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def selectable_fields(cls):
+        geo_field = getattr(cls.Meta, 'geo_field', None)
+        return tuple(name for name in cls.Meta.fields if name != geo_field)
+
+    @classmethod
+    def columns_for(cls, fields):
+        """Model fields that must be loaded to render ``fields``."""
+        columns = ['id']
+        geo_field = getattr(cls.Meta, 'geo_field', None)
+        if geo_field:
+            columns.append(geo_field)
+        for name in fields:
+            for column in cls.field_columns.get(name, (name,)):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+
+class LocationSerializer(SparseFieldsMixin, GeoFeatureModelSerializer):
     latitude = serializers.ReadOnlyField()
     longitude = serializers.ReadOnlyField()
+    field_columns = {'latitude': ('point',), 'longitude': ('point',)}
     
     class Meta:
         model = Location
@@ -12,10 +50,29 @@ class LocationSerializer(GeoFeatureModelSerializer):
         fields = ('id', 'name', 'description', 'address', 'latitude', 'longitude', 'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at')
 
-class LocationListSerializer(serializers.ModelSerializer):
+class LocationListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     latitude = serializers.ReadOnlyField()
     longitude = serializers.ReadOnlyField()
+    field_columns = {'latitude': ('point',), 'longitude': ('point',)}
     
     class Meta:
         model = Location
-        fields = ('id', 'name', 'description', 'address', 'latitude', 'longitude', 'created_at')
\ No newline at end of file
+        fields = ('id', 'name', 'description', 'address', 'latitude', 'longitude', 'created_at')
+
+class LocationNearbySerializer(LocationSerializer):
+    distance = serializers.SerializerMethodField()
+    field_columns = {**LocationSerializer.field_columns, 'distance': ()}
+
+    class Meta(LocationSerializer.Meta):
+        fields = LocationSerializer.Meta.fields + ('distance',)
+
+    def get_distance(self, obj):
+        # Metres from the query point, annotated by the nearby queryset.
+        return obj.distance.m
+
+class LocationRouteSerializer(LocationSerializer):
+    position = serializers.FloatField(read_only=True)
+    field_columns = {**LocationSerializer.field_columns, 'position': ()}
+
+    class Meta(LocationSerializer.Meta):
+        fields = LocationSerializer.Meta.fields + ('position',)
@@ -0,0 +1,54 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import memory_index, nearby_cache, tiles
+from .models import Location
+
+# Sent with ``points`` (GEOS points, old and new positions) whenever
+# locations are created, changed or deleted. Bulk write paths that bypass
+# model signals send it themselves, with points=None when too many rows
+# changed to list (receivers should then assume anything may have).
+# Receivers below defer their invalidation until the write commits, so a
+# concurrent request cannot refill a cache from the old rows in between.
+locations_changed = Signal()
+
+
+@receiver(pre_save, sender=Location)
+def remember_previous_point(sender, instance, raw, **kwargs):
+    instance._previous_point = None
+    if instance.pk is not None and not raw:
+        instance._previous_point = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('point', flat=True).first()
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, **kwargs):
+    points = [instance.point]
+    previous = getattr(instance, '_previous_point', None)
+    if previous is not None and previous != instance.point:
+        points.append(previous)
+    locations_changed.send(sender=sender, points=points)
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    locations_changed.send(sender=sender, points=[instance.point])
+
+
+@receiver(locations_changed)
+def invalidate_tiles(sender, points, **kwargs):
+    transaction.on_commit(partial(tiles.invalidate_points, points))
+
+
+@receiver(locations_changed)
+def invalidate_nearby_cache(sender, points, **kwargs):
+    transaction.on_commit(partial(nearby_cache.invalidate_points, points))
+
+
+@receiver(locations_changed)
+def expire_memory_index(sender, points, **kwargs):
+    transaction.on_commit(partial(memory_index.invalidate_points, points))
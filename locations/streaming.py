@@ -0,0 +1,59 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def dumps(data):
+    """JSON text as DRF's JSONRenderer writes it, U+2028/U+2029 escapes included."""
+    text = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def keyset_chunks(rows, chunk_size):
+    """
+    Yield ``rows`` (named values_list() rows that include ``id``) in lists
+    of ``chunk_size``, each read by its own ``WHERE id > last`` query.
+
+    A server-side cursor opened outside a transaction is WITH HOLD, and
+    PostgreSQL materialises the whole result before the first fetch; short
+    keyset queries hold no cursor or transaction open while a slow client
+    reads the response.
+    """
+    rows = rows.order_by('id')
+    last = None
+    while True:
+        chunk = rows if last is None else rows.filter(id__gt=last)
+        chunk = list(chunk[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1].id
+
+
+def stream_feature_collection(rows, render, chunk_size):
+    """
+    Yield a GeoJSON FeatureCollection of ``rows`` piece by piece.
+
+    ``render`` turns one row into Feature JSON text. Rows are fetched in
+    keyset chunks (see keyset_chunks()) and one string is yielded per
+    chunk, so memory use does not grow with the number of rows and the
+    opening bracket is sent before the first fetch.
+    """
+    features = (render(row) for chunk in keyset_chunks(rows, chunk_size) for row in chunk)
+    return stream_features(features, chunk_size)
+
+
+def stream_features(features, chunk_size):
+    """Wrap an iterable of Feature JSON strings in a streamed FeatureCollection."""
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    buffer = []
+    for feature in features:
+        buffer.append(separator + feature)
+        separator = ','
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    buffer.append(']}')
+    yield ''.join(buffer)
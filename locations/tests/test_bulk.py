@@ -0,0 +1,405 @@
+import datetime
+import io
+import json
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APITestCase
+from locations.models import Location
+from locations.parsers import NDJSONParser
+
+
+def feature(name, lon, lat, **properties):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+        'properties': {'name': name, **properties}
+    }
+
+
+class BulkCreateTest(APITestCase):
+
+
+    def setUp(self):
+
+        self.url = reverse('location-bulk')
+
+    def test_feature_collection(self):
+
+        response = self.client.post(self.url, {
+            'type': 'FeatureCollection',
+            'features': [
+                feature("Empire State Building", -73.9857, 40.7484, address="20 W 34th St"),
+                feature("Central Park", -73.9654, 40.7829),
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual(response.data['error_count'], 0)
+        self.assertIn('rows_per_second', response.data)
+
+        location = Location.objects.get(name="Empire State Building")
+        self.assertEqual(location.address, "20 W 34th St")
+        self.assertAlmostEqual(location.longitude, -73.9857)
+        self.assertIsNotNone(location.created_at)
+
+    def test_ndjson(self):
+
+        body = '\n'.join(json.dumps(feature(f"Point {i}", i, i)) for i in range(5))
+        response = self.client.post(
+            self.url, body + '\n', content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 5)
+        self.assertEqual(Location.objects.count(), 5)
+
+    def test_invalid_rows_are_reported(self):
+
+        body = '\n'.join([
+            json.dumps(feature("Valid", 1, 1)),
+            json.dumps(feature("", 2, 2)),
+            '{not json',
+            json.dumps(feature("Also valid", 3, 3)),
+        ])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('name', response.data['errors'][0]['errors'])
+        self.assertEqual(
+            set(Location.objects.values_list('name', flat=True)),
+            {"Valid", "Also valid"}
+        )
+
+    def test_all_rows_invalid(self):
+
+        response = self.client.post(self.url, {
+            'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': {'name': "No geometry"}}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['inserted'], 0)
+        self.assertEqual(Location.objects.count(), 0)
+
+    def test_not_a_feature_collection(self):
+
+        response = self.client.post(
+            self.url, feature("Single", 1, 1), format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+    @override_settings(LOCATIONS={'BULK_BATCH_SIZE': 2, 'BULK_MAX_ERRORS': 1})
+    def test_batches_and_error_limit(self):
+
+        features = [feature(f"Point {i}", i, i) for i in range(5)]
+        features += [feature("", 0, 0), feature("", 0, 0)]
+        response = self.client.post(self.url, {
+            'type': 'FeatureCollection',
+            'features': features
+        }, format='json')
+
+        self.assertEqual(response.data['inserted'], 5)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual(len(response.data['errors']), 1)
+
+
+class BulkUpsertTest(APITestCase):
+
+
+    def setUp(self):
+
+        self.url = reverse('location-bulk')
+
+    def post(self, *features):
+
+        return self.client.post(self.url, {
+            'type': 'FeatureCollection',
+            'features': list(features)
+        }, format='json')
+
+    def test_rerun_is_idempotent(self):
+
+        features = [feature("Empire State Building", -73.9857, 40.7484), feature("Central Park", -73.9654, 40.7829)]
+        self.post(*features)
+        response = self.post(*features)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['inserted'], 0)
+        self.assertEqual(response.data['updated'], 0)
+        self.assertEqual(response.data['unchanged'], 2)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_changed_rows_are_updated(self):
+
+        self.post(feature("Central Park", -73.9654, 40.7829, address="Old"))
+        location = Location.objects.get()
+
+        response = self.post(
+            feature("Central Park", -73.9654, 40.7829, address="New"),
+            feature("Empire State Building", -73.9857, 40.7484),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        location.refresh_from_db()
+        self.assertEqual(location.address, "New")
+        self.assertEqual(location.natural_key, "Central Park@-73.96540,40.78290")
+
+    def test_repeated_key_in_batch_keeps_last_row(self):
+
+        response = self.post(
+            feature("Central Park", -73.9654, 40.7829, address="First"),
+            feature("Central Park", -73.9654, 40.7829, address="Second"),
+        )
+
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual(response.data['unchanged'], 0)
+        self.assertEqual(response.data['duplicates'], 1)
+        self.assertEqual(Location.objects.get().address, "Second")
+
+    def test_locations_saved_one_at_a_time_are_upserted(self):
+
+        created = self.client.post(reverse('location-list'), feature("Central Park", -73.9654, 40.7829), format='json')
+        detail_url = reverse('location-detail', kwargs={'pk': created.data['id']})
+        renamed = self.client.patch(detail_url, {'properties': {'name': "The Park"}}, format='json')
+
+        response = self.post(feature("The Park", -73.9654, 40.7829, address="New York"))
+
+        self.assertEqual(renamed.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        location = Location.objects.get()
+        self.assertEqual(location.natural_key, "The Park@-73.96540,40.78290")
+        self.assertEqual(location.address, "New York")
+
+    def test_saving_a_duplicate_key_is_rejected(self):
+
+        url = reverse('location-list')
+        self.client.post(url, feature("Central Park", -73.9654, 40.7829), format='json')
+
+        response = self.client.post(url, feature("Central Park", -73.965401, 40.7829), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+        self.assertEqual(Location.objects.count(), 1)
+
+    @override_settings(LOCATIONS={'NATURAL_KEY': 'external_id'})
+    def test_external_id_key(self):
+
+        moved = {**feature("Kiosk", 1, 1), 'id': 'kiosk-7'}
+        self.post(moved)
+        moved['geometry'] = {'type': 'Point', 'coordinates': [2, 2]}
+        response = self.post(moved, feature("No id", 3, 3), feature("No id", 3, 3))
+
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['inserted'], 2)
+        location = Location.objects.get(natural_key='kiosk-7')
+        self.assertEqual(location.longitude, 2)
+        self.assertEqual(Location.objects.filter(name="No id").count(), 2)
+
+    @override_settings(LOCATIONS={'NATURAL_KEY': 'external_id'})
+    def test_long_key_fails_only_its_feature(self):
+
+        response = self.post(
+            {**feature("Kiosk", 1, 1), 'id': 'k' * 256},
+            {**feature("Cart", 2, 2), 'id': 'cart-1'},
+        )
+
+        self.assertEqual(response.data['inserted'], 1)
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 0)
+        self.assertTrue(Location.objects.filter(natural_key='cart-1').exists())
+
+    @override_settings(LOCATIONS={'NATURAL_KEY': None})
+    def test_keys_disabled(self):
+
+        self.post(feature("Central Park", -73.9654, 40.7829))
+        self.post(feature("Central Park", -73.9654, 40.7829))
+
+        self.assertEqual(Location.objects.count(), 2)
+
+
+class BulkUpdateDeleteTest(APITestCase):
+
+
+    def setUp(self):
+
+        self.statue_of_liberty = Location.objects.create(
+            name="Statue of Liberty",
+            point=Point(-74.0445, 40.6892, srid=4326)
+        )
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.la_location = Location.objects.create(
+            name="Los Angeles",
+            point=Point(-118.2437, 34.0522, srid=4326)
+        )
+
+    def test_bulk_update_properties(self):
+
+        before = self.empire_state.updated_at
+        response = self.client.post(reverse('location-bulk_update'), {
+            'ids': [self.statue_of_liberty.pk, self.empire_state.pk, 999999],
+            'properties': {'address': "Closed"}
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 2, 'not_found': 1})
+        self.empire_state.refresh_from_db()
+        self.assertEqual(self.empire_state.address, "Closed")
+        self.assertGreater(self.empire_state.updated_at, before)
+        self.la_location.refresh_from_db()
+        self.assertEqual(self.la_location.address, '')
+
+    def test_bulk_update_geometry(self):
+
+        response = self.client.post(reverse('location-bulk_update'), {
+            'ids': [self.la_location.pk],
+            'geometry': {'type': 'Point', 'coordinates': [-118.25, 34.05]}
+        }, format='json')
+
+        self.assertEqual(response.data['updated'], 1)
+        self.la_location.refresh_from_db()
+        self.assertAlmostEqual(self.la_location.longitude, -118.25)
+        self.assertEqual(self.la_location.natural_key, "Los Angeles@-118.25000,34.05000")
+
+    def test_bulk_update_name_keeps_rounded_point(self):
+
+        kiosk = Location.objects.create(
+            name="Kiosk",
+            point=Point(-74.000001, 40.7, srid=4326)
+        )
+
+        response = self.client.post(reverse('location-bulk_update'), {
+            'ids': [kiosk.pk, self.la_location.pk],
+            'properties': {'name': "Cart"}
+        }, format='json')
+
+        self.assertEqual(response.data['updated'], 2)
+        kiosk.refresh_from_db()
+        self.la_location.refresh_from_db()
+        self.assertEqual(kiosk.natural_key, "Cart@-74.00000,40.70000")
+        self.assertEqual(self.la_location.natural_key, "Cart@-118.24370,34.05220")
+
+    def test_rows_without_key_keep_none(self):
+
+        Location.objects.filter(pk=self.la_location.pk).update(natural_key=None)
+        url = reverse('location-bulk_update')
+
+        self.client.post(url, {'ids': [self.la_location.pk], 'properties': {'name': "LA"}}, format='json')
+        self.client.post(url, {
+            'ids': [self.la_location.pk],
+            'geometry': {'type': 'Point', 'coordinates': [-118.25, 34.05]}
+        }, format='json')
+        self.la_location.refresh_from_db()
+        self.la_location.address = "Downtown"
+        self.la_location.save()
+
+        self.la_location.refresh_from_db()
+        self.assertEqual(self.la_location.name, "LA")
+        self.assertAlmostEqual(self.la_location.longitude, -118.25)
+        self.assertIsNone(self.la_location.natural_key)
+
+    def test_bulk_update_duplicate_natural_keys(self):
+
+        point = Point(-74.0, 40.7, srid=4326)
+        first = Location.objects.create(name="A", point=point)
+        second = Location.objects.create(name="B", point=point)
+        third = Location.objects.create(name="C", point=point)
+        url = reverse('location-bulk_update')
+
+        together = self.client.post(url, {
+            'ids': [first.pk, second.pk], 'properties': {'name': "X"}
+        }, format='json')
+        existing = self.client.post(url, {
+            'ids': [first.pk], 'properties': {'name': "C"}
+        }, format='json')
+
+        self.assertEqual(together.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f'{first.pk}, {second.pk}', together.data['error'])
+        self.assertEqual(existing.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(first.pk), existing.data['error'])
+        self.assertNotIn(str(third.pk), existing.data['error'])
+        first.refresh_from_db()
+        self.assertEqual(first.name, "A")
+
+    def test_bulk_update_validation(self):
+
+        url = reverse('location-bulk_update')
+
+        missing_ids = self.client.post(url, {'properties': {'address': "x"}}, format='json')
+        invalid_name = self.client.post(url, {
+            'ids': [self.la_location.pk],
+            'properties': {'name': ''}
+        }, format='json')
+        nothing = self.client.post(url, {'ids': [self.la_location.pk]}, format='json')
+
+        self.assertEqual(missing_ids.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(invalid_name.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(nothing.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete_ids(self):
+
+        response = self.client.post(reverse('location-bulk_delete'), {
+            'ids': [self.statue_of_liberty.pk, self.la_location.pk]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(Location.objects.all()), [self.empire_state])
+
+    def test_bulk_delete_spatial_and_temporal(self):
+
+        Location.objects.filter(pk=self.statue_of_liberty.pk).update(
+            created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+
+        response = self.client.post(reverse('location-bulk_delete'), {
+            'bbox': [-74.1, 40.6, -73.9, 40.8],
+            'created_before': '2021-01-01T00:00:00'
+        }, format='json')
+
+        self.assertEqual(response.data['deleted'], 1)
+        self.assertFalse(Location.objects.filter(pk=self.statue_of_liberty.pk).exists())
+
+        response = self.client.post(reverse('location-bulk_delete'), {
+            'near': {'lat': 34.05, 'lon': -118.24, 'distance': 5000}
+        }, format='json')
+
+        self.assertEqual(response.data['deleted'], 1)
+        self.assertEqual(list(Location.objects.all()), [self.empire_state])
+
+    def test_bulk_delete_requires_filter(self):
+
+        response = self.client.post(reverse('location-bulk_delete'), {}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Location.objects.count(), 3)
+
+
+class NDJSONParserTest(TestCase):
+
+
+    def test_parse_is_lazy(self):
+
+        stream = io.BytesIO(b'{"a": 1}\n\n{"b": 2}\nnope\n')
+        records = NDJSONParser().parse(stream)
+
+        self.assertEqual(next(records), {'a': 1})
+        self.assertEqual(stream.tell(), len(b'{"a": 1}\n'))
+        self.assertEqual(next(records), {'b': 2})
+        error = next(records)
+        self.assertIsInstance(error, ParseError)
+        self.assertIn('Line 4', str(error.detail))
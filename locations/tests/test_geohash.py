@@ -0,0 +1,98 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from locations.ingest import bulk_update_locations, ingest_features
+from locations.models import Location
+from .test_bulk import feature
+
+
+class GeohashTest(TestCase):
+
+
+    def setUp(self):
+
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.statue_of_liberty = Location.objects.create(
+            name="Statue of Liberty",
+            point=Point(-74.0445, 40.6892, srid=4326)
+        )
+        self.central_park = Location.objects.create(
+            name="Central Park",
+            point=Point(-73.9654, 40.7829, srid=4326)
+        )
+        self.url = reverse('location-cells')
+
+    def geohashes(self, location):
+        location.refresh_from_db()
+        return location.geohash_4, location.geohash_6, location.geohash_8
+
+    def test_set_on_save(self):
+
+        self.assertEqual(self.geohashes(self.empire_state), ('dr5r', 'dr5ru6', 'dr5ru6j2'))
+
+        self.empire_state.point = Point(-0.1276, 51.5074, srid=4326)
+        self.empire_state.save()
+
+        self.assertEqual(self.geohashes(self.empire_state), ('gcpv', 'gcpvj0', 'gcpvj0eh'))
+
+    def test_set_by_bulk_paths(self):
+
+        ingest_features([feature("Trafalgar Square", -0.1276, 51.5074)])
+        bulk_update_locations(
+            Location.objects.filter(pk=self.central_park.pk),
+            {'point': Point(-0.1276, 51.5074, srid=4326)}
+        )
+
+        self.assertEqual(Location.objects.get(name="Trafalgar Square").geohash_8, 'gcpvj0eh')
+        self.assertEqual(self.geohashes(self.central_park)[2], 'gcpvj0eh')
+
+    def test_in_cell(self):
+
+        self.assertEqual(
+            set(Location.objects.in_cell('dr5r').values_list('pk', flat=True)),
+            {self.empire_state.pk, self.statue_of_liberty.pk}
+        )
+        self.assertEqual(list(Location.objects.in_cell('dr5ru').values_list('pk', flat=True)), [self.empire_state.pk])
+        self.assertEqual(Location.objects.in_cell('dr').count(), 3)
+
+    def test_cells_action(self):
+
+        response = self.client.get(self.url, {'precision': 4})
+        inside = self.client.get(self.url, {'precision': 6, 'cell': 'DR5R'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['cell'], row['count']) for row in response.data['cells']],
+            [('dr5r', 2), ('dr72', 1)]
+        )
+        self.assertFalse(response.data['truncated'])
+        self.assertEqual(
+            [(row['cell'], row['count']) for row in inside.data['cells']],
+            [('dr5r7p', 1), ('dr5ru6', 1)]
+        )
+        self.assertAlmostEqual(inside.data['cells'][1]['latitude'], 40.7484, places=2)
+
+    def test_cells_validation(self):
+
+        self.assertEqual(self.client.get(self.url, {'precision': 5}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.url, {'precision': 4, 'cell': 'dr5ru'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(self.client.get(self.url, {'cell': 'dra'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command(self):
+
+        Location.objects.update(geohash_4=None, geohash_6=None, geohash_8=None)
+
+        call_command('backfill_geohash', batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(self.geohashes(self.statue_of_liberty), ('dr5r', 'dr5r7p', 'dr5r7p4r'))
+        self.assertFalse(Location.objects.filter(geohash_8__isnull=True).exists())
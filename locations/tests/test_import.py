@@ -0,0 +1,237 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase
+from locations.ingest import merge_staging
+from locations.models import ImportCheckpoint, Location
+
+
+class ImportLocationsCommandTest(TestCase):
+
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args):
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        call_command('import_locations', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def feature(self, name, lon, lat):
+
+        return {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'name': name, 'address': f"{name} address"}
+        }
+
+    def test_geojson(self):
+
+        path = self.write('places.geojson', json.dumps({
+            'type': 'FeatureCollection',
+            'features': [
+                self.feature("Empire State Building", -73.9857, 40.7484),
+                self.feature("Central Park", -73.9654, 40.7829),
+            ]
+        }))
+
+        stdout, _ = self.run_import(path)
+
+        self.assertIn('Imported 2 locations', stdout)
+        location = Location.objects.get(name="Central Park")
+        self.assertEqual(location.address, "Central Park address")
+        self.assertEqual(location.description, '')
+        self.assertAlmostEqual(location.latitude, 40.7829)
+        self.assertIsNotNone(location.created_at)
+
+    def test_csv(self):
+
+        path = self.write('places.csv', (
+            'name,description,lat,lon\n'
+            'Statue of Liberty,"Iconic, green",40.6892,-74.0445\n'
+            'Nowhere,,,\n'
+        ))
+
+        _, stderr = self.run_import(path)
+
+        self.assertIn('Record 2: missing or invalid lat/lon', stderr)
+        location = Location.objects.get()
+        self.assertEqual(location.description, "Iconic, green")
+        self.assertAlmostEqual(location.longitude, -74.0445)
+
+    def test_ndjson_batches_and_bad_lines(self):
+
+        lines = [json.dumps(self.feature(f"Point {i}", i, i)) for i in range(5)]
+        lines.insert(2, '{broken')
+        path = self.write('places.ndjson', '\n'.join(lines))
+
+        stdout, stderr = self.run_import(path, '--batch-size', '2')
+
+        self.assertEqual(Location.objects.count(), 5)
+        self.assertIn('Record 3: not valid JSON', stderr)
+        self.assertIn('6 records read: 5 inserted, 0 updated, 0 unchanged, 0 duplicates, 1 skipped', stdout)
+
+    def test_non_string_name_is_skipped(self):
+
+        numbered = self.feature("Unused", 1, 1)
+        numbered['properties']['name'] = 42
+        path = self.write('places.geojson', json.dumps({
+            'type': 'FeatureCollection',
+            'features': [numbered, self.feature("Central Park", -73.9654, 40.7829)]
+        }))
+
+        stdout, stderr = self.run_import(path)
+
+        self.assertIn('Record 1: name must be a string', stderr)
+        self.assertIn('2 records read: 1 inserted, 0 updated, 0 unchanged, 0 duplicates, 1 skipped', stdout)
+        self.assertEqual(Location.objects.get().name, "Central Park")
+
+    def test_null_characters_are_skipped(self):
+
+        path = self.write('places.ndjson', '\n'.join([
+            json.dumps(self.feature("Nul\x00Place", 1, 1)),
+            json.dumps(self.feature("Fine", 2, 2)),
+        ]))
+
+        _, stderr = self.run_import(path)
+
+        self.assertIn('Record 1: name must not contain null characters', stderr)
+        self.assertEqual(Location.objects.get().name, "Fine")
+
+    def test_rejected_batch_does_not_block_the_import(self):
+
+        lines = [json.dumps(self.feature(f"Point {i}", i, i)) for i in range(4)]
+        path = self.write('places.ndjson', '\n'.join(lines))
+        batches = []
+
+        def merge(cursor):
+            batches.append(cursor)
+            if len(batches) == 1:
+                raise DatabaseError("rejected")
+            return merge_staging(cursor)
+
+        with mock.patch('locations.management.commands.import_locations.merge_staging', merge):
+            stdout, stderr = self.run_import(path, '--batch-size', '2')
+
+        self.assertIn('Records 1-2: rejected', stderr)
+        self.assertIn('2 inserted', stdout)
+        self.assertEqual(ImportCheckpoint.objects.get(source=path).records, 4)
+        self.assertEqual(
+            sorted(Location.objects.values_list('name', flat=True)),
+            ["Point 2", "Point 3"]
+        )
+
+    def test_resume_from_checkpoint(self):
+
+        lines = [json.dumps(self.feature(f"Point {i}", i, i)) for i in range(4)]
+        path = self.write('places.ndjson', '\n'.join(lines))
+
+        self.run_import(path, '--batch-size', '2')
+        checkpoint = ImportCheckpoint.objects.get(source=path)
+        self.assertEqual(checkpoint.records, 4)
+        self.assertEqual(checkpoint.offset, os.path.getsize(path))
+
+        # Simulate an import interrupted after the first batch.
+        Location.objects.filter(name__in=["Point 2", "Point 3"]).delete()
+        checkpoint.records = 2
+        checkpoint.offset = len(lines[0]) + len(lines[1]) + 2
+        checkpoint.save()
+
+        stdout, _ = self.run_import(path, '--batch-size', '2')
+
+        self.assertIn('Resuming after record 2', stdout)
+        self.assertEqual(
+            sorted(Location.objects.values_list('name', flat=True)),
+            ["Point 0", "Point 1", "Point 2", "Point 3"]
+        )
+
+    def test_resume_seeks_in_every_format(self):
+
+        features = [json.dumps(self.feature(f"Caf\u00e9 {i}", i, i), ensure_ascii=False) for i in range(3)]
+        rows = [f'"Caf\u00e9\n{i}",{i},{i}\n' for i in range(3)]
+        collection = '{"type": "FeatureCollection", "features": ['
+        # Each source, and the byte offset just past its first record.
+        sources = {
+            'places.geojson': (collection + ', '.join(features) + ']}', collection + features[0]),
+            'places.csv': ('name,lat,lon\n' + ''.join(rows), 'name,lat,lon\n' + rows[0]),
+        }
+        for name, (content, first) in sources.items():
+            path = self.write(name, content)
+            self.run_import(path)
+            Location.objects.all().delete()
+            ImportCheckpoint.objects.filter(source=path).update(records=1, offset=len(first.encode()))
+
+            self.run_import(path)
+
+            self.assertEqual(Location.objects.count(), 2, name)
+            self.assertFalse(Location.objects.filter(name__endswith="0").exists(), name)
+
+    def test_changed_file_needs_restart(self):
+
+        path = self.write('places.ndjson', json.dumps(self.feature("First", 1, 1)))
+        self.run_import(path)
+
+        self.write('places.ndjson', json.dumps(self.feature("Second", 2, 2)) + '\n' * 10)
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+
+        self.run_import(path, '--restart')
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_reimport_upserts(self):
+
+        path = self.write('places.csv', (
+            'name,address,lat,lon\n'
+            'Statue of Liberty,Liberty Island,40.6892,-74.0445\n'
+            'Central Park,New York,40.7829,-73.9654\n'
+        ))
+        self.run_import(path)
+
+        path = self.write('places.csv', (
+            'name,address,lat,lon\n'
+            'Statue of Liberty,"Liberty Island, NY",40.6892,-74.0445\n'
+            'Central Park,New York,40.7829,-73.9654\n'
+        ))
+        stdout, _ = self.run_import(path, '--restart')
+
+        self.assertIn('0 inserted, 1 updated, 1 unchanged', stdout)
+        self.assertEqual(Location.objects.count(), 2)
+        self.assertEqual(
+            Location.objects.get(name="Statue of Liberty").address,
+            "Liberty Island, NY"
+        )
+
+    def test_load_sample_locations_is_idempotent(self):
+
+        call_command('load_sample_locations', stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command('load_sample_locations', stdout=stdout)
+
+        self.assertEqual(Location.objects.count(), 4)
+        self.assertIn('Created 0 locations', stdout.getvalue())
+        self.assertIn('4 locations already exist', stdout.getvalue())
+
+    def test_unknown_format(self):
+
+        path = self.write('places.txt', '')
+
+        with self.assertRaises(CommandError):
+            self.run_import(path)
@@ -0,0 +1,145 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from locations.memory_index import MemoryIndex, indexed_ids, memory_index, numpy
+from locations.models import Location, LocationChange
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class MemoryIndexTest(TestCase):
+
+
+    def setUp(self):
+
+        directory = tempfile.mkdtemp()
+        self.directory = directory
+        self.addCleanup(shutil.rmtree, directory)
+        settings = self.settings(LOCATIONS={
+            'MEMORY_INDEX': os.path.join(directory, 'locations.idx'),
+            'MEMORY_INDEX_REFRESH': 60,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Refreshes run here, in the test's transaction, not in a thread.
+        background = mock.patch.object(MemoryIndex, 'refresh_in_background')
+        self.refresh_in_background = background.start()
+        self.addCleanup(background.stop)
+
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.statue_of_liberty = Location.objects.create(
+            name="Statue of Liberty",
+            point=Point(-74.0445, 40.6892, srid=4326)
+        )
+        self.london = Location.objects.create(
+            name="Trafalgar Square",
+            point=Point(-0.1281, 51.5080, srid=4326)
+        )
+        memory_index().refresh(rebuild=True, wait=True)
+
+    def test_within_and_nearest(self):
+
+        point = Point(-73.9860, 40.7480, srid=4326)
+
+        self.assertEqual(indexed_ids(point, 1000), [self.empire_state.pk])
+        self.assertEqual(
+            set(indexed_ids(point, 10000)),
+            {self.empire_state.pk, self.statue_of_liberty.pk}
+        )
+        self.assertEqual(indexed_ids(point, k=1), [self.empire_state.pk])
+        self.assertEqual(indexed_ids(Point(-0.13, 51.5, srid=4326), k=1), [self.london.pk])
+        self.assertEqual(len(indexed_ids(point, k=5)), 3)
+
+    def test_refresh_applies_moves_and_deletes(self):
+
+        point = Point(-74.0445, 40.6892, srid=4326)
+        statue_of_liberty_id = self.statue_of_liberty.pk
+        self.assertEqual(indexed_ids(point, 500), [statue_of_liberty_id])
+
+        self.empire_state.point = Point(-74.0440, 40.6890, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empire_state.save()
+            self.statue_of_liberty.delete()
+
+        self.assertTrue(LocationChange.objects.filter(location_id=statue_of_liberty_id).exists())
+        self.assertEqual(indexed_ids(point, 500), [statue_of_liberty_id])
+        memory_index().refresh(wait=True)
+        self.assertEqual(indexed_ids(point, 500), [self.empire_state.pk])
+        self.assertEqual(memory_index().snapshot.count, 2)
+
+    def test_unmoved_changes_keep_the_file(self):
+
+        indexed_ids(Point(0, 0, srid=4326), 1000)
+        snapshot = memory_index().snapshot
+        version, refreshed = snapshot.version, snapshot.refreshed
+
+        self.london.name = "Trafalgar Sq."
+        with self.captureOnCommitCallbacks(execute=True):
+            self.london.save()
+        memory_index().refresh(wait=True)
+
+        self.assertIs(memory_index().snapshot, snapshot)
+        # The header rewritten in place is read again, so the next refresh
+        # reads the change log from this one's xmin.
+        self.assertGreater(snapshot.version, version)
+        self.assertGreaterEqual(snapshot.refreshed, refreshed)
+        memory_index().refresh(rebuild=True, wait=True)
+        self.assertIsNot(memory_index().snapshot, snapshot)
+
+    def test_changes_are_read_by_transaction(self):
+
+        # updated_at is stamped when a transaction starts, however much
+        # later it commits; the change log does not depend on it.
+        herald_square = Location.objects.create(
+            name="Herald Square",
+            point=Point(-73.9880, 40.7500, srid=4326)
+        )
+        Location.objects.filter(pk=herald_square.pk).update(
+            updated_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.UTC)
+        )
+        memory_index().refresh(wait=True)
+
+        self.assertEqual(
+            set(indexed_ids(Point(-73.9880, 40.7500, srid=4326), 500)),
+            {herald_square.pk, self.empire_state.pk}
+        )
+
+    def test_refresh_is_not_run_in_the_request(self):
+
+        self.empire_state.point = Point(-74.0440, 40.6890, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empire_state.save()
+        snapshot = memory_index().snapshot
+
+        self.assertEqual(indexed_ids(Point(-73.9857, 40.7484, srid=4326), 500), [self.empire_state.pk])
+        self.refresh_in_background.assert_called_once_with()
+        self.assertIs(memory_index().snapshot, snapshot)
+
+        path = os.path.join(self.directory, 'other.idx')
+        with self.settings(LOCATIONS={'MEMORY_INDEX': path}):
+            self.assertIsNone(indexed_ids(Point(0, 0, srid=4326), 1000))
+        self.assertEqual(self.refresh_in_background.call_count, 2)
+        self.assertFalse(os.path.exists(path))
+
+    def test_nearby_uses_index(self):
+
+        url = reverse('location-nearby')
+        first = self.client.get(url, {'lat': 40.7484, 'lon': -73.9857, 'k': 1})
+
+        # The table version for the ETag, then the page for the candidates.
+        with self.assertNumQueries(2):
+            second = self.client.get(url, {'lat': 40.6890, 'lon': -74.0440, 'distance': 2000})
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual([f['id'] for f in first.data['features']], [self.empire_state.pk])
+        self.assertEqual([f['id'] for f in second.data['features']], [self.statue_of_liberty.pk])
@@ -0,0 +1,165 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from locations.models import Location
+from locations.nearby_cache import (
+    cache_key, candidate_ids, cell_for, cells_near, current_generation, distance_bucket,
+    table_version,
+)
+from locations.signals import locations_changed
+
+NEARBY_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'nearby': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nearby-tests',
+    },
+}
+
+
+@override_settings(CACHES=NEARBY_CACHES, LOCATIONS={'NEARBY_CACHE': 'nearby'})
+class NearbyCacheTest(TestCase):
+
+
+    def setUp(self):
+
+        caches['nearby'].clear()
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.statue_of_liberty = Location.objects.create(
+            name="Statue of Liberty",
+            point=Point(-74.0445, 40.6892, srid=4326)
+        )
+        self.url = reverse('location-nearby')
+
+    def cached_key(self, lon, lat, distance):
+        cache = caches['nearby']
+        return cache_key(current_generation(cache), distance_bucket(distance), *cell_for(lon, lat))
+
+    def test_grid_helpers(self):
+
+        self.assertEqual(distance_bucket(800), 1000)
+        self.assertEqual(distance_bucket(1000), 1000)
+        self.assertIsNone(distance_bucket(50000))
+        self.assertEqual(cell_for(-73.98571, 40.74841), cell_for(-73.98579, 40.74849))
+        self.assertEqual(cell_for(180, 0), cell_for(-180, 0))
+        self.assertIn(cell_for(-73.9857, 40.7484), set(cells_near(-73.9857, 40.7484, 100)))
+        self.assertIn(cell_for(179.999, 0), set(cells_near(-179.999, 0, 1000)))
+
+    def test_nearby_points_share_candidates(self):
+
+        first = self.client.get(self.url, {'lat': 40.74841, 'lon': -73.98571, 'distance': 800})
+        key = self.cached_key(-73.98571, 40.74841, 800)
+        self.assertEqual(caches['nearby'].get(key), (table_version(), [self.empire_state.pk]))
+
+        # The table version for the ETag, then the page itself.
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url, {'lat': 40.74849, 'lon': -73.98579, 'distance': 900})
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(second.data['features']), 1)
+        self.assertEqual(second.data['features'][0]['id'], self.empire_state.pk)
+
+    def test_results_are_exact_for_the_point(self):
+
+        # The cell's candidates include the Empire State Building, but it is
+        # just beyond this caller's distance.
+        caches['nearby'].set(
+            self.cached_key(-73.9857, 40.7394, 1000),
+            (table_version(), [self.empire_state.pk, self.statue_of_liberty.pk])
+        )
+
+        response = self.client.get(self.url, {'lat': 40.7394, 'lon': -73.9857, 'distance': 900})
+
+        self.assertEqual(response.data['features'], [])
+
+    def test_k_nearest_uses_candidates(self):
+
+        self.client.get(self.url, {'lat': 40.6955, 'lon': -74.0455, 'k': 1, 'distance': 10000})
+        key = self.cached_key(-74.0455, 40.6955, 10000)
+
+        response = self.client.get(self.url, {'lat': 40.6952, 'lon': -74.0452, 'k': 1, 'distance': 10000})
+
+        self.assertEqual(len(caches['nearby'].get(key)[1]), 2)
+        self.assertEqual(len(response.data['features']), 1)
+        self.assertEqual(response.data['features'][0]['id'], self.statue_of_liberty.pk)
+
+    def test_large_distances_are_not_cached(self):
+
+        response = self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 50000})
+
+        self.assertEqual(len(response.data['features']), 2)
+        self.assertIsNone(candidate_ids(Point(-73.9857, 40.7484, srid=4326), 50000))
+
+    def test_save_invalidates_nearby_cells(self):
+
+        self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 1000})
+        key = self.cached_key(-73.9857, 40.7484, 1000)
+        london_key = self.cached_key(-0.1276, 51.5074, 1000)
+        caches['nearby'].set(london_key, (table_version(), []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name="Herald Square", point=Point(-73.9880, 40.7500, srid=4326))
+
+        self.assertIsNone(caches['nearby'].get(key))
+        self.assertEqual(caches['nearby'].get(london_key)[1], [])
+        response = self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 1000})
+        self.assertEqual(len(response.data['features']), 2)
+
+    def test_candidates_read_before_a_write_are_not_served(self):
+
+        key = self.cached_key(-73.9857, 40.7484, 1000)
+        version = table_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name="Herald Square", point=Point(-73.9880, 40.7500, srid=4326))
+        # A request that read the table before the commit stores its
+        # candidates after the eviction.
+        caches['nearby'].set(key, (version, [self.empire_state.pk]))
+
+        response = self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 1000})
+
+        self.assertEqual(len(response.data['features']), 2)
+        self.assertEqual(caches['nearby'].get(key)[0], table_version())
+
+    def test_move_and_delete_invalidate(self):
+
+        self.client.get(self.url, {'lat': 40.6892, 'lon': -74.0445, 'distance': 500})
+        key = self.cached_key(-74.0445, 40.6892, 500)
+
+        self.statue_of_liberty.point = Point(-0.1276, 51.5074, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.statue_of_liberty.save()
+
+        self.assertIsNone(caches['nearby'].get(key))
+        response = self.client.get(self.url, {'lat': 40.6892, 'lon': -74.0445, 'distance': 500})
+        self.assertEqual(response.data['features'], [])
+
+        self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 500})
+        key = self.cached_key(-73.9857, 40.7484, 500)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empire_state.delete()
+
+        self.assertIsNone(caches['nearby'].get(key))
+
+    def test_bulk_change_starts_new_generation(self):
+
+        self.client.get(self.url, {'lat': 40.7484, 'lon': -73.9857, 'distance': 1000})
+        generation = current_generation(caches['nearby'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            locations_changed.send(sender=Location, points=None)
+            # Nothing is invalidated until the change commits.
+            self.assertEqual(current_generation(caches['nearby']), generation)
+
+        self.assertNotEqual(current_generation(caches['nearby']), generation)
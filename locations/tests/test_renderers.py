@@ -0,0 +1,176 @@
+import struct
+import unittest
+
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from rest_framework.test import APITestCase
+from locations.flatgeobuf import MAGIC, level_bounds, write_points
+from locations.models import Location
+from locations.renderers import msgpack, pyarrow
+
+try:
+    from fiona.io import MemoryFile
+except ImportError:
+    MemoryFile = None
+
+
+def read_flatgeobuf(content, bbox=None):
+    """(id, name, (x, y)) of each feature, read back with GDAL through fiona."""
+    with MemoryFile(content) as memory_file, memory_file.open(driver='FlatGeobuf') as collection:
+        features = collection.filter(bbox=bbox) if bbox else collection
+        return sorted(
+            (feature['properties']['id'], feature['properties'].get('name'),
+             tuple(feature['geometry']['coordinates']))
+            for feature in features
+        )
+
+
+class BinaryRendererTest(APITestCase):
+
+
+    def setUp(self):
+
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            description="Famous skyscraper",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.central_park = Location.objects.create(
+            name="Central Park",
+            description="Urban park",
+            point=Point(-73.9654, 40.7829, srid=4326)
+        )
+        self.bounds = {
+            'min_lat': 40.6,
+            'max_lat': 40.8,
+            'min_lon': -74.1,
+            'max_lon': -73.9
+        }
+
+    def test_flatgeobuf(self):
+
+        url = reverse('location-within_bounds')
+        response = self.client.get(url, {**self.bounds, 'format': 'fgb'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/flatgeobuf')
+        self.assertTrue(response.content.startswith(MAGIC))
+
+        header_size = struct.unpack_from('<I', response.content, len(MAGIC))[0]
+        self.assertIn(b'Central Park', response.content[len(MAGIC) + 4 + header_size:])
+
+    def test_flatgeobuf_accept_header(self):
+
+        url = reverse('location-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/flatgeobuf')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content.startswith(MAGIC))
+
+    def test_next_page_in_link_header(self):
+
+        url = reverse('location-within_bounds')
+        response = self.client.get(url, {**self.bounds, 'format': 'fgb', 'page_size': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('rel="next"', response['Link'])
+
+        next_url = response['Link'][1:response['Link'].index('>')]
+        response = self.client.get(next_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('Link'))
+
+    def test_errors_are_json(self):
+
+        url = reverse('location-nearby')
+        response = self.client.get(url, {'lat': 40.7, 'format': 'fgb'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('error', response.json())
+
+    def test_retrieve_is_not_binary(self):
+
+        url = reverse('location-detail', kwargs={'pk': self.empire_state.pk})
+        response = self.client.get(url, HTTP_ACCEPT='application/flatgeobuf')
+
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+    def test_level_bounds(self):
+
+        self.assertEqual(level_bounds(1, 16), [(1, 2), (0, 1)])
+        self.assertEqual(level_bounds(16, 16), [(1, 17), (0, 1)])
+        self.assertEqual(level_bounds(20, 16), [(3, 23), (1, 3), (0, 1)])
+
+    @unittest.skipUnless(MemoryFile, "fiona is not installed")
+    def test_flatgeobuf_reads_back(self):
+
+        url = reverse('location-within_bounds')
+        empty = self.client.get(url, {'min_lat': 0, 'max_lat': 1, 'min_lon': 0, 'max_lon': 1, 'format': 'fgb'})
+        single = self.client.get(url, {**self.bounds, 'format': 'fgb', 'page_size': 1})
+        both = self.client.get(url, {**self.bounds, 'format': 'fgb'})
+
+        self.assertEqual(read_flatgeobuf(empty.content), [])
+        self.assertEqual(len(read_flatgeobuf(single.content)), 1)
+        self.assertEqual(read_flatgeobuf(both.content), sorted([
+            (self.empire_state.pk, "Empire State Building", (-73.9857, 40.7484)),
+            (self.central_park.pk, "Central Park", (-73.9654, 40.7829)),
+        ]))
+        # A bounding box filter walks the index to each feature's offset.
+        self.assertEqual(
+            read_flatgeobuf(single.content, bbox=(-74.1, 40.6, -73.9, 40.8)),
+            read_flatgeobuf(single.content)
+        )
+
+    @unittest.skipUnless(MemoryFile, "fiona is not installed")
+    def test_flatgeobuf_index_levels(self):
+
+        for count in (1, 2, 16, 17, 300):
+            ids = list(range(1, count + 1))
+            x = [-74 + i * 0.01 for i in ids]
+            y = [40 + i * 0.013 for i in ids]
+            names = [f"Point {i}" for i in ids]
+            content = write_points(ids, x, y, [('name', 'string', names)])
+
+            self.assertEqual(read_flatgeobuf(content), sorted(zip(ids, names, zip(x, y))))
+            self.assertEqual(
+                [row[0] for row in read_flatgeobuf(content, bbox=(x[-1], y[-1], x[-1], y[-1]))],
+                [count]
+            )
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+
+        url = reverse('location-nearby')
+        response = self.client.get(url, {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'distance': 10000,
+            'fields': 'name,distance',
+            'format': 'msgpack'
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['id'], [self.empire_state.pk, self.central_park.pk])
+        self.assertEqual(data['x'], [-73.9857, -73.9654])
+        self.assertEqual(data['properties']['name'], ['Empire State Building', 'Central Park'])
+        self.assertEqual(data['properties']['distance'][0], 0)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+
+        url = reverse('location-list')
+        response = self.client.get(url, {'format': 'arrow'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(
+            table.schema.field('geometry').metadata[b'ARROW:extension:name'],
+            b'geoarrow.point'
+        )
+        self.assertEqual(table.column('name').to_pylist(), ['Central Park', 'Empire State Building'])
+        self.assertEqual(table.column('geometry').to_pylist()[0], {'x': -73.9654, 'y': 40.7829})
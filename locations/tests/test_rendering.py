@@ -0,0 +1,129 @@
+import datetime
+import json
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from locations.models import Location
+
+
+class DatabaseRenderingTest(APITestCase):
+
+
+    def setUp(self):
+
+        self.integral = Location.objects.create(
+            name="Integral \"quoted\" é",
+            description="Line one\nLine two",
+            address="",
+            point=Point(-74.0, 40.0, srid=4326)
+        )
+        self.fractional = Location.objects.create(
+            name="Fractional",
+            description="Has microseconds",
+            address="Somewhere",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        # Whole-second timestamps render without a fractional part.
+        Location.objects.filter(pk=self.integral.pk).update(
+            created_at=datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+            updated_at=timezone.now().replace(microsecond=0),
+        )
+
+    def get(self, url, params):
+
+        # Keep any query string already in the URL (a "next" link's cursor).
+        parts = urlsplit(url)
+        query = urlencode([*parse_qsl(parts.query), *params.items()])
+        return self.client.get(f'{parts.path}?{query}')
+
+    def assertSameRendering(self, url, params):
+
+        python = self.get(url, {**params, 'render': 'python'})
+        database = self.get(url, {**params, 'render': 'db'})
+
+        self.assertEqual(python.status_code, status.HTTP_200_OK)
+        self.assertEqual(database.status_code, status.HTTP_200_OK)
+        self.assertEqual(database.content, python.content)
+        return database
+
+    def test_list(self):
+
+        response = self.assertSameRendering(reverse('location-list'), {})
+
+        self.assertIn(b'"created_at":"2024-01-02T03:04:05Z"', response.content)
+        self.assertIn(b'"longitude":-74.0', response.content)
+
+    def test_list_pagination(self):
+
+        response = self.assertSameRendering(reverse('location-list'), {'page_size': 1})
+        next_url = json.loads(response.content)['next']
+
+        response = self.assertSameRendering(next_url, {})
+
+        results = json.loads(response.content)['results']
+        self.assertEqual([result['name'] for result in results], [self.integral.name])
+
+    def test_nearby(self):
+
+        self.assertSameRendering(reverse('location-nearby'), {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'distance': 200000
+        })
+
+    def test_nearby_knn(self):
+
+        self.assertSameRendering(reverse('location-nearby'), {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'k': 1
+        })
+
+    def test_within_bounds(self):
+
+        self.assertSameRendering(reverse('location-within_bounds'), {
+            'min_lat': 39,
+            'max_lat': 41,
+            'min_lon': -75,
+            'max_lon': -73
+        })
+
+    def test_sparse_fields(self):
+
+        self.assertSameRendering(reverse('location-list'), {'fields': 'name,longitude'})
+        self.assertSameRendering(reverse('location-nearby'), {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'distance': 200000,
+            'omit': 'description'
+        })
+
+    def assertSameExport(self):
+
+        url = reverse('location-export')
+        python = self.client.get(url, {'render': 'python'})
+        database = self.client.get(url, {'render': 'db'})
+
+        content = b''.join(database.streaming_content)
+        self.assertEqual(content, b''.join(python.streaming_content))
+        return content
+
+    def test_export(self):
+
+        self.assertSameExport()
+
+    def test_line_separators(self):
+
+        Location.objects.filter(pk=self.fractional.pk).update(
+            name="Line\u2028separator", description="Paragraph\u2029separator"
+        )
+
+        response = self.assertSameRendering(reverse('location-list'), {})
+        export = self.assertSameExport()
+
+        self.assertIn(b'"name":"Line\\u2028separator"', response.content)
+        self.assertIn(b'"description":"Paragraph\\u2029separator"', export)
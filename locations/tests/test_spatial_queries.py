@@ -1,4 +1,8 @@
-from django.test import TestCase
+import json
+import math
+
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.gis.geos import Point
 from django.contrib.gis.measure import D
@@ -107,6 +111,106 @@ class SpatialQueryTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
             
 
+    def test_nearby_knn(self):
+        
+        url = reverse('location-nearby')
+        
+        response = self.client.get(url, {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'k': 2
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        features = response.data['features']
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features[0]['properties']['name'], 'Empire State Building')
+        self.assertEqual(features[1]['properties']['name'], 'Central Park')
+        self.assertAlmostEqual(features[0]['properties']['distance'], 0, places=3)
+        self.assertLess(
+            features[0]['properties']['distance'],
+            features[1]['properties']['distance']
+        )
+
+    def test_nearby_knn_with_max_distance(self):
+        
+        url = reverse('location-nearby')
+        
+        response = self.client.get(url, {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'distance': 5000,
+            'k': 10
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        names = [f['properties']['name'] for f in response.data['features']]
+        self.assertEqual(names, ['Empire State Building', 'Central Park'])
+
+    def test_nearby_knn_invalid_k(self):
+        
+        url = reverse('location-nearby')
+        
+        for k in (0, -1, 'ten', 100000):
+            response = self.client.get(url, {
+                'lat': 40.7484,
+                'lon': -73.9857,
+                'k': k
+            })
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearby_pagination(self):
+        
+        url = reverse('location-nearby')
+        params = {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'distance': 20000,
+            'page_size': 2
+        }
+        
+        response = self.client.get(url, params)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [f['properties']['name'] for f in response.data['features']]
+        self.assertEqual(names, ['Empire State Building', 'Central Park'])
+        self.assertIsNotNone(response.data['next'])
+        
+        response = self.client.get(response.data['next'])
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [f['properties']['name'] for f in response.data['features']]
+        self.assertEqual(names, ['Statue of Liberty'])
+        self.assertIsNone(response.data['next'])
+
+    def test_nearby_sparse_fields(self):
+        
+        url = reverse('location-nearby')
+        response = self.client.get(url, {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'fields': 'name,distance'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        properties = response.data['features'][0]['properties']
+        self.assertEqual(set(properties), {'name', 'distance'})
+        self.assertEqual(properties['name'], 'Empire State Building')
+
+    def test_nearby_invalid_cursor(self):
+        
+        url = reverse('location-nearby')
+        
+        response = self.client.get(url, {
+            'lat': 40.7484,
+            'lon': -73.9857,
+            'cursor': 'not-a-cursor'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_within_bounds(self):
         
         try:
@@ -139,6 +243,389 @@ class SpatialQueryTest(TestCase):
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_within_bounds_results(self):
+        
+        url = reverse('location-within_bounds')
+        
+        response = self.client.get(url, {
+            'min_lat': 40.6,
+            'max_lat': 40.8,
+            'min_lon': -74.1,
+            'max_lon': -73.9
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        names = {f['properties']['name'] for f in response.data['features']}
+        self.assertEqual(
+            names,
+            {'Statue of Liberty', 'Empire State Building', 'Central Park'}
+        )
+
+    def test_within_bounds_pagination(self):
+        
+        url = reverse('location-within_bounds')
+        params = {
+            'min_lat': 40.6,
+            'max_lat': 40.8,
+            'min_lon': -74.1,
+            'max_lon': -73.9,
+            'page_size': 2
+        }
+        
+        response = self.client.get(url, params)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['features']), 2)
+        self.assertIsNotNone(response.data['next'])
+        
+        first_page = [f['id'] for f in response.data['features']]
+        self.assertEqual(first_page, sorted(first_page))
+        
+        response = self.client.get(response.data['next'])
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['features']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertGreater(response.data['features'][0]['id'], first_page[-1])
+
+    def test_within_bounds_omit_fields(self):
+        
+        url = reverse('location-within_bounds')
+        response = self.client.get(url, {
+            'min_lat': 40.6,
+            'max_lat': 40.8,
+            'min_lon': -74.1,
+            'max_lon': -73.9,
+            'omit': 'description,address,created_at,updated_at'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        properties = response.data['features'][0]['properties']
+        self.assertEqual(set(properties), {'name', 'latitude', 'longitude'})
+
+    def test_within_bounds_antimeridian(self):
+        
+        fiji = Location.objects.create(
+            name="Suva",
+            point=Point(178.4419, -18.1416, srid=4326)
+        )
+        samoa = Location.objects.create(
+            name="Apia",
+            point=Point(-171.7513, -13.8333, srid=4326)
+        )
+        
+        url = reverse('location-within_bounds')
+        response = self.client.get(url, {
+            'min_lat': -25,
+            'max_lat': -10,
+            'min_lon': 170,
+            'max_lon': -165
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        ids = {f['id'] for f in response.data['features']}
+        self.assertEqual(ids, {fiji.pk, samoa.pk})
+
+    def test_within_bounds_rejects_large_box(self):
+        
+        url = reverse('location-within_bounds')
+        
+        response = self.client.get(url, {
+            'min_lat': -80,
+            'max_lat': 80,
+            'min_lon': -170,
+            'max_lon': 170
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_within_bounds_rejects_out_of_range(self):
+        
+        url = reverse('location-within_bounds')
+        
+        response = self.client.get(url, {
+            'min_lat': 40.8,
+            'max_lat': 40.7,
+            'min_lon': -74.0,
+            'max_lon': -73.9
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_within_polygon(self):
+        
+        url = reverse('location-within_polygon')
+        # A pentagon over Manhattan that leaves out the Statue of Liberty.
+        polygon = {
+            'type': 'Polygon',
+            'coordinates': [[
+                [-74.02, 40.70], [-73.94, 40.70], [-73.94, 40.80], [-73.98, 40.80], [-74.02, 40.74], [-74.02, 40.70]
+            ]]
+        }
+        
+        response = self.client.post(url, polygon, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = {f['properties']['name'] for f in response.data['features']}
+        self.assertEqual(names, {"Empire State Building", "Central Park"})
+        
+        feature = self.client.post(
+            url + '?fields=name', {'type': 'Feature', 'geometry': polygon, 'properties': {}}, format='json'
+        )
+        self.assertEqual(len(feature.data['features']), 2)
+        self.assertEqual(set(feature.data['features'][0]['properties']), {'name'})
+
+    def test_within_polygon_multipolygon(self):
+        
+        url = reverse('location-within_polygon')
+        response = self.client.post(url, {
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [[[-74.05, 40.68], [-74.04, 40.68], [-74.04, 40.69], [-74.05, 40.69], [-74.05, 40.68]]],
+                [[[-118.3, 34.0], [-118.2, 34.0], [-118.2, 34.1], [-118.3, 34.1], [-118.3, 34.0]]],
+            ]
+        }, format='json')
+        
+        names = {f['properties']['name'] for f in response.data['features']}
+        self.assertEqual(names, {"Statue of Liberty", "Los Angeles"})
+
+    @override_settings(LOCATIONS={'WITHIN_POLYGON_SUBDIVIDE_VERTICES': 8})
+    def test_within_polygon_subdivided(self):
+        
+        # A 64-vertex circle of ~5 km around the Empire State Building.
+        ring = [
+            [-73.9857 + 0.06 * math.cos(2 * math.pi * i / 64), 40.7484 + 0.045 * math.sin(2 * math.pi * i / 64)]
+            for i in range(64)
+        ]
+        ring.append(ring[0])
+        
+        response = self.client.post(
+            reverse('location-within_polygon'), {'type': 'Polygon', 'coordinates': [ring]}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = sorted(f['properties']['name'] for f in response.data['features'])
+        self.assertEqual(names, ["Central Park", "Empire State Building"])
+
+    @override_settings(LOCATIONS={'WITHIN_POLYGON_MAX_VERTICES': 4})
+    def test_within_polygon_validation(self):
+        
+        url = reverse('location-within_polygon')
+        square = [[[-74.1, 40.6], [-73.9, 40.6], [-73.9, 40.8], [-74.1, 40.8], [-74.1, 40.6]]]
+        bowtie = [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]
+        
+        for body in (
+            {'type': 'Point', 'coordinates': [0, 0]},
+            {'type': 'Polygon', 'coordinates': 'nope'},
+            {'type': 'Polygon', 'coordinates': square},
+            {'type': 'Polygon', 'coordinates': [[[0, 0], [200, 0], [0, 1], [0, 0]]]},
+        ):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            self.assertIn('error', response.data)
+        
+        with override_settings(LOCATIONS={}):
+            response = self.client.post(url, {'type': 'Polygon', 'coordinates': bowtie}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def route(self, distance):
+        
+        return {
+            'route': {
+                'type': 'LineString',
+                'coordinates': [[-74.05, 40.68], [-73.9857, 40.75], [-73.96, 40.79]]
+            },
+            'distance': distance
+        }
+
+    def test_along_route(self):
+        
+        response = self.client.post(reverse('location-along_route'), self.route(1000), format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        features = response.data['features']
+        self.assertEqual(
+            [f['properties']['name'] for f in features],
+            ["Statue of Liberty", "Empire State Building", "Central Park"]
+        )
+        positions = [f['properties']['position'] for f in features]
+        self.assertEqual(positions, sorted(positions))
+        self.assertAlmostEqual(positions[1], 9500, delta=500)
+
+    def test_along_route_narrow_corridor(self):
+        
+        response = self.client.post(reverse('location-along_route'), self.route(100), format='json')
+        
+        self.assertEqual(
+            [f['properties']['name'] for f in response.data['features']],
+            ["Empire State Building", "Central Park"]
+        )
+
+    @override_settings(LOCATIONS={'ALONG_ROUTE_SEGMENT_LENGTH': 200, 'ALONG_ROUTE_SUBDIVIDE_VERTICES': 5})
+    def test_along_route_pagination(self):
+        
+        url = reverse('location-along_route') + '?page_size=2&fields=name'
+        first = self.client.post(url, self.route(1000), format='json')
+        second = self.client.post(first.data['next'], self.route(1000), format='json')
+        
+        names = [f['properties']['name'] for f in first.data['features'] + second.data['features']]
+        self.assertEqual(names, ["Statue of Liberty", "Empire State Building", "Central Park"])
+        self.assertIsNone(second.data['next'])
+        self.assertEqual(set(second.data['features'][0]['properties']), {'name'})
+
+    def test_along_route_render_db(self):
+        
+        url = reverse('location-along_route')
+        python = self.client.post(url, self.route(1000), format='json').json()
+        database = self.client.post(url + '?render=db', self.route(1000), format='json').json()
+        
+        self.assertEqual(len(database['features']), 3)
+        for expected, feature in zip(python['features'], database['features']):
+            self.assertEqual(feature['id'], expected['id'])
+            self.assertAlmostEqual(feature['properties']['position'], expected['properties']['position'])
+
+    def test_along_route_validation(self):
+        
+        url = reverse('location-along_route')
+        line = self.route(100)['route']
+        
+        for body in (
+            {},
+            {'route': {'type': 'Point', 'coordinates': [0, 0]}},
+            {'route': {'type': 'LineString', 'coordinates': [[0, 0]]}},
+            {'route': {'type': 'LineString', 'coordinates': [[0, 0], [0, 95]]}},
+            {'route': line, 'distance': 'far'},
+            {'route': line, 'distance': 10 ** 6},
+        ):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            self.assertIn('error', response.data)
+
+    def test_nearby_batch(self):
+        
+        url = reverse('location-nearby_batch')
+        response = self.client.post(url, {
+            'points': [
+                {'lat': 40.7484, 'lon': -73.9857, 'k': 2},
+                {'lat': 34.0522, 'lon': -118.2437, 'distance': 1000},
+                {'lat': 0, 'lon': 0, 'k': 3, 'distance': 1000},
+            ]
+        }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(list(results), ['0', '1', '2'])
+        self.assertEqual(
+            [feature['properties']['name'] for feature in results['0']],
+            ["Empire State Building", "Central Park"]
+        )
+        self.assertEqual(results['0'][0]['properties']['distance'], 0)
+        self.assertEqual([feature['id'] for feature in results['1']], [self.la_location.pk])
+        self.assertEqual(results['2'], [])
+
+    def test_nearby_batch_matches_nearby(self):
+        
+        params = {'lat': 40.7128, 'lon': -74.0060, 'k': 3, 'distance': 8000}
+        single = self.client.get(reverse('location-nearby'), params)
+        batch = self.client.post(
+            reverse('location-nearby_batch'), {'points': [params]}, format='json'
+        )
+        
+        self.assertEqual(
+            [(f['id'], round(f['properties']['distance'], 3)) for f in batch.data['results']['0']],
+            [(f['id'], round(f['properties']['distance'], 3)) for f in single.data['features']]
+        )
+
+    def test_nearby_batch_sparse_fields(self):
+        
+        response = self.client.post(
+            reverse('location-nearby_batch') + '?fields=name,distance',
+            {'points': [{'lat': 40.7484, 'lon': -73.9857, 'k': 1}]},
+            format='json'
+        )
+        
+        feature = response.data['results']['0'][0]
+        self.assertEqual(set(feature['properties']), {'name', 'distance'})
+        self.assertEqual(feature['geometry']['type'], 'Point')
+
+    @override_settings(LOCATIONS={'NEARBY_BATCH_MAX_POINTS': 2, 'NEARBY_BATCH_MAX_RESULTS': 5})
+    def test_nearby_batch_limits(self):
+        
+        url = reverse('location-nearby_batch')
+        point = {'lat': 40.7484, 'lon': -73.9857}
+        
+        for body in (
+            {},
+            {'points': []},
+            {'points': [point, point, point]},
+            {'points': [point, {'lat': 40.7}]},
+            {'points': [{**point, 'k': 0}]},
+            {'points': [{**point, 'lat': 91}]},
+            {'points': [{**point, 'distance': 'far'}]},
+            {'points': [{**point, 'k': 3}, {**point, 'k': 3}]},
+        ):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            self.assertIn('error', response.data)
+
+    def test_distance_matrix(self):
+        
+        url = reverse('location-distance_matrix')
+        response = self.client.post(url, {
+            'origins': [self.empire_state.pk, {'lat': 40.6892, 'lon': -74.0445}],
+            'destinations': [self.central_park.pk, self.la_location.pk, self.empire_state.pk],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        distances = response.data['distances']
+        self.assertEqual([len(row) for row in distances], [3, 3])
+        self.assertAlmostEqual(distances[0][0], 4200, delta=200)
+        self.assertAlmostEqual(distances[0][1], 3944000, delta=5000)
+        self.assertEqual(distances[0][2], 0)
+        self.assertAlmostEqual(distances[1][2], 8300, delta=300)
+
+    def test_distance_matrix_streams_large_matrices(self):
+        
+        url = reverse('location-distance_matrix')
+        body = {
+            'origins': [self.empire_state.pk, self.statue_of_liberty.pk, {'lat': -33.8688, 'lon': 151.2093}],
+            'destinations': [self.central_park.pk, self.la_location.pk],
+        }
+        small = self.client.post(url, body, format='json').data['distances']
+        
+        with override_settings(LOCATIONS={'DISTANCE_MATRIX_SQL_CELLS': 2}):
+            response = self.client.post(url, body, format='json')
+        
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b''.join(response.streaming_content))['distances']
+        self.assertEqual(len(streamed), 3)
+        for small_row, streamed_row in zip(small, streamed):
+            for expected, value in zip(small_row, streamed_row):
+                self.assertAlmostEqual(value, expected, delta=0.01)
+
+    def test_distance_matrix_validation(self):
+        
+        url = reverse('location-distance_matrix')
+        point = {'lat': 40.7, 'lon': -74.0}
+        
+        for body in (
+            {'origins': [point]},
+            {'origins': [], 'destinations': [point]},
+            {'origins': [point], 'destinations': [999999]},
+            {'origins': [point], 'destinations': [{'lat': 40.7}]},
+            {'origins': [point], 'destinations': [{'lat': 91, 'lon': 0}]},
+            {'origins': [point], 'destinations': ['1']},
+        ):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            self.assertIn('error', response.data)
+        
+        with override_settings(LOCATIONS={'DISTANCE_MATRIX_MAX_CELLS': 3}):
+            response = self.client.post(url, {'origins': [point] * 2, 'destinations': [point] * 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_distance_calculation(self):
         
         
@@ -173,4 +660,29 @@ class SpatialQueryTest(TestCase):
             point__distance_lte=(empire_point, D(km=5))
         ).exists()
         
-        self.assertFalse(is_far)
\ No newline at end of file
+        self.assertFalse(is_far)
+
+    def test_within_distance_geography(self):
+        
+        nearby = Location.objects.within_distance(self.empire_state.point, 5000)
+        
+        self.assertIn(self.central_park, nearby)
+        self.assertNotIn(self.statue_of_liberty, nearby)
+        self.assertNotIn(self.la_location, nearby)
+
+    def test_within_distance_uses_geography_index(self):
+        
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        
+        plan = Location.objects.within_distance(self.empire_state.point, 5000).explain()
+        
+        self.assertIn('location_point_geog_gist', plan)
+
+    def test_annotate_distance_is_geodesic(self):
+        
+        location = Location.objects.annotate_distance(
+            self.empire_state.point
+        ).get(pk=self.central_park.pk)
+        
+        self.assertAlmostEqual(location.distance.km, 4.2, delta=0.2)
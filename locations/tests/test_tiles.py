@@ -0,0 +1,233 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.gis.geos import Point
+from rest_framework import status
+from locations.models import Location
+from locations.tiles import (
+    MVT_CONTENT_TYPE, tile_cache_key, tile_fields, tile_stats_key, tiles_for_point,
+)
+
+
+def file_cache_settings(location, **options):
+    return {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # Tile hit/miss counters start from zero in each test.
+            'LOCATION': location,
+        },
+        'tiles': {
+            'BACKEND': 'locations.cache.LRUFileBasedCache',
+            'LOCATION': location,
+            'TIMEOUT': None,
+            'OPTIONS': options,
+        },
+    }
+
+
+class LocationTileTest(TestCase):
+
+
+    def setUp(self):
+
+        # Tiles rendered from test data must not land in the real tile cache.
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(CACHES=file_cache_settings(cache_dir))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.location = Location.objects.create(
+            name="City Hall",
+            address="City Hall Park, New York, NY",
+            point=Point(-74.0060, 40.7128, srid=4326)
+        )
+
+    def test_tile_with_location(self):
+
+        url = reverse('location-tile', kwargs={'z': 10, 'x': 301, 'y': 385})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], MVT_CONTENT_TYPE)
+        self.assertGreater(len(response.content), 0)
+        self.assertIn(b'locations', response.content)
+
+    def test_empty_tile(self):
+
+        url = reverse('location-tile', kwargs={'z': 10, 'x': 0, 'y': 0})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+
+    def test_tile_out_of_range(self):
+
+        url = reverse('location-tile', kwargs={'z': 2, 'x': 4, 'y': 0})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_attributes_depend_on_zoom(self):
+
+        low_zoom = self.client.get(
+            reverse('location-tile', kwargs={'z': 5, 'x': 9, 'y': 12})
+        )
+        high_zoom = self.client.get(
+            reverse('location-tile', kwargs={'z': 15, 'x': 9647, 'y': 12320})
+        )
+
+        self.assertNotIn(b'City Hall', low_zoom.content)
+        self.assertIn(b'City Hall', high_zoom.content)
+
+    @override_settings(LOCATIONS={'TILE_FIELDS': {0: ('id',), 8: ('id', 'name')}})
+    def test_tile_fields_setting(self):
+
+        self.assertEqual(tile_fields(3), ('id',))
+        self.assertEqual(tile_fields(8), ('id', 'name'))
+        self.assertEqual(tile_fields(20), ('id', 'name'))
+
+
+class LocationTileCacheTest(TestCase):
+
+
+    def setUp(self):
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(CACHES=file_cache_settings(cache_dir))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.location = Location.objects.create(
+            name="City Hall",
+            point=Point(-74.0060, 40.7128, srid=4326)
+        )
+        self.url = reverse('location-tile', kwargs={'z': 15, 'x': 9647, 'y': 12320})
+
+    def test_tiles_for_point(self):
+
+        self.assertEqual(tiles_for_point(-74.0060, 40.7128, 10), [(301, 385)])
+        self.assertEqual(tiles_for_point(0, 0, 0), [(0, 0)])
+        self.assertEqual(len(tiles_for_point(0.0001, 0.0001, 1, margin=0.01)), 4)
+
+    def test_second_request_is_cache_hit(self):
+
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+
+        self.assertEqual(first.content, second.content)
+
+        stats = self.client.get(reverse('location-tile-stats')).json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['zooms'], [
+            {'zoom': 15, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5},
+        ])
+        # Counters live in the stats cache, not among the tiles.
+        self.assertIsNone(caches['tiles'].get(tile_stats_key(15, 'hits')))
+        self.assertEqual(caches['default'].get(tile_stats_key(15, 'hits')), 1)
+
+    def test_save_invalidates_covering_tiles(self):
+
+        self.client.get(self.url)
+        unrelated_key = tile_cache_key(15, 0, 0)
+        caches['tiles'].set(unrelated_key, b'cached')
+
+        self.location.name = "Renamed Hall"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.save()
+
+        self.assertIsNone(caches['tiles'].get(tile_cache_key(15, 9647, 12320)))
+        self.assertEqual(caches['tiles'].get(unrelated_key), b'cached')
+        self.assertIn(b'Renamed Hall', self.client.get(self.url).content)
+
+    def test_move_invalidates_old_and_new_tiles(self):
+
+        self.client.get(self.url)
+        new_url = reverse('location-tile', kwargs={'z': 10, 'x': 511, 'y': 340})
+        self.client.get(new_url)
+
+        self.location.point = Point(-0.1276, 51.5074, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.save()
+
+        self.assertIsNone(caches['tiles'].get(tile_cache_key(15, 9647, 12320)))
+        self.assertIsNone(caches['tiles'].get(tile_cache_key(10, 511, 340)))
+
+    def test_delete_invalidates_tiles(self):
+
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.delete()
+
+        self.assertIsNone(caches['tiles'].get(tile_cache_key(15, 9647, 12320)))
+
+
+class LRUFileBasedCacheTest(TestCase):
+
+
+    def setUp(self):
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(
+            CACHES=file_cache_settings(cache_dir, MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = caches['tiles']
+
+    def test_evicts_least_recently_used(self):
+
+        for i, key in enumerate(['a', 'b', 'c', 'd']):
+            self.cache.set(key, b'x')
+            path = self.cache._key_to_file(key)
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+        # Reading 'a' makes it the most recently used entry.
+        self.assertEqual(self.cache.get('a'), b'x')
+
+        self.cache.set('e', b'x')
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNone(self.cache.get('c'))
+        self.assertIsNotNone(self.cache.get('e'))
+
+    def test_size_limit(self):
+
+        settings_override = override_settings(
+            CACHES=file_cache_settings(self.cache._dir, MAX_SIZE=4096)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache = caches['tiles']
+
+        for i in range(10):
+            cache.set(f'key-{i}', os.urandom(1024))
+
+        self.assertLessEqual(cache.size(), 4096 + 2048)
+
+    def test_writes_do_not_scan_until_headroom_used(self):
+
+        settings_override = override_settings(
+            CACHES=file_cache_settings(self.cache._dir, MAX_ENTRIES=300, CULL_FREQUENCY=3)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache = caches['tiles']
+
+        with mock.patch.object(cache, '_entries', wraps=cache._entries) as entries:
+            for i in range(10):
+                cache.set(f'key-{i}', b'x')
+            self.assertEqual(entries.call_count, 0)
+            cache.set('key-10', b'x')
+            self.assertEqual(entries.call_count, 1)
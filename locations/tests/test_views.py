@@ -1,3 +1,8 @@
+import json
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from django.contrib.gis.geos import Point
@@ -310,6 +315,143 @@ class LocationViewSetTest(LocationAPITestCase):
         self.assertEqual(len(response.data['results']), 10)
         self.assertEqual(response.data['count'], 18)  
 
+    def test_pagination_cursor(self):
+        
+        for i in range(15):
+            Location.objects.create(
+                name=f"Pagination Test {i}",
+                point=Point(-74.0 + (i * 0.01), 40.7 + (i * 0.01), srid=4326)
+            )
+        
+        url = reverse('location-list')
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(result['id'] for result in response.data['results'])
+            url = response.data['next']
+        
+        self.assertEqual(len(seen), 18)
+        self.assertEqual(len(set(seen)), 18)
+        self.assertEqual(
+            seen,
+            list(Location.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+
+    @override_settings(LOCATIONS={'LIST_COUNT': 'none'})
+    def test_pagination_without_count(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 3)
+
+    @override_settings(LOCATIONS={'LIST_COUNT': 'exact'})
+    def test_pagination_exact_count(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url, {'page_size': 1})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_list_sparse_fields(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url, {'fields': 'name,latitude,longitude'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'name', 'latitude', 'longitude'}
+        )
+
+    def test_list_omit_fields(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url, {'omit': 'description,address'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'name', 'latitude', 'longitude', 'created_at'}
+        )
+
+    def test_sparse_fields_defer_columns(self):
+        
+        url = reverse('location-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'name'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"name"', page_query)
+        self.assertNotIn('"description"', page_query)
+        self.assertNotIn('"address"', page_query)
+
+    def test_sparse_fields_pagination(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url, {'fields': 'name', 'page_size': 2})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(response.data['next'])
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Location 1')
+
+    def test_retrieve_sparse_fields(self):
+        
+        url = reverse('location-detail', kwargs={'pk': self.location1.pk})
+        response = self.client.get(url, {'fields': 'name'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.location1.pk)
+        self.assertEqual(response.data['properties'], {'name': 'Location 1'})
+        self.assertIn('coordinates', response.data['geometry'])
+
+    def test_unknown_sparse_field(self):
+        
+        url = reverse('location-list')
+        response = self.client.get(url, {'fields': 'name,secret'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', response.data['error'])
+
+    def test_export_streams_feature_collection(self):
+        
+        url = reverse('location-export')
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(
+            [feature['id'] for feature in data['features']],
+            sorted([self.location1.pk, self.location2.pk, self.location3.pk])
+        )
+        self.assertEqual(data['features'][0]['properties']['name'], 'Location 1')
+
+    @override_settings(LOCATIONS={'EXPORT_CHUNK_SIZE': 2})
+    def test_export_across_chunks(self):
+        
+        url = reverse('location-export')
+        response = self.client.get(url)
+        
+        # One keyset query per chunk, none held open between them.
+        with self.assertNumQueries(2):
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            [feature['id'] for feature in data['features']],
+            sorted([self.location1.pk, self.location2.pk, self.location3.pk])
+        )
+
     def test_location_ordering(self):
         """Test that locations are ordered by creation date (newest first)"""
         url = reverse('location-list')
@@ -412,4 +554,281 @@ class LocationViewSetPermissionTest(LocationAPITestCase):
         response = self.client.delete(url)
         
         
-        self.assertIn(response.status_code, [status.HTTP_204_NO_CONTENT, status.HTTP_403_FORBIDDEN])
\ No newline at end of file
+        self.assertIn(response.status_code, [status.HTTP_204_NO_CONTENT, status.HTTP_403_FORBIDDEN])
+
+class LocationConditionalGetTest(LocationAPITestCase):
+
+
+    def setUp(self):
+
+        super().setUp()
+        self.location = Location.objects.create(
+            name="City Hall",
+            point=Point(-74.0060, 40.7128, srid=4326)
+        )
+        self.list_url = reverse('location-list')
+        self.detail_url = reverse('location-detail', kwargs={'pk': self.location.pk})
+
+    def test_list_not_modified(self):
+
+        first = self.client.get(self.list_url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', first)
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(1):
+            second = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, b'')
+
+    def test_writes_change_collection_etag(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+
+        Location.objects.create(name="Pier 17", point=Point(-74.0018, 40.7056, srid=4326))
+        created = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(created.status_code, status.HTTP_200_OK)
+
+        Location.objects.filter(name="Pier 17").delete()
+        deleted = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=created['ETag'])
+        self.assertEqual(deleted.status_code, status.HTTP_200_OK)
+
+    def test_no_op_write_keeps_collection_etag(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+
+        Location.objects.filter(name="Nowhere").update(address="None")
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, {'fields': 'name'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_spatial_actions_not_modified(self):
+
+        url = reverse('location-nearby')
+        params = {'lat': 40.7128, 'lon': -74.0060, 'distance': 1000}
+        etag = self.client.get(url, params)['ETag']
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_not_modified(self):
+
+        first = self.client.get(self.detail_url)
+
+        not_modified = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        since = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Other locations changing does not affect the detail ETag.
+        Location.objects.create(name="Pier 17", point=Point(-74.0018, 40.7056, srid=4326))
+        self.assertEqual(self.client.get(self.detail_url)['ETag'], first['ETag'])
+
+        self.location.name = "New City Hall"
+        self.location.save()
+        changed = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+
+    def test_missing_location_is_not_found(self):
+
+        response = self.client.get(
+            reverse('location-detail', kwargs={'pk': 999999}), HTTP_IF_NONE_MATCH='"x"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LocationSearchTest(LocationAPITestCase):
+
+
+    def setUp(self):
+
+        super().setUp()
+        self.bakery = Location.objects.create(
+            name="Corner Bakery",
+            description="Fresh bread and pastries",
+            address="12 Hudson Street",
+            point=Point(-74.0060, 40.7128, srid=4326)
+        )
+        self.cafe = Location.objects.create(
+            name="Hudson Cafe",
+            description="Coffee with a bakery counter",
+            point=Point(-74.0050, 40.7140, srid=4326)
+        )
+        self.museum = Location.objects.create(
+            name="City Museum",
+            description="Exhibits",
+            address="1 Museum Mile",
+            point=Point(-73.9632, 40.7794, srid=4326)
+        )
+
+    def test_list_search_orders_by_rank(self):
+
+        response = self.client.get(reverse('location-list'), {'q': 'bakery'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # A name match outranks a description match.
+        self.assertEqual(
+            [result['name'] for result in response.data['results']],
+            ["Corner Bakery", "Hudson Cafe"]
+        )
+
+    def test_list_search_pagination(self):
+
+        url = reverse('location-list')
+        first = self.client.get(url, {'q': 'bakery', 'page_size': 1, 'fields': 'name'})
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(first.data['results'][0]['name'], "Corner Bakery")
+        self.assertEqual(second.data['results'][0]['name'], "Hudson Cafe")
+        self.assertIsNone(second.data['next'])
+
+    def test_search_pages_every_row_once(self):
+
+        # Repeated words and different lengths give non-round ranks, and
+        # each variant appears three times, so pages split ties.
+        for copy in range(3):
+            for repeats in range(1, 5):
+                Location.objects.create(
+                    name=f"Bakery {copy}",
+                    description=" ".join(["bakery"] * repeats + ["bread"] * copy),
+                    point=Point(-74.0 + repeats / 1000, 40.7, srid=4326)
+                )
+        expected = set(
+            Location.objects.search('bakery').values_list('pk', flat=True)
+        )
+
+        seen = []
+        response = self.client.get(reverse('location-list'), {'q': 'bakery', 'page_size': 5})
+        while True:
+            seen += [result['id'] for result in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+    def test_search_syntax(self):
+
+        url = reverse('location-list')
+        stemmed = self.client.get(url, {'q': 'pastry'})
+        excluded = self.client.get(url, {'q': 'hudson -coffee'})
+
+        self.assertEqual([r['name'] for r in stemmed.data['results']], ["Corner Bakery"])
+        self.assertEqual([r['name'] for r in excluded.data['results']], ["Corner Bakery"])
+
+    def test_search_follows_updates(self):
+
+        self.museum.description = "Exhibits and a bakery"
+        self.museum.save()
+
+        response = self.client.get(reverse('location-list'), {'q': 'bakery'})
+
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_nearby_search(self):
+
+        url = reverse('location-nearby')
+        response = self.client.get(url, {'lat': 40.7128, 'lon': -74.0060, 'distance': 10000, 'q': 'museum'})
+        knn = self.client.get(url, {'lat': 40.7128, 'lon': -74.0060, 'k': 1, 'q': 'museum'})
+
+        self.assertEqual([f['id'] for f in response.data['features']], [self.museum.pk])
+        self.assertEqual([f['id'] for f in knn.data['features']], [self.museum.pk])
+
+    def test_within_bounds_search(self):
+
+        response = self.client.get(reverse('location-within_bounds'), {
+            'min_lat': 40.7, 'max_lat': 40.8, 'min_lon': -74.1, 'max_lon': -73.9, 'q': 'bakery'
+        })
+
+        self.assertEqual(
+            [f['id'] for f in response.data['features']],
+            [self.bakery.pk, self.cafe.pk]
+        )
+
+    def test_admin_search_uses_prefixes(self):
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('admin:locations_location_changelist'), {'q': 'bak hud'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {location.pk for location in response.context['cl'].result_list},
+            {self.bakery.pk, self.cafe.pk}
+        )
+
+
+class LocationSuggestTest(LocationAPITestCase):
+
+
+    def setUp(self):
+
+        super().setUp()
+        self.url = reverse('location-suggest')
+        self.empire_state = Location.objects.create(
+            name="Empire State Building",
+            address="350 Fifth Avenue",
+            point=Point(-73.9857, 40.7484, srid=4326)
+        )
+        self.empire_diner = Location.objects.create(
+            name="Empire Diner",
+            point=Point(-0.1276, 51.5074, srid=4326)
+        )
+        self.central_park = Location.objects.create(
+            name="Central Park",
+            point=Point(-73.9654, 40.7829, srid=4326)
+        )
+
+    def test_suggest_matches_prefixes_and_typos(self):
+
+        prefix = self.client.get(self.url, {'q': 'centr'})
+        typo = self.client.get(self.url, {'q': 'empir stat'})
+
+        self.assertEqual(prefix.status_code, status.HTTP_200_OK)
+        self.assertEqual([s['id'] for s in prefix.data['results']], [self.central_park.pk])
+        self.assertEqual(typo.data['results'][0]['id'], self.empire_state.pk)
+        self.assertEqual(
+            set(typo.data['results'][0]),
+            {'id', 'name', 'address', 'latitude', 'longitude', 'similarity'}
+        )
+
+    def test_suggest_limit(self):
+
+        response = self.client.get(self.url, {'q': 'empire', 'limit': 1})
+
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_suggest_biased_by_distance(self):
+
+        near_london = self.client.get(self.url, {'q': 'empire', 'lat': 51.5, 'lon': -0.12})
+        near_nyc = self.client.get(self.url, {'q': 'empire', 'lat': 40.75, 'lon': -73.98})
+
+        self.assertEqual(near_london.data['results'][0]['id'], self.empire_diner.pk)
+        self.assertEqual(near_nyc.data['results'][0]['id'], self.empire_state.pk)
+        self.assertLess(near_london.data['results'][0]['distance'], 1000)
+
+    def test_suggest_short_and_missing_text(self):
+
+        self.assertEqual(self.client.get(self.url, {'q': 'e'}).data['results'], [])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.url, {'q': 'empire', 'lat': 40.7}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(self.url, {'q': 'empire', 'limit': 0}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
@@ -0,0 +1,197 @@
+import math
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from .conf import get_setting
+from .models import Location
+
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+MVT_LAYER = 'locations'
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+# Latitude limit of the Web Mercator tile grid.
+MERCATOR_MAX_LAT = 85.0511287798
+
+
+def tile_in_range(z, x, y):
+    return 0 <= z <= get_setting('TILE_MAX_ZOOM') and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_fields(z):
+    """Location columns carried as feature attributes at zoom ``z``."""
+    fields = ()
+    for min_zoom, names in sorted(get_setting('TILE_FIELDS').items()):
+        if z >= min_zoom:
+            fields = tuple(names)
+    return fields
+
+
+def tile_columns(z):
+    opts = Location._meta
+    columns = []
+    for name in tile_fields(z):
+        if name == 'id':
+            continue
+        field = opts.get_field(name)
+        if not field.concrete or field.name == 'point':
+            raise ImproperlyConfigured(f'TILE_FIELDS: {name!r} cannot be a tile attribute')
+        columns.append(f'l.{connection.ops.quote_name(field.column)}')
+    return columns
+
+
+def render_tile(z, x, y):
+    """
+    Build the Mapbox Vector Tile for z/x/y entirely in PostGIS and return the
+    encoded bytes. Candidates are selected with && on the point GiST index,
+    using an envelope widened by the tile buffer so labels are not clipped.
+    """
+    columns = ''.join(f', {column}' for column in tile_columns(z))
+    table = connection.ops.quote_name(Location._meta.db_table)
+    sql = f'''
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+                   ST_Transform(
+                       ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s),
+                       4326
+                   ) AS search
+        )
+        SELECT ST_AsMVT(features, %(layer)s, %(extent)s, 'geom', 'id')
+        FROM (
+            SELECT l.id,
+                   ST_AsMVTGeom(
+                       ST_Transform(l.point, 3857), bounds.tile,
+                       %(extent)s, %(buffer)s, true
+                   ) AS geom{columns}
+            FROM {table} l, bounds
+            WHERE l.point && bounds.search
+        ) AS features
+    '''
+    params = {
+        'z': z,
+        'x': x,
+        'y': y,
+        'margin': MVT_BUFFER / MVT_EXTENT,
+        'layer': MVT_LAYER,
+        'extent': MVT_EXTENT,
+        'buffer': MVT_BUFFER,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+
+def tiles_for_point(lon, lat, z, margin=0.0):
+    """
+    Tiles at zoom ``z`` whose envelope, widened by ``margin`` tile widths,
+    contains the point.
+    """
+    n = 2 ** z
+    lat = max(-MERCATOR_MAX_LAT, min(MERCATOR_MAX_LAT, lat))
+    fx = (lon + 180) / 360 * n
+    fy = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    xs = range(max(math.floor(fx - margin), 0), min(math.floor(fx + margin), n - 1) + 1)
+    ys = range(max(math.floor(fy - margin), 0), min(math.floor(fy + margin), n - 1) + 1)
+    return [(x, y) for x in xs for y in ys]
+
+
+def tile_cache():
+    return caches[get_setting('TILE_CACHE')]
+
+
+def tile_cache_key(z, x, y):
+    return f'tile:{z}:{x}:{y}'
+
+
+def tile_stats_key(z, outcome):
+    return f'tile-stats:{z}:{outcome}'
+
+
+def tile_stats_cache():
+    return caches[get_setting('TILE_STATS_CACHE')]
+
+
+def record_lookup(z, outcome):
+    # Counted outside the tile cache: a write there can cull, and the file
+    # backend's incr() is not atomic.
+    cache = tile_stats_cache()
+    key = tile_stats_key(z, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First lookup (or evicted); a racing add() means another request
+        # created the counter, so count on it.
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                pass
+
+
+def get_tile(z, x, y):
+    """Cached render_tile(); records a hit or miss for the zoom level."""
+    cache = tile_cache()
+    key = tile_cache_key(z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        record_lookup(z, 'misses')
+        tile = render_tile(z, x, y)
+        cache.set(key, tile)
+    else:
+        record_lookup(z, 'hits')
+    return tile
+
+
+def invalidate_points(points):
+    """
+    Evict cached tiles, at every zoom, that cover any of ``points`` (GEOS
+    points in EPSG:4326). Large batches, or points=None, clear the whole
+    tile cache instead.
+    """
+    cache = tile_cache()
+    if points is None or len(points) > get_setting('TILE_CACHE_CLEAR_THRESHOLD'):
+        cache.clear()
+        return
+
+    margin = MVT_BUFFER / MVT_EXTENT
+    keys = set()
+    for point in points:
+        for z in range(get_setting('TILE_MAX_ZOOM') + 1):
+            for x, y in tiles_for_point(point.x, point.y, z, margin):
+                keys.add(tile_cache_key(z, x, y))
+    cache.delete_many(keys)
+
+
+def tile_cache_stats():
+    cache = tile_cache()
+    zooms = range(get_setting('TILE_MAX_ZOOM') + 1)
+    counters = tile_stats_cache().get_many(
+        [tile_stats_key(z, outcome) for z in zooms for outcome in ('hits', 'misses')]
+    )
+
+    def summary(hits, misses):
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else None,
+        }
+
+    levels = []
+    for z in zooms:
+        hits = counters.get(tile_stats_key(z, 'hits'), 0)
+        misses = counters.get(tile_stats_key(z, 'misses'), 0)
+        if hits or misses:
+            levels.append({'zoom': z, **summary(hits, misses)})
+
+    stats = summary(
+        sum(level['hits'] for level in levels),
+        sum(level['misses'] for level in levels),
+    )
+    stats['zooms'] = levels
+    if hasattr(cache, 'size'):
+        stats['size_bytes'] = cache.size()
+    return stats
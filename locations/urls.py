@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LocationViewSet
+from .views import LocationTileCacheStatsView, LocationTileView, LocationViewSet
 
 router = DefaultRouter()
 router.register(r'locations', LocationViewSet, basename='location')
 
 urlpatterns = [
+    path('locations/tiles/<int:z>/<int:x>/<int:y>.pbf', LocationTileView.as_view(), name='location-tile'),
+    path('locations/tiles/stats/', LocationTileCacheStatsView.as_view(), name='location-tile-stats'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,21 +1,280 @@
+import datetime
+import hashlib
+import json
+import math
+import re
+from operator import attrgetter
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import D
-from django.contrib.gis.db.models.functions import Distance
-from .models import Location
-from .serializers import LocationSerializer, LocationListSerializer
+from rest_framework.settings import api_settings
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, Point
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views import View
+from .batch import nearest_batch
+from .columns import feature_columns, feature_dict, feature_rows
+from .matrix import is_small, matrix_rows, sql_rows
+from .memory_index import indexed_ids
+from .conf import get_setting
+from .ingest import (
+    NaturalKeyConflict, bulk_delete_locations, bulk_update_locations, ingest_features,
+)
+from .models import GEOHASH_PRECISIONS, Location, TableVersion
+from .nearby_cache import candidate_ids
+from .parsers import GeoJSONParser, NDJSONParser
+from .pagination import (
+    BoundsPagination, LocationCursorPagination, NearbyPagination, RoutePagination,
+)
+from .renderers import COLUMNAR_RENDERERS, ColumnarRenderer
+from .rendering import feature_json, point_x, point_y, raw_json_response, record_json
+from .serializers import (
+    LocationSerializer, LocationListSerializer, LocationNearbySerializer, LocationRouteSerializer,
+)
+from .streaming import dumps, stream_feature_collection
+from .tiles import MVT_CONTENT_TYPE, get_tile, tile_cache_stats, tile_in_range
+
+
+GEOHASH_RE = re.compile(r'^[0-9b-hjkmnp-z]{1,8}$')
+
+
+def field_list(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class ConditionalResponse(Exception):
+    """Carries a 304 (or 412) response for a conditional request out of initial()."""
+
+    def __init__(self, response):
+        self.response = response
+
 
 class LocationViewSet(viewsets.ModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
+    pagination_class = LocationCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERERS]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, GeoJSONParser, NDJSONParser]
+    # Read-only actions that accept ?fields= and ?omit=.
+    sparse_field_actions = (
+        'list', 'retrieve', 'nearby', 'within_bounds', 'within_polygon', 'along_route',
+        'nearby_batch',
+    )
+    # Actions that can answer with the binary renderers in renderers.py.
+    columnar_actions = ('list', 'nearby', 'within_bounds', 'within_polygon', 'along_route')
+    # Actions that accept ?q= full-text search.
+    search_actions = ('list', 'nearby', 'within_bounds')
+    # Read-only actions that send ETag/Last-Modified and honour conditional GETs.
+    conditional_actions = ('list', 'retrieve', 'nearby', 'within_bounds', 'suggest', 'cells')
+    validators = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+        self.validators = self.get_validators()
+        if self.validators is None:
+            return
+        etag, modified = self.validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(modified.timestamp())
+        )
+        if response is not None:
+            raise ConditionalResponse(response)
+
+    def get_validators(self):
+        """
+        (ETag, Last-Modified) for the response, read without touching the
+        rows it will contain: the location's updated_at for retrieve, and
+        the location table's version (see TableVersion) for collections.
+        None when there is nothing to validate against.
+        """
+        if self.action == 'retrieve':
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            try:
+                modified = Location.objects.filter(pk=lookup).values_list(
+                    'updated_at', flat=True
+                ).first()
+            except ValueError:
+                return None
+            if modified is None:
+                return None
+            source = f'{lookup}:{modified.isoformat()}'
+        else:
+            row = TableVersion.objects.filter(
+                name=Location._meta.db_table
+            ).values_list('version', 'modified_at').first()
+            if row is None:
+                return None
+            version, modified = row
+            source = f'v{version}'
+
+        # The URL (filters, fields, cursor, format) and the negotiated media
+        # type select the representation.
+        key = '\n'.join([source, self.request.get_full_path(), self.request.accepted_media_type])
+        return f'"{hashlib.sha1(key.encode()).hexdigest()}"', modified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.validators is not None and response.status_code in (200, 304):
+            etag, modified = self.validators
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified.timestamp())
+            patch_vary_headers(response, ['Accept'])
+        return response
 
     def get_serializer_class(self):
         if self.action == 'list':
             return LocationListSerializer
+        if self.action in ('nearby', 'nearby_batch'):
+            return LocationNearbySerializer
+        if self.action == 'along_route':
+            return LocationRouteSerializer
         return LocationSerializer
 
+    def get_sparse_fields(self):
+        """
+        Serializer fields selected with ?fields= and/or ?omit=, or None when
+        the full representation was asked for. ``id`` is always included.
+        """
+        params = self.request.query_params
+        if self.action not in self.sparse_field_actions:
+            return None
+        if 'fields' not in params and 'omit' not in params:
+            return None
+
+        available = self.get_serializer_class().selectable_fields()
+        include = field_list(params.get('fields', ''))
+        omit = field_list(params.get('omit', ''))
+        unknown = sorted(set(include + omit) - set(available))
+        if unknown:
+            raise ValidationError({'error': f'Unknown fields: {", ".join(unknown)}'})
+        return tuple(
+            name for name in available
+            if name == 'id' or ((not include or name in include) and name not in omit)
+        )
+
+    def get_search_text(self):
+        """The ?q= search text, or None when not searching."""
+        if self.action not in self.search_actions:
+            return None
+        return self.request.query_params.get('q', '').strip() or None
+
+    def rank_pagination(self, paginator):
+        """Page search results by rank, best first, instead of the usual order."""
+        if self.get_search_text() is not None:
+            paginator.keyset = ('-rank', 'id')
+        return paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        text = self.get_search_text()
+        if text is not None:
+            queryset = queryset.search(text)
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        # Columns no selected field reads are left out of the SELECT.
+        columns = self.get_serializer_class().columns_for(fields)
+        if self.action == 'list':
+            # Cursor keys are read from every row of the page.
+            model_fields = {field.name for field in Location._meta.concrete_fields}
+            columns += [
+                key.lstrip('-') for key in self.paginator.keyset if key.lstrip('-') in model_fields
+            ]
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in self.columnar_actions:
+            return renderers
+        return [renderer for renderer in renderers if not isinstance(renderer, ColumnarRenderer)]
+
+    def renders_columns(self):
+        return isinstance(self.request.accepted_renderer, ColumnarRenderer)
+
+    def get_columnar_page(self, queryset, paginator):
+        """
+        A page as FeatureColumns for the binary renderers, read straight from
+        values_list() rows. The next page is linked from the Link header.
+        """
+        fields = self.get_sparse_fields() or self.get_serializer_class().selectable_fields()
+        keys = [key.lstrip('-') for key in paginator.keyset]
+        rows = feature_rows(queryset, fields, keys)
+        page = paginator.paginate_queryset(rows, self.request, view=self)
+        headers = {}
+        next_link = paginator.get_next_link()
+        if next_link is not None:
+            headers['Link'] = f'<{next_link}>; rel="next"'
+        return Response(feature_columns(page, fields), headers=headers)
+
+    def render_in_database(self):
+        """Whether PostgreSQL should render the response JSON (?render=db)."""
+        default = 'db' if get_setting('DB_RENDERING') else 'python'
+        return self.request.query_params.get('render', default) == 'db'
+
+    def get_json_expression(self):
+        serializer_class = self.get_serializer_class()
+        fields = self.get_sparse_fields() or serializer_class.selectable_fields()
+        if issubclass(serializer_class, GeoFeatureModelSerializer):
+            return feature_json(fields)
+        return record_json(fields)
+
+    def get_db_rendered_page(self, queryset, paginator):
+        keys = [key.lstrip('-') for key in paginator.keyset]
+        rows = queryset.annotate(
+            rendered_json=self.get_json_expression()
+        ).values('rendered_json', *keys)
+        page = paginator.paginate_queryset(rows, self.request, view=self)
+        return raw_json_response(
+            paginator.get_envelope(),
+            paginator.results_key,
+            [row['rendered_json'] for row in page],
+        )
+
+    def list(self, request, *args, **kwargs):
+        self.rank_pagination(self.paginator)
+        if self.renders_columns():
+            queryset = self.filter_queryset(self.get_queryset())
+            return self.get_columnar_page(queryset, self.paginator)
+        if self.render_in_database():
+            queryset = self.filter_queryset(self.get_queryset())
+            return self.get_db_rendered_page(queryset, self.paginator)
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        self.save_with_natural_key(serializer)
+
+    def perform_update(self, serializer):
+        self.save_with_natural_key(serializer)
+
+    def save_with_natural_key(self, serializer):
+        # natural_key is the only unique column a client's data can clash on.
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({'error': 'A location with this name at this point already exists'})
+
     @action(detail=False, methods=['get'])
     def nearby(self, request):
         """
@@ -24,13 +283,22 @@ class LocationViewSet(viewsets.ModelViewSet):
         Query Parameters:
         - lat: Latitude (required)
         - lon: Longitude (required)
-        - distance: Distance in meters (default: 1000)
+        - distance: Distance in meters (default: 1000; optional cap when k is given)
+        - k: Return only the k nearest locations (index-ordered KNN search)
+        - q: Full-text search on name, address and description (results stay
+          ordered by distance)
+        - fields / omit: Comma-separated properties to include / leave out
+        - page_size: Results per page (default: 100, maximum: 1000)
+        - cursor: Opaque cursor taken from the previous page's "next" link
+        - render: "db" to have PostgreSQL render the JSON
         
         Example: /api/locations/nearby/?lat=40.7128&lon=-74.0060&distance=5000
+        Example: /api/locations/nearby/?lat=40.7128&lon=-74.0060&k=20
         """
         lat = request.query_params.get('lat')
         lon = request.query_params.get('lon')
         distance = request.query_params.get('distance', 1000)
+        k = request.query_params.get('k')
 
         if not lat or not lon:
             return Response(
@@ -42,22 +310,72 @@ class LocationViewSet(viewsets.ModelViewSet):
             lat = float(lat)
             lon = float(lon)
             distance = float(distance)
+            if k is not None:
+                k = int(k)
         except ValueError:
             return Response(
                 {'error': 'Invalid parameter values'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        max_k = get_setting('NEARBY_MAX_K')
+        if k is not None and not 1 <= k <= max_k:
+            return Response(
+                {'error': f'k must be between 1 and {max_k}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         user_point = Point(lon, lat, srid=4326)
+        bounded = k is None or 'distance' in request.query_params
+        # Candidates from the in-process index or the grid-cell cache, when
+        # enabled; the filters below still apply exactly to the point.
+        cached_ids = self.get_candidate_ids(user_point, distance if bounded else None, k)
         
-        nearby_locations = Location.objects.filter(
-            point__distance_lte=(user_point, D(m=distance))
-        ).annotate(
-            distance=Distance('point', user_point)
-        ).order_by('distance')
+        if k is None:
+            nearby_locations = self.get_queryset().within_distance(user_point, distance)
+            if cached_ids is not None:
+                nearby_locations = nearby_locations.filter(pk__in=cached_ids)
+        else:
+            # The <-> operator walks the GiST index in distance order, so only
+            # k rows are visited; exact distances are then computed for those
+            # rows alone.
+            candidates = Location.objects.order_by_proximity(user_point)
+            if self.get_search_text() is not None:
+                # The k nearest matches, not the matches among the k nearest.
+                candidates = candidates.search(self.get_search_text())
+            if bounded:
+                candidates = candidates.within_distance(user_point, distance)
+            if cached_ids is not None:
+                candidates = candidates.filter(pk__in=cached_ids)
+            nearby_locations = self.get_queryset().filter(
+                pk__in=candidates.values('pk')[:k]
+            )
 
-        serializer = self.get_serializer(nearby_locations, many=True)
-        return Response(serializer.data)
+        nearby_locations = nearby_locations.annotate_distance(user_point)
+
+        paginator = NearbyPagination()
+        if self.renders_columns():
+            return self.get_columnar_page(nearby_locations, paginator)
+        if self.render_in_database():
+            return self.get_db_rendered_page(nearby_locations, paginator)
+        page = paginator.paginate_queryset(nearby_locations, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_candidate_ids(self, point, distance, k):
+        """
+        Ids of a superset of the nearby results (``distance`` is None when
+        unbounded), or None to search the whole table.
+        """
+        if k is not None and self.get_search_text() is not None:
+            # The k nearest matches can lie beyond the k nearest locations.
+            k = None
+        if k is None and distance is None:
+            return None
+        ids = indexed_ids(point, distance, k)
+        if ids is None and distance is not None:
+            ids = candidate_ids(point, distance)
+        return ids
 
     @action(detail=False, methods=['get'])
     def within_bounds(self, request):
@@ -66,6 +384,14 @@ class LocationViewSet(viewsets.ModelViewSet):
         
         Query Parameters:
         - min_lat, max_lat, min_lon, max_lon (all required)
+        - q: Full-text search on name, address and description; results are
+          then ordered by rank
+        - fields / omit: Comma-separated properties to include / leave out
+        - page_size: Results per page (default: 100, maximum: 1000)
+        - cursor: Opaque cursor taken from the previous page's "next" link
+        - render: "db" to have PostgreSQL render the JSON
+        
+        Boxes with min_lon > max_lon are treated as crossing the antimeridian.
         
         Example: /api/locations/within_bounds/?min_lat=40.7&max_lat=40.8&min_lon=-74.1&max_lon=-74.0
         """
@@ -80,12 +406,629 @@ class LocationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        locations = Location.objects.filter(
-            point__latitude__gte=min_lat,
-            point__latitude__lte=max_lat,
-            point__longitude__gte=min_lon,
-            point__longitude__lte=max_lon,
+        if not (-90 <= min_lat <= max_lat <= 90
+                and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            return Response(
+                {'error': 'Bounding box is out of range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        width = max_lon - min_lon if min_lon <= max_lon else 360 - (min_lon - max_lon)
+        max_area = get_setting('BOUNDS_MAX_AREA')
+        if width * (max_lat - min_lat) > max_area:
+            return Response(
+                {'error': f'Bounding box exceeds {max_area} square degrees'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        locations = self.get_queryset().within_bbox(min_lon, min_lat, max_lon, max_lat)
+
+        paginator = self.rank_pagination(BoundsPagination())
+        if self.renders_columns():
+            return self.get_columnar_page(locations, paginator)
+        if self.render_in_database():
+            return self.get_db_rendered_page(locations, paginator)
+        page = paginator.paginate_queryset(locations, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def within_polygon(self, request):
+        """
+        Find locations inside a polygon.
+        
+        Body: a GeoJSON Polygon or MultiPolygon geometry, or a Feature with
+        one, in lon/lat. At most WITHIN_POLYGON_MAX_VERTICES vertices.
+        
+        Query Parameters:
+        - fields / omit: Comma-separated properties to include / leave out
+        - page_size: Results per page (default: 100, maximum: 1000)
+        - cursor: Opaque cursor taken from the previous page's "next" link
+          (send the same body again)
+        - render: "db" to have PostgreSQL render the JSON
+        
+        Example: {"type": "Polygon", "coordinates": [[[-74.02, 40.70], [-73.97, 40.70], [-73.93, 40.80], [-74.02, 40.70]]]}
+        """
+        polygon = self.get_polygon(request.data)
+        locations = self.get_queryset().within_polygon(
+            polygon, get_setting('WITHIN_POLYGON_SUBDIVIDE_VERTICES')
         )
 
-        serializer = self.get_serializer(locations, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        paginator = BoundsPagination()
+        if self.renders_columns():
+            return self.get_columnar_page(locations, paginator)
+        if self.render_in_database():
+            return self.get_db_rendered_page(locations, paginator)
+        page = paginator.paginate_queryset(locations, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_polygon(self, data):
+        """Validated GEOS (Multi)Polygon from a GeoJSON geometry or Feature body."""
+        geometry = data
+        if isinstance(data, dict) and data.get('type') == 'Feature':
+            geometry = data.get('geometry')
+        if not isinstance(geometry, dict) or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+            raise ValidationError({'error': 'Body must be a GeoJSON Polygon or MultiPolygon'})
+        try:
+            polygon = GEOSGeometry(json.dumps(geometry))
+        except (GDALException, GEOSException, ValueError, TypeError):
+            raise ValidationError({'error': 'Invalid GeoJSON geometry'})
+
+        max_vertices = get_setting('WITHIN_POLYGON_MAX_VERTICES')
+        if polygon.num_coords > max_vertices:
+            raise ValidationError({'error': f'Polygon exceeds {max_vertices} vertices'})
+        min_lon, min_lat, max_lon, max_lat = polygon.extent
+        if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise ValidationError({'error': 'Polygon is out of range'})
+        if not polygon.valid:
+            raise ValidationError({'error': f'Polygon is not valid: {polygon.valid_reason}'})
+        polygon.srid = 4326
+        return polygon
+
+    @action(detail=False, methods=['post'])
+    def along_route(self, request):
+        """
+        Find locations along a route, in the order they are passed.
+        
+        Body:
+        - route: GeoJSON LineString geometry, or a Feature with one (required)
+        - distance: Corridor half-width in meters (default: 100)
+        
+        Query Parameters:
+        - fields / omit: Comma-separated properties to include / leave out
+        - page_size: Results per page (default: 100, maximum: 1000)
+        - cursor: Opaque cursor taken from the previous page's "next" link
+          (send the same body again)
+        - render: "db" to have PostgreSQL render the JSON
+        
+        Each feature's "position" is its distance along the route, in meters.
+        
+        Example: {"route": {"type": "LineString", "coordinates": [[-74.01, 40.70], [-73.99, 40.75], [-73.96, 40.78]]}, "distance": 500}
+        """
+        route = self.get_route(request.data.get('route'))
+        try:
+            distance = float(request.data.get('distance', 100))
+        except (TypeError, ValueError):
+            raise ValidationError({'error': 'Invalid parameter values'})
+        max_distance = get_setting('ALONG_ROUTE_MAX_DISTANCE')
+        if not 0 <= distance <= max_distance:
+            raise ValidationError({'error': f'distance must be between 0 and {max_distance}'})
+
+        locations = self.get_queryset().along_route(
+            route, distance,
+            segment_length=get_setting('ALONG_ROUTE_SEGMENT_LENGTH'),
+            max_vertices=get_setting('ALONG_ROUTE_SUBDIVIDE_VERTICES'),
+        )
+
+        paginator = RoutePagination()
+        if self.renders_columns():
+            return self.get_columnar_page(locations, paginator)
+        if self.render_in_database():
+            return self.get_db_rendered_page(locations, paginator)
+        page = paginator.paginate_queryset(locations, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_route(self, data):
+        """Validated GEOS LineString from a GeoJSON geometry or Feature."""
+        geometry = data
+        if isinstance(data, dict) and data.get('type') == 'Feature':
+            geometry = data.get('geometry')
+        if not isinstance(geometry, dict) or geometry.get('type') != 'LineString':
+            raise ValidationError({'error': 'route must be a GeoJSON LineString'})
+        try:
+            route = GEOSGeometry(json.dumps(geometry))
+        except (GDALException, GEOSException, ValueError, TypeError):
+            raise ValidationError({'error': 'Invalid GeoJSON geometry'})
+
+        max_vertices = get_setting('ALONG_ROUTE_MAX_VERTICES')
+        if route.num_coords > max_vertices:
+            raise ValidationError({'error': f'route exceeds {max_vertices} vertices'})
+        min_lon, min_lat, max_lon, max_lat = route.extent
+        if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise ValidationError({'error': 'route is out of range'})
+        route.srid = 4326
+        return route
+
+    @action(detail=False, methods=['post'])
+    def nearby_batch(self, request):
+        """
+        Find the nearest locations to many points in one query.
+        
+        Body:
+        - points: List of {"lat": ..., "lon": ..., "k": ..., "distance": ...};
+          k defaults to 10, distance (metres) is optional
+        
+        Query Parameters:
+        - fields / omit: Comma-separated properties to include / leave out
+        
+        Results are keyed by the index of each point in the request, nearest
+        first; points with no location in range map to an empty list.
+        
+        Example: {"points": [{"lat": 40.7128, "lon": -74.0060, "k": 5}, {"lat": 34.05, "lon": -118.24, "distance": 2000}]}
+        """
+        queries = self.get_batch_queries(request.data.get('points'))
+        fields = self.get_sparse_fields()
+        serializer_class = self.get_serializer_class()
+        if fields is None:
+            columns = [field.name for field in Location._meta.concrete_fields if not field.generated]
+        else:
+            columns = serializer_class.columns_for(fields)
+
+        locations = nearest_batch(queries, columns)
+        features = self.get_serializer(locations, many=True).data['features']
+        results = {str(index): [] for index in range(len(queries))}
+        for location, feature in zip(locations, features):
+            results[str(location.query_index)].append(feature)
+        return Response({'results': results})
+
+    def get_batch_queries(self, points):
+        """(lon, lat, k, radius) for each point of a nearby_batch body."""
+        max_points = get_setting('NEARBY_BATCH_MAX_POINTS')
+        if not isinstance(points, list) or not points:
+            raise ValidationError({'error': 'points must be a non-empty list'})
+        if len(points) > max_points:
+            raise ValidationError({'error': f'At most {max_points} points per request'})
+
+        max_k = get_setting('NEARBY_MAX_K')
+        queries = []
+        for index, point in enumerate(points):
+            if not isinstance(point, dict) or 'lat' not in point or 'lon' not in point:
+                raise ValidationError({'error': f'points[{index}]: lat and lon are required'})
+            try:
+                lat = float(point['lat'])
+                lon = float(point['lon'])
+                k = int(point.get('k', get_setting('NEARBY_BATCH_DEFAULT_K')))
+                radius = point.get('distance')
+                radius = None if radius is None else float(radius)
+            except (TypeError, ValueError):
+                raise ValidationError({'error': f'points[{index}]: Invalid parameter values'})
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValidationError({'error': f'points[{index}]: Coordinates are out of range'})
+            if not 1 <= k <= max_k:
+                raise ValidationError({'error': f'points[{index}]: k must be between 1 and {max_k}'})
+            if radius is not None and radius < 0:
+                raise ValidationError({'error': f'points[{index}]: distance must not be negative'})
+            queries.append((lon, lat, k, radius))
+
+        max_results = get_setting('NEARBY_BATCH_MAX_RESULTS')
+        if sum(k for _, _, k, _ in queries) > max_results:
+            raise ValidationError({'error': f'The sum of k over all points must not exceed {max_results}'})
+        return queries
+
+    @action(detail=False, methods=['post'])
+    def distance_matrix(self, request):
+        """
+        Geodesic distances, in metres, from every origin to every destination.
+        
+        Body:
+        - origins, destinations: Lists of location ids and/or {"lat": ..., "lon": ...}
+        
+        Returns {"distances": [[...], ...]} with one row per origin. Small
+        matrices are computed by PostGIS; larger ones are streamed row by row.
+        
+        Example: {"origins": [1, 2], "destinations": [3, {"lat": 40.7128, "lon": -74.0060}]}
+        """
+        origins = request.data.get('origins')
+        destinations = request.data.get('destinations')
+        for name, points in (('origins', origins), ('destinations', destinations)):
+            if not isinstance(points, list) or not points:
+                raise ValidationError({'error': f'{name} must be a non-empty list'})
+        max_cells = get_setting('DISTANCE_MATRIX_MAX_CELLS')
+        if len(origins) * len(destinations) > max_cells:
+            raise ValidationError({'error': f'The matrix must not exceed {max_cells} cells'})
+
+        origins, destinations = self.get_matrix_points(origins, destinations)
+        if is_small(origins, destinations):
+            return Response({'distances': sql_rows(origins, destinations)})
+
+        def content():
+            yield '{"distances":['
+            separator = ''
+            for row in matrix_rows(origins, destinations):
+                yield separator + json.dumps(row)
+                separator = ','
+            yield ']}'
+
+        return StreamingHttpResponse(content(), content_type='application/json')
+
+    def get_matrix_points(self, *point_lists):
+        """
+        (lon, lat) pairs for lists of location ids and/or lat/lon objects,
+        resolving every id with one query.
+        """
+        ids = {
+            value for points in point_lists for value in points
+            if isinstance(value, int) and not isinstance(value, bool)
+        }
+        found = {
+            pk: (point.x, point.y)
+            for pk, point in Location.objects.filter(pk__in=ids).values_list('pk', 'point')
+        }
+        missing = sorted(ids - set(found))
+        if missing:
+            raise ValidationError({'error': f'Unknown location ids: {", ".join(map(str, missing))}'})
+
+        resolved = []
+        for points in point_lists:
+            pairs = []
+            for value in points:
+                if isinstance(value, int) and not isinstance(value, bool):
+                    pairs.append(found[value])
+                    continue
+                try:
+                    lat = float(value['lat'])
+                    lon = float(value['lon'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValidationError(
+                        {'error': 'Points must be location ids or objects with lat and lon'}
+                    )
+                if not (math.isfinite(lat) and math.isfinite(lon)
+                        and -90 <= lat <= 90 and -180 <= lon <= 180):
+                    raise ValidationError({'error': 'Coordinates are out of range'})
+                pairs.append((lon, lat))
+            resolved.append(pairs)
+        return resolved
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Autocomplete location names, tolerating typos and partial words.
+        
+        Query Parameters:
+        - q: Text typed so far (required)
+        - limit: Suggestions to return (default: 10, maximum: 50)
+        - lat / lon: Optional point; nearby matches are ranked higher
+        
+        Names are matched by trigram word similarity, so "empir stat" finds
+        "Empire State Building". Each suggestion has id, name, address,
+        latitude, longitude and similarity (0 to 1), plus distance in metres
+        when lat/lon are given.
+        
+        Example: /api/locations/suggest/?q=centr&lat=40.7128&lon=-74.0060
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {'error': 'The q parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        lat = request.query_params.get('lat')
+        lon = request.query_params.get('lon')
+        if (lat is None) != (lon is None):
+            return Response(
+                {'error': 'lat and lon must be given together'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', get_setting('SUGGEST_LIMIT')))
+            point = None if lat is None else Point(float(lon), float(lat), srid=4326)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid parameter values'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_limit = get_setting('SUGGEST_MAX_LIMIT')
+        if not 1 <= limit <= max_limit:
+            return Response(
+                {'error': f'limit must be between 1 and {max_limit}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if point is not None and not (-90 <= point.y <= 90 and -180 <= point.x <= 180):
+            return Response(
+                {'error': 'Coordinates are out of range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(text) < get_setting('SUGGEST_MIN_LENGTH'):
+            return Response({'results': []})
+
+        # The trigram index hands back matches best first and the LIMIT ends
+        # the scan; distances are only computed for the rows it returns.
+        matches = Location.objects.similar_names(text)
+        if point is not None:
+            matches = matches.annotate_distance(point)
+            limit_candidates = max(limit, get_setting('SUGGEST_CANDIDATES'))
+        else:
+            limit_candidates = limit
+        fields = ['id', 'name', 'address', 'name_distance'] + (['distance'] if point else [])
+        rows = list(
+            matches.values(*fields, longitude=point_x(), latitude=point_y())[:limit_candidates]
+        )
+
+        if point is not None:
+            weight = get_setting('SUGGEST_DISTANCE_WEIGHT')
+            scale = get_setting('SUGGEST_DISTANCE_SCALE')
+            for row in rows:
+                row['distance'] = round(row['distance'].m, 1)
+                row['score'] = row['name_distance'] + weight * row['distance'] / (row['distance'] + scale)
+            rows.sort(key=lambda row: (row['score'], row['id']))
+            rows = rows[:limit]
+
+        results = []
+        for row in rows:
+            suggestion = {
+                'id': row['id'],
+                'name': row['name'],
+                'address': row['address'],
+                'latitude': row['latitude'],
+                'longitude': row['longitude'],
+                'similarity': round(1 - row['name_distance'], 4),
+            }
+            if point is not None:
+                suggestion['distance'] = row['distance']
+            results.append(suggestion)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def cells(self, request):
+        """
+        Count locations per geohash cell.
+        
+        Query Parameters:
+        - precision: Geohash length to group by, 4, 6 or 8 (default: 6)
+        - cell: Only count inside this geohash cell (up to precision characters)
+        
+        Each result has the cell, its count and the latitude/longitude of its
+        centre, in cell order. Counts are read from the geohash B-tree index,
+        without spatial predicates.
+        
+        Example: /api/locations/cells/?precision=6&cell=dr5r
+        """
+        try:
+            precision = int(request.query_params.get('precision', 6))
+        except ValueError:
+            return Response(
+                {'error': 'Invalid parameter values'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if precision not in GEOHASH_PRECISIONS:
+            return Response(
+                {'error': f'precision must be one of {", ".join(map(str, GEOHASH_PRECISIONS))}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = Location.objects.all()
+        cell = request.query_params.get('cell')
+        if cell is not None:
+            cell = cell.strip().lower()
+            if not GEOHASH_RE.match(cell) or len(cell) > precision:
+                return Response(
+                    {'error': f'cell must be a geohash of at most {precision} characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.in_cell(cell)
+
+        limit = get_setting('CELLS_MAX_RESULTS')
+        rows = list(queryset.cell_counts(precision)[:limit + 1])
+        return Response({
+            'precision': precision,
+            'cells': rows[:limit],
+            'truncated': len(rows) > limit,
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every location as a GeoJSON FeatureCollection.
+        
+        Rows are read in keyset chunks of EXPORT_CHUNK_SIZE, so memory use
+        stays flat however large the table is. Pass ?render=db to have
+        PostgreSQL render each feature.
+        
+        Example: /api/locations/export/
+        """
+        queryset = Location.objects.all()
+        chunk_size = get_setting('EXPORT_CHUNK_SIZE')
+        if self.render_in_database():
+            rows = queryset.annotate(
+                rendered_json=self.get_json_expression()
+            ).values_list('id', 'rendered_json', named=True)
+            content = stream_feature_collection(rows, attrgetter('rendered_json'), chunk_size)
+        else:
+            fields = self.get_sparse_fields() or self.get_serializer_class().selectable_fields()
+            content = stream_feature_collection(
+                feature_rows(queryset, fields),
+                lambda row: dumps(feature_dict(row, fields)),
+                chunk_size,
+            )
+        response = StreamingHttpResponse(content, content_type='application/geo+json')
+        response['Content-Disposition'] = 'attachment; filename="locations.geojson"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many locations in one request.
+        
+        The body is a GeoJSON FeatureCollection (application/json or
+        application/geo+json) or one Feature per line (application/x-ndjson).
+        Each feature is validated as it is read; valid rows are upserted on
+        their natural key (see the NATURAL_KEY setting) in batches of
+        BULK_BATCH_SIZE inside one transaction, and invalid rows are reported
+        by their position in the input without stopping the rest.
+        
+        Example: POST /api/locations/bulk/ (Content-Type: application/x-ndjson)
+        """
+        data = request.data
+        if isinstance(data, dict):
+            if data.get('type') != 'FeatureCollection' or not isinstance(data.get('features'), list):
+                return Response(
+                    {'error': 'Expected a GeoJSON FeatureCollection'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            features = data['features']
+        else:
+            features = data
+
+        result = ingest_features(
+            features,
+            serializer_class=self.get_serializer_class(),
+            serializer_context=self.get_serializer_context(),
+        )
+        if result.inserted:
+            response_status = status.HTTP_201_CREATED
+        elif result.error_count and not (result.updated or result.unchanged):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response(result.as_dict(), status=response_status)
+
+    def get_bulk_ids(self, ids):
+        if not isinstance(ids, list) or not ids:
+            raise ValidationError({'error': 'ids must be a non-empty list of location ids'})
+        max_ids = get_setting('BULK_MAX_IDS')
+        if len(ids) > max_ids:
+            raise ValidationError({'error': f'At most {max_ids} ids per request'})
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValidationError({'error': 'ids must be integers'})
+        return ids
+
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """
+        Apply the same partial update to many locations in one UPDATE.
+        
+        Body:
+        - ids: Location ids to update (required)
+        - properties: Fields to change, as for PATCH (optional)
+        - geometry: New GeoJSON Point (optional)
+        
+        updated_at is set on every matched row, as a save() would.
+        
+        Example: {"ids": [1, 2], "properties": {"address": "Closed"}}
+        """
+        ids = self.get_bulk_ids(request.data.get('ids'))
+        properties = request.data.get('properties') or {}
+        geometry = request.data.get('geometry')
+        if not isinstance(properties, dict):
+            raise ValidationError({'error': 'properties must be an object'})
+
+        data = dict(properties)
+        if geometry is not None:
+            data['point'] = geometry
+        serializer = self.get_serializer(data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        if not serializer.validated_data:
+            raise ValidationError({'error': 'Nothing to update'})
+
+        try:
+            updated = bulk_update_locations(
+                Location.objects.filter(pk__in=ids), serializer.validated_data
+            )
+        except NaturalKeyConflict as exc:
+            raise ValidationError({
+                'error': 'The update would give these locations duplicate natural keys: '
+                         + ', '.join(map(str, exc.ids))
+            })
+        return Response({'updated': updated, 'not_found': len(set(ids)) - updated})
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        Delete many locations in one DELETE statement.
+        
+        Body (at least one filter; filters are combined):
+        - ids: Location ids
+        - bbox: [min_lon, min_lat, max_lon, max_lat]
+        - near: {"lat": ..., "lon": ..., "distance": metres}
+        - created_before, created_after, updated_before, updated_after:
+          ISO 8601 timestamps
+        
+        Example: {"bbox": [-74.1, 40.6, -73.9, 40.8], "created_before": "2024-01-01T00:00:00Z"}
+        """
+        data = request.data
+        locations = Location.objects.all()
+        filtered = False
+
+        if 'ids' in data:
+            locations = locations.filter(pk__in=self.get_bulk_ids(data['ids']))
+            filtered = True
+
+        if 'bbox' in data:
+            try:
+                min_lon, min_lat, max_lon, max_lat = (float(value) for value in data['bbox'])
+            except (TypeError, ValueError):
+                raise ValidationError({'error': 'bbox must be [min_lon, min_lat, max_lon, max_lat]'})
+            locations = locations.within_bbox(min_lon, min_lat, max_lon, max_lat)
+            filtered = True
+
+        if 'near' in data:
+            try:
+                near = data['near']
+                point = Point(float(near['lon']), float(near['lat']), srid=4326)
+                distance = float(near['distance'])
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError({'error': 'near must be {"lat": ..., "lon": ..., "distance": ...}'})
+            locations = locations.within_distance(point, distance)
+            filtered = True
+
+        for name, lookup in (('created_before', 'created_at__lt'),
+                             ('created_after', 'created_at__gte'),
+                             ('updated_before', 'updated_at__lt'),
+                             ('updated_after', 'updated_at__gte')):
+            if name not in data:
+                continue
+            try:
+                moment = parse_datetime(str(data[name]))
+            except ValueError:
+                moment = None
+            if moment is None:
+                raise ValidationError({'error': f'{name} must be an ISO 8601 timestamp'})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment, datetime.timezone.utc)
+            locations = locations.filter(**{lookup: moment})
+            filtered = True
+
+        if not filtered:
+            raise ValidationError({'error': 'At least one filter is required'})
+
+        return Response({'deleted': bulk_delete_locations(locations)})
+
+class LocationTileView(View):
+    """
+    Mapbox Vector Tile of locations, rendered in PostGIS and kept in the
+    tile cache until a location it covers changes.
+    
+    Example: /api/locations/tiles/10/301/385.pbf
+    """
+
+    def get(self, request, z, x, y):
+        if not tile_in_range(z, x, y):
+            raise Http404('Tile out of range')
+        return HttpResponse(get_tile(z, x, y), content_type=MVT_CONTENT_TYPE)
+
+
+class LocationTileCacheStatsView(View):
+    """
+    Tile cache hit ratio, overall and per zoom level, as counted in the
+    TILE_STATS_CACHE: for the answering worker process alone unless that
+    cache is shared between processes.
+    
+    Example: /api/locations/tiles/stats/
+    """
+
+    def get(self, request):
+        return JsonResponse(tile_cache_stats())
\ No newline at end of file